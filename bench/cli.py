@@ -0,0 +1,37 @@
+"""CLI 매크로(srt_macro.main / ktx_macro.main)를 대역 서버에 붙여 실행한다.
+
+설정은 평소처럼 환경변수로 받고, BENCH_STANDIN에 대역 서버 주소를 준다.
+
+    BENCH_STANDIN=http://127.0.0.1:8765 DEP_DATE=20261101 python -m bench.cli srt
+"""
+import os
+import sys
+
+import requests
+
+from bench.standin import patch_clients
+
+
+def main():
+    train = sys.argv[1] if len(sys.argv) > 1 else "srt"
+    base_url = os.environ["BENCH_STANDIN"]
+    patch_clients(base_url)
+
+    import config
+    if train == "srt":
+        import srt_macro as macro
+    else:
+        import ktx_macro as macro
+
+    def send_telegram(message: str):
+        # notify.send_telegram과 같은 요청을 대역 서버의 Bot API로
+        requests.post(f"{base_url}/tg/bot{config.TELEGRAM_BOT_TOKEN}/sendMessage",
+                      json={"chat_id": config.TELEGRAM_CHAT_ID, "text": message, "parse_mode": "HTML"},
+                      timeout=10)
+
+    macro.send_telegram = send_telegram
+    macro.main()
+
+
+if __name__ == "__main__":
+    main()
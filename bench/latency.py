@@ -0,0 +1,269 @@
+"""잔여석 발생 → 예약 확정 → 알림 지연 벤치마크 (대역 서버 사용, 운영 서버 호출 없음).
+
+매크로마다 서로 다른 출발일의 07:00 열차를 하나씩 맡기고, 모든 매크로가 첫 조회를 마친 뒤
+--spread초 안의 무작위 시각에 좌석을 하나씩 푼다. 대역 서버가 기록한 시각으로 구간별
+p50/p99를 낸다.
+
+    python -m bench.latency                                  # bot, srt, ktx × 1, 10, 100
+    python -m bench.latency --runners bot --concurrency 10 --pay --json out.json
+
+구간
+    detect   좌석 풀림 → 그 열차가 조회 응답에 처음 실린 시각 (조회 간격의 영향)
+    book     조회 응답 → 예약 요청 도착 (핫패스: 필터·예약 호출)
+    reserve  좌석 풀림 → 예약 확정
+    pay      좌석 풀림 → 결제 요청 도착 (--pay, bot만)
+    notify   좌석 풀림 → 예약번호가 담긴 텔레그램 메시지 도착
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from bench.standin import StandIn, patch_clients, telegram_url
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROUTES = {"srt": ("수서", "부산"), "ktx": ("서울", "부산")}
+TARGET_TIME = "070000"  # 오전 06~09 시간대 안
+PHASES = ["detect", "book", "reserve", "pay", "notify"]
+
+_ENV = {
+    "TELEGRAM_BOT_TOKEN": "bench:token",
+    "TELEGRAM_CHAT_ID": "1",
+    "SRT_ID": "bench",
+    "SRT_PW": "bench",
+    "KORAIL_ID": "bench",
+    "KORAIL_PW": "bench",
+    "SESSION_DIR": "",
+    "HISTORY_DIR": "",
+    "MAX_ATTEMPTS": "100000",
+    "TENANT_KEY": "AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA=",  # 키 파일을 만들지 않게
+    "MACRO_DB": os.path.join(tempfile.gettempdir(), f"bench-{os.getpid()}.db"),  # 작업 폴더에 macros.db를 만들지 않게
+}
+_CARD = {"CARD_NUMBER": "1234567890123456", "CARD_PASSWORD": "12", "CARD_EXPIRE": "2912", "CARD_BIRTH": "900101"}
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered) + 0.5) - 1))]
+
+
+# 단계마다 새 출발일을 써서 이전 단계의 조회 공유(SearchHub)·예약과 섞이지 않게
+_DAYS = itertools.count(2)
+
+
+def _dates(n: int) -> list[str]:
+    today = datetime.now()
+    return [(today + timedelta(days=next(_DAYS))).strftime("%Y%m%d") for _ in range(n)]
+
+
+def _wait_first_search(standin: StandIn, provider: str, dates: list[str], timeout: float) -> bool:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if all(standin.searches[provider, d] for d in dates):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def _release_all(standin: StandIn, provider: str, dates: list[str], spread: float) -> list[dict]:
+    dep, arr = ROUTES[provider]
+    script = [{"at": random.uniform(0, spread), "train": provider, "dep": dep, "arr": arr,
+               "date": d, "time": TARGET_TIME} for d in dates]
+    standin.run_script(script)
+    return script
+
+
+def _wait_done(standin: StandIn, provider: str, dates: list[str], key: str, timeout: float):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        done = [e for (p, d, _), e in list(standin.events.items()) if p == provider and d in dates and key in e]
+        if len(done) >= len(dates):
+            return
+        time.sleep(0.05)
+
+
+# ════════════════════════════ 실행기 ════════════════════════════
+
+
+async def _bot_suite(standin: StandIn, provider: str, levels: list[int], args) -> list[dict]:
+    """bot 모듈의 전역 객체(엔진·세션 풀·발송 큐)는 이벤트 루프 하나에서만 쓸 수 있어 단계를 한 루프에서 돈다"""
+    import bot
+    from pacing import PollController
+    from telegram import Bot
+
+    # 조회 간격을 고정해 지연이 예산 배분이 아니라 핫패스를 반영하도록
+    bot.pacing = PollController(1e9, args.interval, args.interval)
+    bot.sessions.governor = None
+    bot.has_card = (lambda chat_id: True) if args.pay else (lambda chat_id: False)
+    tg = Bot(_ENV["TELEGRAM_BOT_TOKEN"], base_url=telegram_url(standin.url))
+    await tg.initialize()
+    bot.outbox.start(tg)
+    results = []
+    try:
+        for n in levels:
+            standin.reset()
+            dates = _dates(n)
+            await _run_bot(bot, standin, provider, dates, args)
+            results.append(summarize("bot", n, standin, provider, dates))
+            _print(results[-1])
+    finally:
+        await bot.payments.stop()
+        await bot.outbox.stop()
+        await bot.engine.shutdown()
+        await tg.shutdown()
+    return results
+
+
+async def _run_bot(bot, standin: StandIn, provider: str, dates: list[str], args):
+    keys = []
+    for i, date in enumerate(dates):
+        dep, arr = ROUTES[provider]
+        ud = {"train": provider, "dep": dep, "arr": arr, "date_go": date,
+              "times_go": ["060000"], "pax": 1, "seat": "all"}
+        state = bot._build_state(ud, "go", 1)
+        state["key"] = f"bench{i}"
+        bot.macros[state["key"]] = state
+        bot.engine.start(state["key"], bot.run_macro(1, state))
+        keys.append(state["key"])
+
+    loop = asyncio.get_running_loop()
+    if not await loop.run_in_executor(None, _wait_first_search, standin, provider, dates, args.timeout):
+        logging.warning("첫 조회를 마치지 못한 매크로가 있음")
+    _release_all(standin, provider, dates, args.spread)
+    await loop.run_in_executor(None, _wait_done, standin, provider, dates, "notified", args.spread + args.timeout)
+
+    for key in keys:
+        bot.stop_macro(key)
+    while bot.engine.active_count():
+        await asyncio.sleep(0.05)
+
+
+def _run_cli(standin: StandIn, provider: str, dates: list[str], args) -> None:
+    dep, arr = ROUTES[provider]
+    interval = str(max(1, round(args.interval)))
+    procs = []
+    for date in dates:
+        env = dict(os.environ, **_ENV, BENCH_STANDIN=standin.url, DEP_STATION=dep, ARR_STATION=arr,
+                   DEP_DATE=date, DEP_TIMES="060000", REFRESH_INTERVAL_MIN=interval, REFRESH_INTERVAL_MAX=interval)
+        procs.append(subprocess.Popen([sys.executable, "-m", "bench.cli", provider], cwd=ROOT, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    try:
+        if not _wait_first_search(standin, provider, dates, args.timeout + len(dates) * 0.2):
+            logging.warning("첫 조회를 마치지 못한 매크로가 있음")
+        _release_all(standin, provider, dates, args.spread)
+        _wait_done(standin, provider, dates, "notified", args.spread + args.timeout)
+    finally:
+        for p in procs:
+            if p.poll() is None:
+                p.kill()
+            p.wait()
+
+
+# ════════════════════════════ 집계 ════════════════════════════
+
+
+def _phases(event: dict) -> dict:
+    released = event.get("released")
+    seen, reserved = event.get("seen"), event.get("reserved")
+    out = {}
+    if released is not None and seen is not None:
+        out["detect"] = seen - released
+    if seen is not None and reserved is not None:
+        out["book"] = reserved - seen
+    for phase, mark in (("reserve", "reserved"), ("pay", "paid"), ("notify", "notified")):
+        if released is not None and event.get(mark) is not None:
+            out[phase] = event[mark] - released
+    return out
+
+
+def summarize(runner: str, n: int, standin: StandIn, provider: str, dates: list[str]) -> dict:
+    samples = {phase: [] for phase in PHASES}
+    booked = 0
+    for (p, d, _), event in standin.events.items():
+        if p != provider or d not in dates or "released" not in event:
+            continue
+        phases = _phases(event)
+        booked += "reserve" in phases
+        for phase, value in phases.items():
+            samples[phase].append(value * 1000)
+    return {
+        "runner": runner,
+        "concurrency": n,
+        "booked": booked,
+        "requests": standin.requests,
+        "ms": {phase: {"p50": percentile(v, 0.5), "p99": percentile(v, 0.99)}
+               for phase, v in samples.items() if v},
+    }
+
+
+def _print(result: dict):
+    out = sys.__stdout__
+    cells = []
+    for phase in PHASES:
+        m = result["ms"].get(phase)
+        cells.append(f"{m['p50']:8.1f} {m['p99']:8.1f}" if m else f"{'-':>8} {'-':>8}")
+    print(f"{result['runner']:<6} {result['concurrency']:>5} {result['booked']:>4}/{result['concurrency']:<4}"
+          f" {result['requests']:>7}  " + "  ".join(cells), file=out, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="좌석 발생 → 예약 → 알림 지연 벤치마크 (로컬 대역 서버)")
+    parser.add_argument("--runners", default="bot,srt,ktx", help="bot, srt(srt_macro), ktx(ktx_macro)")
+    parser.add_argument("--concurrency", default="1,10,100")
+    parser.add_argument("--bot-train", choices=["srt", "ktx"], default="srt", help="bot 실행기가 쓸 열차")
+    parser.add_argument("--interval", type=float, default=1.0, help="조회 간격(초). CLI는 정수로 반올림")
+    parser.add_argument("--spread", type=float, default=5.0, help="좌석을 푸는 시각의 분산 범위(초)")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--pay", action="store_true", help="bot 실행기에서 카드 자동결제까지 측정")
+    parser.add_argument("--json", help="결과를 JSON으로 저장할 경로")
+    args = parser.parse_args()
+
+    db = _ENV["MACRO_DB"]
+    os.environ.update(_ENV, **(_CARD if args.pay else {}))
+    logging.basicConfig(format="%(asctime)s - %(levelname)s - %(message)s", level=logging.WARNING)
+
+    standin = StandIn().start()
+    patch_clients(standin.url)
+    runners = args.runners.split(",")
+    levels = [int(n) for n in args.concurrency.split(",")]
+
+    phase_head = "  ".join(f"{p + ' p50':>8} {'p99':>8}" for p in PHASES)
+    print(f"대역 서버 {standin.url} | 조회 간격 {args.interval}s | 단위 ms\n")
+    print(f"{'runner':<6} {'n':>5} {'booked':>9} {'reqs':>7}  {phase_head}")
+    results = []
+    try:
+        for runner in runners:
+            if runner == "bot":
+                # korail2 reserve()가 print하는 열차 정보 등 실행기 출력은 버림
+                with contextlib.redirect_stdout(io.StringIO()):
+                    results += asyncio.run(_bot_suite(standin, args.bot_train, levels, args))
+                continue
+            for n in levels:
+                standin.reset()
+                dates = _dates(n)
+                _run_cli(standin, runner, dates, args)
+                results.append(summarize(runner, n, standin, runner, dates))
+                _print(results[-1])
+    finally:
+        standin.stop()
+        for suffix in ("", "-wal", "-shm"):
+            with contextlib.suppress(OSError):
+                os.remove(db + suffix)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,423 @@
+"""SRT/코레일/텔레그램 로컬 대역 서버.
+
+SRTrain·korail2 클라이언트가 그대로 동작할 만큼만 각 API를 흉내 낸다. 모든 열차는
+매진 상태로 시작하고, release()(또는 --script 파일)로 지정한 열차에 좌석을 풀어
+잔여석 발생 → 조회 → 예약 → 결제 → 알림 경로를 운영 서버 없이 재현한다.
+각 단계의 도착 시각은 서버 쪽 time.perf_counter()로 기록한다.
+
+    python -m bench.standin --port 8765 --script releases.json
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+SRT_HOST = "https://app.srail.or.kr:443"
+KORAIL_HOST = "https://smart.letskorail.com:443"
+
+# 시간표: 05:00부터 23:30까지 30분 간격, 소요 2시간 30분
+_DEPARTURES = [f"{h:02d}{m:02d}00" for h in range(5, 24) for m in (0, 30)]
+_PAGE = 10  # 조회 1회가 돌려주는 열차 수 (두 API 모두 실제와 비슷하게 페이지 단위)
+
+
+def _arrival(dep_time: str) -> str:
+    minutes = int(dep_time[:2]) * 60 + int(dep_time[2:4]) + 150
+    return f"{minutes // 60 % 24:02d}{minutes % 60:02d}00"
+
+
+def _station_code(name: str) -> str:
+    return str(int(hashlib.md5(name.encode()).hexdigest()[:6], 16) % 10000).zfill(4)
+
+
+class _Train:
+    __slots__ = ("provider", "no", "dep", "arr", "date", "dep_time", "general", "special")
+
+    def __init__(self, provider, no, dep, arr, date, dep_time):
+        self.provider, self.no = provider, no
+        self.dep, self.arr, self.date, self.dep_time = dep, arr, date, dep_time
+        self.general = self.special = 0
+
+
+class StandIn:
+    """대역 서버의 상태(열차 재고, 예약, 단계별 시각)와 HTTP 서버."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self._lock = threading.Lock()
+        self._trains: dict[tuple, list[_Train]] = {}
+        self._pnr = itertools.count(100000)
+        self._reservations: dict[str, list[dict]] = {}   # 세션 → 예약
+        self._sessions = itertools.count(1)
+        self._messages = itertools.count(1)
+        self.events: dict[tuple, dict] = {}              # (provider, date, 열차번호) → 단계별 시각
+        self._pnr_event: dict[str, tuple] = {}
+        self.searches: Counter = Counter()              # (provider, date) → 조회 횟수
+        self.requests = 0
+
+        standin = self
+
+        class Handler(_Handler):
+            state = standin
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="standin", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self):
+        with self._lock:
+            self._trains.clear()
+            self._reservations.clear()
+            self.events.clear()
+            self._pnr_event.clear()
+            self.searches.clear()
+            self.requests = 0
+
+    # ── 재고 ──
+
+    def _timetable(self, provider: str, dep: str, arr: str, date: str) -> list[_Train]:
+        key = (provider, dep, arr, date)
+        trains = self._trains.get(key)
+        if trains is None:
+            base = 300 if provider == "srt" else 100
+            trains = self._trains[key] = [
+                _Train(provider, f"{base + i * 2:05d}", dep, arr, date, t) for i, t in enumerate(_DEPARTURES)]
+        return trains
+
+    def release(self, provider: str, dep: str, arr: str, date: str, dep_time: str,
+                general: int = 1, special: int = 0) -> str:
+        """열차 하나에 좌석을 푼다. 반환: 열차번호"""
+        with self._lock:
+            train = next(t for t in self._timetable(provider, dep, arr, date) if t.dep_time == dep_time)
+            train.general += general
+            train.special += special
+            self.events.setdefault((provider, date, train.no), {})["released"] = time.perf_counter()
+            return train.no
+
+    def run_script(self, events: list[dict]) -> threading.Thread:
+        """[{"at": 초, "train": "srt", "dep", "arr", "date", "time", "general", "special"}, ...]"""
+        def play():
+            t0 = time.perf_counter()
+            for ev in sorted(events, key=lambda e: e["at"]):
+                delay = t0 + ev["at"] - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                no = self.release(ev["train"], ev["dep"], ev["arr"], ev["date"], ev["time"],
+                                  ev.get("general", 1), ev.get("special", 0))
+                logger.info(f"좌석 풀림: {ev['train']} {no} {ev['date']} {ev['time']}")
+
+        thread = threading.Thread(target=play, name="standin-script", daemon=True)
+        thread.start()
+        return thread
+
+    def _seen(self, provider: str, date: str, trains: list[_Train]):
+        now = time.perf_counter()
+        self.searches[provider, date] += 1
+        for t in trains:
+            if t.general or t.special:
+                self.events.setdefault((t.provider, t.date, t.no), {}).setdefault("seen", now)
+
+    def _reserve(self, session: str, provider: str, date: str, no: str, special: bool, count: int) -> str | None:
+        with self._lock:
+            train = next((t for (p, _, _, d), ts in self._trains.items() if p == provider and d == date
+                          for t in ts if t.no == no), None)
+            if train is None:
+                return None
+            field = "special" if special else "general"
+            if getattr(train, field) < count:
+                return None
+            setattr(train, field, getattr(train, field) - count)
+            pnr = str(next(self._pnr))
+            self._reservations.setdefault(session, []).append(
+                {"pnr": pnr, "train": train, "count": count, "special": special, "paid": False})
+            key = (provider, date, no)
+            self.events.setdefault(key, {}).setdefault("reserved", time.perf_counter())
+            self._pnr_event[pnr] = key
+            return pnr
+
+    def _paid(self, pnr: str):
+        key = self._pnr_event.get(pnr)
+        if key is not None:
+            self.events[key].setdefault("paid", time.perf_counter())
+
+    def _notified(self, text: str):
+        now = time.perf_counter()
+        for pnr in re.findall(r"\b\d{6}\b", text):
+            key = self._pnr_event.get(pnr)
+            if key is not None:
+                self.events[key].setdefault("notified", now)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive — 클라이언트 커넥션 풀 재사용
+    state: StandIn
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch()
+
+    def do_POST(self):
+        self._dispatch()
+
+    def _dispatch(self):
+        parts = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        params = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        if body:
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                params.update(json.loads(body))
+            else:
+                params.update({k: v[0] for k, v in parse_qs(body.decode()).items()})
+        self.state.requests += 1
+        path = parts.path
+        try:
+            if path.startswith("/srt/"):
+                self._srt(path[4:], params)
+            elif path.startswith("/korail/"):
+                self._korail(path[7:], params)
+            elif path.startswith("/netfunnel/"):
+                self._netfunnel(params)
+            elif path.startswith("/tg/"):
+                self._telegram(path.rsplit("/", 1)[-1], params)
+            else:
+                self._reply({"error": "not found"}, status=404)
+        except Exception:
+            logger.exception(f"대역 서버 처리 실패: {path}")
+            self._reply({"error": "internal"}, status=500)
+
+    def _reply(self, payload, status: int = 200, cookie: str | None = None, text: bool = False):
+        data = (payload if text else json.dumps(payload, ensure_ascii=False)).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain" if text else "application/json;charset=UTF-8")
+        self.send_header("Content-Length", str(len(data)))
+        if cookie:
+            self.send_header("Set-Cookie", f"JSESSIONID={cookie}; Path=/")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _session(self) -> str:
+        match = re.search(r"JSESSIONID=([^;]+)", self.headers.get("Cookie", ""))
+        return match.group(1) if match else "anonymous"
+
+    # ── SRT ──
+
+    def _srt(self, path: str, p: dict):
+        ok = {"strResult": "SUCC", "msgCd": "S000", "msgTxt": "정상 처리되었습니다."}
+        state = self.state
+        if path.startswith("/apb/"):  # 로그인
+            sid = f"srt{next(state._sessions)}"
+            return self._reply({"userMap": {"MB_CRD_NO": "1234567890", "CUST_NM": "벤치"}}, cookie=sid)
+        if path.startswith("/ara/"):  # 열차 조회
+            from SRT.constants import STATION_NAME
+            dep, arr = STATION_NAME[p["dptRsStnCd"]], STATION_NAME[p["arvRsStnCd"]]
+            with state._lock:
+                trains = [t for t in state._timetable("srt", dep, arr, p["dptDt"]) if t.dep_time >= p["dptTm"]][:_PAGE]
+                state._seen("srt", p["dptDt"], trains)
+                rows = [_srt_train(t, p["dptRsStnCd"], p["arvRsStnCd"]) for t in trains]
+            if not rows:
+                return self._reply({"resultMap": [{"strResult": "FAIL", "msgCd": "WRG000000",
+                                                   "msgTxt": "조회 결과가 없습니다."}]})
+            return self._reply({"resultMap": [ok], "outDataSets": {"dsOutput1": rows}})
+        if path.startswith("/arc/"):  # 예약
+            pnr = state._reserve(self._session(), "srt", p["dptDt1"], p["trnNo1"],
+                                 p.get("psrmClCd1") == "2", int(p.get("psgInfoPerPrnb1", 1)))
+            if pnr is None:
+                return self._reply({"resultMap": [{"strResult": "FAIL", "msgCd": "ERR000000",
+                                                   "msgTxt": "잔여석없음"}]})
+            return self._reply({"resultMap": [ok], "reservListMap": [{"pnrNo": pnr}]})
+        if path.startswith("/atc/"):  # 예약 목록
+            with state._lock:
+                mine = list(state._reservations.get(self._session(), []))
+            return self._reply({
+                "resultMap": [ok],
+                "trainListMap": [{"pnrNo": r["pnr"], "rcvdAmt": str(52300 * r["count"]),
+                                  "tkSpecNum": str(r["count"])} for r in mine],
+                "payListMap": [_srt_pay(r) for r in mine],
+            })
+        if path.startswith("/ard/selectListArd02017"):  # 승차권 정보
+            return self._reply({"resultMap": [ok], "trainListMap": [{
+                "scarNo": "5", "seatNo": "3A", "psrmClCd": "1", "psgTpCd": "1",
+                "rcvdAmt": "52300", "stdrPrc": "52900", "dcntPrc": "600"}]})
+        if path.startswith("/ard/"):  # 취소
+            return self._reply({"resultMap": [ok]})
+        if path.startswith("/ata/selectListAta09036"):  # 결제
+            state._paid(p.get("pnrNo", ""))
+            return self._reply({"outDataSets": {"dsOutput0": [{"strResult": "SUCC", "msgTxt": "결제 완료"}]}})
+        return self._reply({"resultMap": [ok]})
+
+    def _netfunnel(self, p: dict):
+        op = p.get("opcode", "5101")
+        next_code = "5002" if op == "5101" else op
+        self._reply(
+            f"NetFunnel.gRtype={op};NetFunnel.gControl.result='{next_code}:200:key=BENCH&nwait=0&nnext=0"
+            f"&tps=0&ttl=0&ip=127.0.0.1&port=80';NetFunnel.gControl._showResult();",
+            text=True,
+        )
+
+    # ── 코레일 ──
+
+    def _korail(self, path: str, p: dict):
+        state = self.state
+        name = path.rsplit(".", 1)[-1]
+        if name == "do":  # common.code.do — 비밀번호 암호화 키
+            return self._reply({"strResult": "SUCC",
+                                "app.login.cphd": {"idx": "1", "key": "korail1234567890korail1234567890"}})
+        if name == "Login":
+            return self._reply({"strResult": "SUCC", "strMbCrdNo": "1234567890", "Key": f"ktx{next(state._sessions)}",
+                                "strCustNm": "벤치", "strEmailAdr": "bench@example.com"})
+        if name == "ScheduleView":
+            with state._lock:
+                trains = [t for t in state._timetable("ktx", p["txtGoStart"], p["txtGoEnd"], p["txtGoAbrdDt"])
+                          if t.dep_time >= p["txtGoHour"]][:_PAGE]
+                state._seen("ktx", p["txtGoAbrdDt"], trains)
+                rows = [_korail_train(t) for t in trains]
+            if not rows:
+                return self._reply({"strResult": "FAIL", "h_msg_cd": "P100", "h_msg_txt": "조회 결과가 없습니다."})
+            return self._reply({"strResult": "SUCC", "h_msg_cd": "IRZ000001", "h_msg_txt": "정상",
+                                "trn_infos": {"trn_info": rows}})
+        if name == "TicketReservation":
+            pnr = state._reserve(p.get("Key", "anonymous"), "ktx", p["txtDptDt1"], p["txtTrnNo1"],
+                                 p.get("txtPsrmClCd1") == "2", int(p.get("txtTotPsgCnt", 1)))
+            if pnr is None:
+                return self._reply({"strResult": "FAIL", "h_msg_cd": "ERR211161", "h_msg_txt": "매진"})
+            return self._reply({"strResult": "SUCC", "h_msg_cd": "IRZ000001", "h_pnr_no": pnr})
+        if name == "ReservationView":
+            with state._lock:
+                mine = list(state._reservations.get(p.get("Key", "anonymous"), []))
+            if not mine:
+                return self._reply({"strResult": "FAIL", "h_msg_cd": "P100", "h_msg_txt": "예약 내역이 없습니다."})
+            return self._reply({"strResult": "SUCC", "jrny_infos": {"jrny_info": [
+                {"train_infos": {"train_info": [_korail_reservation(r)]}} for r in mine]}})
+        return self._reply({"strResult": "SUCC", "h_msg_cd": "IRZ000001", "h_msg_txt": "정상"})
+
+    # ── 텔레그램 Bot API ──
+
+    def _telegram(self, method: str, p: dict):
+        if method == "getMe":
+            return self._reply({"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "bench",
+                                                       "username": "bench_bot"}})
+        text = p.get("text", "")
+        if method in ("sendMessage", "editMessageText"):
+            self.state._notified(text)
+        message_id = int(p["message_id"]) if p.get("message_id") else next(self.state._messages)
+        self._reply({"ok": True, "result": {
+            "message_id": message_id, "date": int(time.time()),
+            "chat": {"id": int(p.get("chat_id", 1)), "type": "private"}, "text": text}})
+
+
+def _srt_train(t: _Train, dep_code: str, arr_code: str) -> dict:
+    return {
+        "stlbTrnClsfCd": "17", "trnNo": t.no, "dptDt": t.date, "dptTm": t.dep_time,
+        "dptRsStnCd": dep_code, "arvDt": t.date, "arvTm": _arrival(t.dep_time), "arvRsStnCd": arr_code,
+        "gnrmRsvPsbStr": "예약가능" if t.general else "매진",
+        "sprmRsvPsbStr": "예약가능" if t.special else "매진",
+        "rsvWaitPsbCd": "-1",
+        "arvStnRunOrdr": "000002", "arvStnConsOrdr": "000002",
+        "dptStnRunOrdr": "000001", "dptStnConsOrdr": "000001",
+    }
+
+
+def _srt_pay(r: dict) -> dict:
+    from SRT.constants import STATION_CODE
+    t = r["train"]
+    return {
+        "stlbTrnClsfCd": "17", "trnNo": t.no, "dptDt": t.date, "dptTm": t.dep_time,
+        "dptRsStnCd": STATION_CODE.get(t.dep, "0000"), "arvTm": _arrival(t.dep_time),
+        "arvRsStnCd": STATION_CODE.get(t.arr, "0000"),
+        "iseLmtDt": datetime.now().strftime("%Y%m%d"), "iseLmtTm": "235900",
+        "stlFlg": "Y" if r["paid"] else "N",
+    }
+
+
+def _korail_train(t: _Train) -> dict:
+    return {
+        "h_trn_clsf_cd": "100", "h_trn_clsf_nm": "KTX", "h_trn_gp_cd": "100", "h_trn_no": t.no,
+        "h_expct_dlay_hr": "0000",
+        "h_dpt_rs_stn_nm": t.dep, "h_dpt_rs_stn_cd": _station_code(t.dep), "h_dpt_dt": t.date, "h_dpt_tm": t.dep_time,
+        "h_arv_rs_stn_nm": t.arr, "h_arv_rs_stn_cd": _station_code(t.arr), "h_arv_dt": t.date,
+        "h_arv_tm": _arrival(t.dep_time), "h_run_dt": t.date,
+        "h_rsv_psb_flg": "Y" if t.general or t.special else "N",
+        "h_rsv_psb_nm": "예약하기" if t.general or t.special else "매진",
+        "h_spe_rsv_cd": "11" if t.special else "13",
+        "h_gen_rsv_cd": "11" if t.general else "13",
+        "h_wait_rsv_flg": "-1",
+    }
+
+
+def _korail_reservation(r: dict) -> dict:
+    row = _korail_train(r["train"])
+    row.update({"h_pnr_no": r["pnr"], "h_tot_seat_cnt": f"{r['count']:03d}",
+                "h_ntisu_lmt_dt": datetime.now().strftime("%Y%m%d"), "h_ntisu_lmt_tm": "235900",
+                "h_rsv_amt": f"{59800 * r['count']:08d}"})
+    return row
+
+
+# ════════════════════════════ 클라이언트 연결 ════════════════════════════
+
+
+def patch_clients(base_url: str):
+    """SRTrain·korail2 클라이언트가 운영 서버 대신 대역 서버로 요청하도록 URL을 바꾼다."""
+    from SRT import constants as srt_constants
+    from SRT.netfunnel import NetFunnelHelper
+    import korail2.korail2 as korail_module
+
+    for name, url in srt_constants.API_ENDPOINTS.items():
+        srt_constants.API_ENDPOINTS[name] = url.replace(SRT_HOST, f"{base_url}/srt")
+    NetFunnelHelper.NETFUNNEL_URL = f"{base_url}/netfunnel/ts.wseq"
+    for name in dir(korail_module):
+        value = getattr(korail_module, name)
+        if name.startswith("KORAIL_") and isinstance(value, str) and value.startswith(KORAIL_HOST):
+            setattr(korail_module, name, value.replace(KORAIL_HOST, f"{base_url}/korail"))
+
+
+def telegram_url(base_url: str) -> str:
+    """python-telegram-bot의 base_url (Bot(token, base_url=...))"""
+    return f"{base_url}/tg/bot"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SRT/코레일/텔레그램 로컬 대역 서버")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--script", help="좌석 풀림 스크립트 (JSON 목록)")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(asctime)s - %(levelname)s - %(message)s", level=logging.INFO)
+    standin = StandIn(args.host, args.port).start()
+    logger.info(f"대역 서버 시작: {standin.url}")
+    if args.script:
+        with open(args.script, encoding="utf-8") as f:
+            standin.run_script(json.load(f))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        standin.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,13 @@
 import asyncio
+import functools
 import sys
 import io
-import threading
 import time
-import random
 import logging
+import secrets
+import sqlite3
 from datetime import datetime, timedelta
+from typing import Callable, NamedTuple
 
 # Windows cp949 콘솔 인코딩 문제 해결
 if sys.platform == "win32":
@@ -35,9 +37,74 @@ from config import (
     CARD_BIRTH,
     CARD_INSTALLMENT,
     REFRESH_MIN,
-    REFRESH_MAX,
     MAX_ATTEMPTS,
+    MACRO_WORKERS,
+    SEARCH_SHARE_SEC,
+    SESSION_REFRESH_SEC,
+    SESSION_DIR,
+    MACRO_DB,
+    TG_GLOBAL_RATE,
+    TG_CHAT_INTERVAL,
+    POLL_BUDGET_PER_MIN,
+    POLL_MAX_SEC,
+    POLL_QUIET_HOURS,
+    POLL_QUIET_FACTOR,
+    HISTORY_DIR,
+    CAPTURE_DIR,
+    HISTORY_STATS_DAYS,
+    METRICS_HOST,
+    METRICS_PORT,
+    PAY_RETRIES,
+    PAY_RETRY_SEC,
+    PAY_REMIND_SEC,
+    PAY_REMIND_COUNT,
+    PAY_DEADLINE_SEC,
+    GOVERNOR_RATE_PER_MIN,
+    GOVERNOR_BURST,
+    WEBHOOK_URL,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    WEBHOOK_CERT,
+    WEBHOOK_KEY,
+    TENANT_KEY,
+    TENANT_KEY_FILE,
+    TENANT_MAX_MACROS,
+    TENANT_MAX_INFLIGHT,
+    MACRO_PROCS,
+    WORKER_MACROS,
+    WORKER_LEASE_SEC,
 )
+from engine import MacroEngine
+from governor import Governor
+from capture import Recorder
+from history import HistoryStore
+from search import SearchHub
+from macro import (
+    ALL_TIME_CODES,
+    TIME_SLOTS,
+    WEEKDAYS,
+    Reporter,
+    Runtime,
+    dates_summary,
+    fmt_date,
+    fmt_start,
+    macro_tag,
+    new_state,
+    parse_start,
+    route_desc,
+    run,
+    times_summary,
+)
+from metrics import Metrics
+from pacing import PollController, parse_hours
+from payment import PaymentPipeline
+from session import SessionPool
+from outbox import ALERT, INFO, Outbox
+from store import MacroStore
+from tenants import Tenants, load_key
+from webhook import run_webhook
+from worker import Coordinator
 
 logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(message)s",
@@ -60,27 +127,10 @@ KTX_STATIONS = [
     "전주", "남원", "순천", "여수EXPO", "강릉", "동해", "원주",
 ]
 
-TIME_SLOTS = [
-    ("새벽 00~06", "000000"),
-    ("오전 06~09", "060000"),
-    ("오전 09~12", "090000"),
-    ("오후 12~15", "120000"),
-    ("오후 15~18", "150000"),
-    ("저녁 18~21", "180000"),
-    ("야간 21~24", "210000"),
-]
-
-ALL_TIME_CODES = [code for _, code in TIME_SLOTS]
-
-# 각 시간대의 시작~끝 (HHMMSS)
-TIME_RANGES = {
-    "000000": (0, 6),
-    "060000": (6, 9),
-    "090000": (9, 12),
-    "120000": (12, 15),
-    "150000": (15, 18),
-    "180000": (18, 21),
-    "210000": (21, 24),
+# 대체역 묶음 — 한 매크로가 묶음 안의 역을 모두 조회 (출발·도착 각각 노선 조합)
+STATION_GROUPS = {
+    "srt": [["수서", "동탄"]],
+    "ktx": [["서울", "용산", "광명"]],
 }
 
 SEAT_OPTIONS = [
@@ -89,18 +139,83 @@ SEAT_OPTIONS = [
     ("특실만", "special_only"),
 ]
 
-WEEKDAYS = ["월", "화", "수", "목", "금", "토", "일"]
+# 매크로 완료 기록이 DB 잠금에 걸렸을 때 재시도 간격(초)
+FINISH_RETRY_SEC = (1, 5, 15)
+
+# 받는 업데이트 종류 — 명령어·텍스트 입력과 인라인 버튼만
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
 
 # ════════════════════════════ 매크로 상태 ════════════════════════════
 
 macros: dict[str, dict] = {}
 
+# 매크로 정의·진행 상태 영속화 (재시작 시 자동 재개). DB 파일은 처음 쓸 때 열린다
+store = MacroStore(MACRO_DB)
+
+# 채팅별 사용자와 암호화된 열차 계정 (매크로 수 한도)
+tenants = Tenants(store, lambda: load_key(TENANT_KEY, TENANT_KEY_FILE), TENANT_MAX_MACROS)
+
+# 구간별 지연 히스토그램·에러 카운터 (/metrics, 선택적으로 Prometheus 엔드포인트)
+metrics = Metrics()
+
+# 업스트림 조회 스냅샷 기록 (날짜별·노선별 고정폭 파일, /stats)
+history = HistoryStore(HISTORY_DIR) if HISTORY_DIR else None
+
+# 텔레그램 발송 큐 (결과 우선, 속도 제한, 진행 상황은 메시지 하나를 수정)
+outbox = Outbox(TG_GLOBAL_RATE, TG_CHAT_INTERVAL, metrics)
+
+# 모든 매크로는 하나의 이벤트 루프에서 태스크로 실행 (블로킹 호출은 공용 스레드풀)
+engine = MacroEngine(MACRO_WORKERS)
+
+# 같은 노선·날짜·시간대 조회는 매크로끼리 공유
+searches = SearchHub(SEARCH_SHARE_SEC)
+
+# 계정별 조회·예약 호출 상한 (토큰 버킷, 예약 우선, 매크로 가중치 공정 큐)
+governor = (Governor(GOVERNOR_RATE_PER_MIN, GOVERNOR_BURST, lambda key: pacing.weight(key), metrics)
+            if GOVERNOR_RATE_PER_MIN > 0 else None)
+
+# 계정별 로그인 세션 하나를 모든 매크로가 공유 (만료 전 백그라운드 갱신, 디스크 캐시, 계정당 동시 호출 상한)
+sessions = SessionPool(engine, SESSION_REFRESH_SEC, MACRO_WORKERS, SESSION_DIR or None, metrics, governor,
+                       TENANT_MAX_INFLIGHT, Recorder.open(CAPTURE_DIR) if CAPTURE_DIR else None)
+
+# 계정별 조회 예산을 출발 임박도·잔여석 변화·에러율에 따라 매크로들에 배분
+pacing = PollController(
+    POLL_BUDGET_PER_MIN, REFRESH_MIN, POLL_MAX_SEC, parse_hours(POLL_QUIET_HOURS), POLL_QUIET_FACTOR)
+
+# 예약 이후 카드 결제 재시도·미결제 알림 (매크로와 분리, 재시작 시 재개)
+payments = PaymentPipeline(
+    store, outbox, lambda chat_id, train: account_for(chat_id, train),
+    {"number": CARD_NUMBER, "password": CARD_PASSWORD, "validation_number": CARD_BIRTH,
+     "expire_date": CARD_EXPIRE, "installment": CARD_INSTALLMENT, "card_type": "J"},
+    metrics, PAY_RETRIES, PAY_RETRY_SEC, PAY_REMIND_SEC, PAY_REMIND_COUNT, PAY_DEADLINE_SEC)
+
+# 매크로를 워커 프로세스에 나눠 실행 (MACRO_PROCS > 0) — 봇은 큐에 넣고 워커가 보낸 메시지를 전달
+coordinator = (Coordinator(store, MACRO_PROCS, WORKER_MACROS, WORKER_LEASE_SEC, lambda *event: on_worker_event(*event))
+               if MACRO_PROCS > 0 else None)
+
+metrics.collect("macros_running", "실행 중인 매크로 수", lambda: engine.active_count())
+metrics.collect("search_upstream_total", "업스트림 조회 수", lambda: searches.upstream_calls, "counter")
+metrics.collect("search_shared_total", "다른 매크로와 공유한 조회 수", lambda: searches.shared_hits, "counter")
+metrics.collect("telegram_sent_total", "보낸 텔레그램 메시지 수", lambda: outbox.sent, "counter")
+metrics.collect("telegram_failed_total", "전송 포기한 텔레그램 메시지 수", lambda: outbox.failed, "counter")
+metrics.collect("tenants", "등록된 사용자 수", lambda: len(tenants))
+if coordinator is not None:
+    metrics.collect("workers_alive", "살아 있는 매크로 워커 프로세스 수", lambda: coordinator.alive())
+    metrics.collect("worker_restarts_total", "다시 띄운 매크로 워커 수", lambda: coordinator.restarts, "counter")
+if governor is not None:
+    metrics.collect("governor_waiting", "호출 상한에 걸려 대기 중인 조회·예약 수", lambda: governor.waiting())
+
 # ════════════════════════════ 보안 ════════════════════════════
 
 
+def is_owner(chat_id: int) -> bool:
+    """TELEGRAM_CHAT_ID = 봇 주인 (.env 계정·카드의 주인, 사용자 초대). 비어 있으면 누구나 주인 (1인용)"""
+    return not TELEGRAM_CHAT_ID or str(chat_id) == TELEGRAM_CHAT_ID
+
+
 def authorized(update: Update) -> bool:
-    chat_id = str(update.effective_chat.id)
-    return not TELEGRAM_CHAT_ID or chat_id == TELEGRAM_CHAT_ID
+    chat_id = update.effective_chat.id
+    return is_owner(chat_id) or chat_id in tenants
 
 
 async def deny(update: Update):
@@ -113,14 +228,80 @@ async def deny(update: Update):
 # ════════════════════════════ 헬퍼 ════════════════════════════
 
 
-def grid_kb(items: list[str], cols: int, prefix: str) -> InlineKeyboardMarkup:
-    btns = [InlineKeyboardButton(t, callback_data=f"{prefix}:{t}") for t in items]
-    rows = [btns[i : i + cols] for i in range(0, len(btns), cols)]
+# 키보드는 불변 객체라 한 번 만들어 재사용한다 — 고정 키보드는 상수로, 선택 상태에 따라
+# 달라지는 키보드는 (인자 → 키보드) lru_cache로 (날짜 키보드는 오늘 날짜가 키에 들어가 하루마다 바뀜)
+
+
+def grid_rows(btns: list[InlineKeyboardButton], cols: int) -> list[list[InlineKeyboardButton]]:
+    return [btns[i : i + cols] for i in range(0, len(btns), cols)]
+
+
+TRAIN_KB = InlineKeyboardMarkup([[
+    InlineKeyboardButton("🚄 SRT", callback_data="train:srt"),
+    InlineKeyboardButton("🚅 KTX", callback_data="train:ktx"),
+]])
+NEW_MACRO_KB = InlineKeyboardMarkup([[
+    InlineKeyboardButton("🚄 SRT 새로 시작", callback_data="train:srt"),
+    InlineKeyboardButton("🚅 KTX 새로 시작", callback_data="train:ktx"),
+]])
+TRIP_KB = InlineKeyboardMarkup([[
+    InlineKeyboardButton("편도", callback_data="trip:oneway"),
+    InlineKeyboardButton("왕복", callback_data="trip:round"),
+]])
+PAX_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton(f"{i}명", callback_data=f"pax:{i}") for i in range(1, 5)],
+    [InlineKeyboardButton("5명+", callback_data="pax:5+")],
+])
+SEAT_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton(k, callback_data=f"seat:{v}") for k, v in SEAT_OPTIONS],
+])
+
+
+@functools.lru_cache(maxsize=None)
+def station_kb(train: str, prefix: str, exclude: str = "") -> InlineKeyboardMarkup:
+    """대체역 묶음 버튼(한 줄씩) + 역 버튼 3열. 묶음 값은 "수서+동탄" 형태"""
+    stations = SRT_STATIONS if train == "srt" else KTX_STATIONS
+    taken = set(exclude.split("+")) if exclude else set()
+    rows = [[InlineKeyboardButton(f"🔀 {'·'.join(g)}", callback_data=f"{prefix}:{'+'.join(g)}")]
+            for g in STATION_GROUPS[train] if not taken & set(g)]
+    btns = [InlineKeyboardButton(s, callback_data=f"{prefix}:{s}") for s in stations if s not in taken]
+    return InlineKeyboardMarkup(rows + grid_rows(btns, 3))
+
+
+def _days(first: str) -> list[datetime]:
+    start = datetime.strptime(first, "%Y%m%d")
+    return [start + timedelta(days=i) for i in range(14)]
+
+
+@functools.lru_cache(maxsize=32)
+def date_kb(prefix: str, first: str, multi: bool = False) -> InlineKeyboardMarkup:
+    """first(YYYYMMDD)부터 2주 날짜 버튼 4열. multi면 여러 날짜 선택 버튼 추가"""
+    rows = grid_rows([InlineKeyboardButton(fmt_date(d), callback_data=f"{prefix}:{d2s(d)}") for d in _days(first)], 4)
+    if multi:
+        rows.append([InlineKeyboardButton("📅 여러 날짜 선택", callback_data="mdate")])
     return InlineKeyboardMarkup(rows)
 
 
-def fmt_date(d: datetime) -> str:
-    return f"{d.month}/{d.day}({WEEKDAYS[d.weekday()]})"
+@functools.lru_cache(maxsize=128)
+def dates_toggle_kb(first: str, selected: frozenset) -> InlineKeyboardMarkup:
+    btns = [InlineKeyboardButton(f"{'✅ ' if d2s(d) in selected else ''}{fmt_date(d)}", callback_data=f"mds:{d2s(d)}")
+            for d in _days(first)]
+    return InlineKeyboardMarkup(grid_rows(btns, 4) + [[InlineKeyboardButton("✔️ 선택 완료", callback_data="mddone")]])
+
+
+def station_label(value: str) -> str:
+    return value.replace("+", "·")
+
+
+def target_label(state: dict, target: tuple) -> str:
+    """조회 대상 (출발일, 출발역, 도착역) 중 매크로마다 달라지는 부분만"""
+    date_str, dep, arr = target
+    parts = []
+    if state.get("dates"):
+        parts.append(fmt_date(datetime.strptime(date_str, "%Y%m%d")))
+    if state.get("deps") or state.get("arrs"):
+        parts.append(f"{dep}→{arr}")
+    return " ".join(parts)
 
 
 def d2s(d: datetime) -> str:
@@ -132,8 +313,35 @@ def seat_label_kr(code: str) -> str:
     return m.get(code, code)
 
 
-def has_card() -> bool:
-    return bool(CARD_NUMBER and CARD_PASSWORD and CARD_EXPIRE)
+def has_card(chat_id: int) -> bool:
+    """자동결제 카드 (.env) — 봇 주인의 SRT 예약에만 쓴다"""
+    return bool(CARD_NUMBER and CARD_PASSWORD and CARD_EXPIRE) and is_owner(chat_id)
+
+
+def credentials(chat_id: int, train: str) -> tuple[str, str] | None:
+    """사용자가 /account로 등록한 계정, 없으면 봇 주인에 한해 .env 계정"""
+    account = tenants.account(chat_id, train)
+    if account is None and is_owner(chat_id):
+        account_id, password = (SRT_ID, SRT_PW) if train == "srt" else (KORAIL_ID, KORAIL_PW)
+        if account_id and password:
+            account = (account_id, password)
+    return account
+
+
+def account_for(chat_id: int, train: str):
+    """그 사용자의 로그인 세션 (같은 계정을 쓰는 매크로끼리 공유). 계정이 없으면 None"""
+    account = credentials(chat_id, train)
+    return sessions.get(train, *account) if account else None
+
+
+def macro_key(chat_id: int, train: str, direction: str) -> str:
+    """매크로 키 = 채팅 ID 이름공간 + 열차_방향 — 사용자마다 SRT·KTX 가는편·오는편을 따로 돌린다"""
+    return f"{chat_id}:{train}_{direction}"
+
+
+def owned(chat_id: int) -> dict[str, dict]:
+    """그 채팅의 매크로들"""
+    return {k: s for k, s in macros.items() if s.get("chat_id") == chat_id}
 
 
 def control_kb(key: str) -> InlineKeyboardMarkup:
@@ -143,7 +351,8 @@ def control_kb(key: str) -> InlineKeyboardMarkup:
     ]])
 
 
-def time_toggle_kb(selected: set, prefix: str) -> InlineKeyboardMarkup:
+@functools.lru_cache(maxsize=512)
+def time_toggle_kb(selected: frozenset, prefix: str) -> InlineKeyboardMarkup:
     """시간대 토글 키보드 생성. prefix: 'tg' (가는편) 또는 'tr' (오는편)"""
     all_on = selected == set(ALL_TIME_CODES)
     all_label = "✅ 전체 시간대" if all_on else "전체 시간대"
@@ -157,27 +366,6 @@ def time_toggle_kb(selected: set, prefix: str) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(rows)
 
 
-def times_summary(selected: set) -> str:
-    """선택한 시간대를 요약 문자열로."""
-    if selected == set(ALL_TIME_CODES):
-        return "전체 (00~24시)"
-    labels = []
-    for label, code in TIME_SLOTS:
-        if code in selected:
-            labels.append(label)
-    return ", ".join(labels) if labels else "미선택"
-
-
-def train_in_time_ranges(dep_time_str: str, selected_codes: list[str]) -> bool:
-    """열차 출발시각이 선택한 시간대 범위 안에 있는지 확인."""
-    hh = int(dep_time_str[:2])
-    for code in selected_codes:
-        start_h, end_h = TIME_RANGES[code]
-        if start_h <= hh < end_h:
-            return True
-    return False
-
-
 # ════════════════════════════ /start ════════════════════════════
 
 
@@ -185,63 +373,66 @@ async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not authorized(update):
         return await deny(update)
     context.user_data.clear()
-    kb = InlineKeyboardMarkup([[
-        InlineKeyboardButton("🚄 SRT", callback_data="train:srt"),
-        InlineKeyboardButton("🚅 KTX", callback_data="train:ktx"),
-    ]])
-    await update.message.reply_text("🚆 열차를 선택하세요.", reply_markup=kb)
+    await update.message.reply_text("🚆 열차를 선택하세요.", reply_markup=TRAIN_KB)
+
+
+# ════════════════════════════ 버튼 처리 (상태 기계) ════════════════════════════
+# 모든 인라인 버튼은 on_callback 하나로 들어온다. callback_data의 접두어("dep:수서" → "dep")로
+# WIZARD 표에서 단계를 한 번에 찾고, 권한 확인·필수 선택 검사·answer()·값 저장은 디스패처가,
+# 다음 화면은 단계의 handler(q, context, arg)가 맡는다.
 
 
-# ════════════════════════════ Step 1 → 열차 ════════════════════════════
+class Step(NamedTuple):
+    handler: Callable                       # async (q, context, arg) → 다음 화면
+    field: str | None = None                # arg를 저장할 user_data 키
+    require: tuple[str, str] | None = None  # (비어 있으면 안 되는 user_data 키, 알림 문구)
+    answers: bool = False                   # handler가 직접 q.answer()로 알림을 띄우는지
 
 
-async def cb_train(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def on_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
-    await q.answer()
+    prefix, _, arg = q.data.partition(":")
+    step = WIZARD.get(prefix)
+    if step is None:
+        return await q.answer()
     if not authorized(update):
         return await deny(update)
-    val = q.data.split(":")[1]
-    context.user_data["train"] = val
-    kb = InlineKeyboardMarkup([[
-        InlineKeyboardButton("편도", callback_data="trip:oneway"),
-        InlineKeyboardButton("왕복", callback_data="trip:round"),
-    ]])
-    label = "SRT" if val == "srt" else "KTX"
-    await q.edit_message_text(f"🚄 {label} — 편도/왕복을 선택하세요.", reply_markup=kb)
+    ud = context.user_data
+    if step.require and not ud.get(step.require[0]):
+        return await q.answer(step.require[1], show_alert=True)
+    if not step.answers:
+        await q.answer()
+    if step.field:
+        ud[step.field] = arg
+    await step.handler(q, context, arg)
 
 
-# ════════════════════════════ Step 2 → 편도/왕복 ════════════════════════════
+# ── Step 1~6: 열차 → 편도/왕복 → 인원 → 좌석등급 → 출발역 → 도착역 ──
 
 
-async def cb_trip(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query
-    await q.answer()
-    if not authorized(update):
-        return await deny(update)
-    val = q.data.split(":")[1]
-    context.user_data["trip"] = val
-    kb = InlineKeyboardMarkup([
-        [InlineKeyboardButton(f"{i}명", callback_data=f"pax:{i}") for i in range(1, 5)],
-        [InlineKeyboardButton("5명+", callback_data="pax:5+")],
-    ])
-    await q.edit_message_text("👤 인원 수를 선택하세요.", reply_markup=kb)
+async def cb_train(q, context, arg):
+    label = "SRT" if arg == "srt" else "KTX"
+    await q.edit_message_text(f"🚄 {label} — 편도/왕복을 선택하세요.", reply_markup=TRIP_KB)
 
 
-# ════════════════════════════ Step 3 → 인원 ════════════════════════════
+async def cb_trip(q, context, arg):
+    await q.edit_message_text("👤 인원 수를 선택하세요.", reply_markup=PAX_KB)
 
 
-async def cb_pax(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query
-    await q.answer()
-    if not authorized(update):
-        return await deny(update)
-    val = q.data.split(":")[1]
-    if val == "5+":
+async def cb_pax(q, context, arg):
+    if arg == "5+":
         context.user_data["awaiting_pax"] = True
         await q.edit_message_text("🔢 몇 명인지 숫자를 입력해주세요.")
         return
-    context.user_data["pax"] = int(val)
-    await show_seat_selection(q, context)
+    context.user_data["pax"] = int(arg)
+    await q.edit_message_text("💺 좌석 등급을 선택하세요.", reply_markup=SEAT_KB)
+
+
+async def msg_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """텍스트 입력 — 인원 수(5명+) 또는 시작 시각"""
+    if context.user_data.get("awaiting_start"):
+        return await msg_start_input(update, context)
+    return await msg_pax_input(update, context)
 
 
 async def msg_pax_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -255,225 +446,121 @@ async def msg_pax_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     context.user_data["pax"] = int(text)
     context.user_data["awaiting_pax"] = False
-    kb = InlineKeyboardMarkup([
-        [InlineKeyboardButton(k, callback_data=f"seat:{v}") for k, v in SEAT_OPTIONS],
-    ])
-    await update.message.reply_text("💺 좌석 등급을 선택하세요.", reply_markup=kb)
-
-
-async def show_seat_selection(q, context):
-    kb = InlineKeyboardMarkup([
-        [InlineKeyboardButton(k, callback_data=f"seat:{v}") for k, v in SEAT_OPTIONS],
-    ])
-    await q.edit_message_text("💺 좌석 등급을 선택하세요.", reply_markup=kb)
+    await update.message.reply_text("💺 좌석 등급을 선택하세요.", reply_markup=SEAT_KB)
 
 
-# ════════════════════════════ Step 4 → 좌석등급 ════════════════════════════
-
-
-async def cb_seat(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query
-    await q.answer()
-    if not authorized(update):
-        return await deny(update)
-    val = q.data.split(":")[1]
-    context.user_data["seat"] = val
+async def cb_seat(q, context, arg):
     train = context.user_data["train"]
-    stations = SRT_STATIONS if train == "srt" else KTX_STATIONS
     label = "SRT" if train == "srt" else "KTX"
-    kb = grid_kb(stations, 3, "dep")
-    await q.edit_message_text(f"🚉 {label} — 출발역을 선택하세요.", reply_markup=kb)
+    await q.edit_message_text(f"🚉 {label} — 출발역을 선택하세요.", reply_markup=station_kb(train, "dep"))
 
 
-# ════════════════════════════ Step 5 → 출발역 ════════════════════════════
+async def cb_dep(q, context, arg):
+    kb = station_kb(context.user_data["train"], "arr", exclude=arg)
+    await q.edit_message_text(f"출발역: {station_label(arg)}\n\n🏁 도착역을 선택하세요.", reply_markup=kb)
 
 
-async def cb_dep(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query
-    await q.answer()
-    if not authorized(update):
-        return await deny(update)
-    val = q.data.split(":")[1]
-    context.user_data["dep"] = val
-    train = context.user_data["train"]
-    stations = SRT_STATIONS if train == "srt" else KTX_STATIONS
-    filtered = [s for s in stations if s != val]
-    kb = grid_kb(filtered, 3, "arr")
-    await q.edit_message_text(f"출발역: {val}\n\n🏁 도착역을 선택하세요.", reply_markup=kb)
-
-
-# ════════════════════════════ Step 6 → 도착역 ════════════════════════════
-
-
-async def cb_arr(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query
-    await q.answer()
-    if not authorized(update):
-        return await deny(update)
-    val = q.data.split(":")[1]
-    context.user_data["arr"] = val
+async def cb_arr(q, context, arg):
     trip = context.user_data["trip"]
-    today = datetime.now()
-    dates = [today + timedelta(days=i) for i in range(14)]
-    btns = [InlineKeyboardButton(fmt_date(d), callback_data=f"date:{d2s(d)}") for d in dates]
-    rows = [btns[i : i + 4] for i in range(0, len(btns), 4)]
-    kb = InlineKeyboardMarkup(rows)
+    kb = date_kb("date", d2s(datetime.now()), multi=trip == "oneway")
     header = "가는날을 선택하세요." if trip == "round" else "날짜를 선택하세요."
     dep = context.user_data["dep"]
-    await q.edit_message_text(f"{dep} → {val}\n\n📅 {header}", reply_markup=kb)
+    await q.edit_message_text(f"{station_label(dep)} → {station_label(arg)}\n\n📅 {header}", reply_markup=kb)
 
 
-# ════════════════════════════ Step 7 → 날짜 (가는날) ════════════════════════════
+# ── Step 7: 날짜 (가는날 / 편도 여러 날짜 / 오는날) ──
 
 
-async def cb_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query
-    await q.answer()
-    if not authorized(update):
-        return await deny(update)
-    val = q.data.split(":")[1]
-    context.user_data["date_go"] = val
-    trip = context.user_data["trip"]
-    if trip == "round":
-        go_date = datetime.strptime(val, "%Y%m%d")
-        dates = [go_date + timedelta(days=i) for i in range(14)]
-        btns = [InlineKeyboardButton(fmt_date(d), callback_data=f"rdate:{d2s(d)}") for d in dates]
-        rows = [btns[i : i + 4] for i in range(0, len(btns), 4)]
-        kb = InlineKeyboardMarkup(rows)
-        d = datetime.strptime(val, "%Y%m%d")
+async def cb_date(q, context, arg):
+    context.user_data.pop("dates_go", None)
+    if context.user_data["trip"] == "round":
+        d = datetime.strptime(arg, "%Y%m%d")
         await q.edit_message_text(
             f"가는날: {d.strftime('%Y.%m.%d')} ({WEEKDAYS[d.weekday()]})\n\n📅 오는날을 선택하세요.",
-            reply_markup=kb,
+            reply_markup=date_kb("rdate", arg),
         )
     else:
         context.user_data["sel_tg"] = set()
         await show_time_go_kb(q, context)
 
 
-# ════════════════════════════ Step 7-2 → 날짜 (오는날) ════════════════════════════
+async def show_dates_kb(q, context):
+    selected = context.user_data.setdefault("sel_dates", set())
+    await q.edit_message_text(
+        f"📅 날짜를 선택하세요. (복수 선택 가능)\n선택: {len(selected)}개\n"
+        "매크로 하나가 조회 예산을 날짜들에 나눠 쓰고, 한 날짜라도 예약되면 끝납니다.",
+        reply_markup=dates_toggle_kb(d2s(datetime.now()), frozenset(selected)))
 
 
-async def cb_rdate(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query
-    await q.answer()
-    if not authorized(update):
-        return await deny(update)
-    val = q.data.split(":")[1]
-    context.user_data["date_ret"] = val
+async def cb_mdate(q, context, arg):
+    """편도 여러 날짜 선택으로 전환"""
+    context.user_data["sel_dates"] = set()
+    await show_dates_kb(q, context)
+
+
+async def cb_mddone(q, context, arg):
+    """날짜 선택 완료"""
+    dates = sorted(context.user_data["sel_dates"])
+    context.user_data["date_go"] = dates[0]
+    if len(dates) > 1:
+        context.user_data["dates_go"] = dates
+    else:
+        context.user_data.pop("dates_go", None)
+    context.user_data["sel_tg"] = set()
+    await show_time_go_kb(q, context)
+
+
+async def cb_rdate(q, context, arg):
     context.user_data["sel_tg"] = set()
     await show_time_go_kb(q, context)
 
 
-# ════════════════════════════ Step 8 → 시간 (가는편) 복수 선택 ════════════════════════════
+# ── Step 8: 시간대 복수 선택 (가는편 tg / 오는편 tr) ──
 
 
 async def show_time_go_kb(q, context):
     trip = context.user_data["trip"]
     selected = context.user_data.get("sel_tg", set())
-    kb = time_toggle_kb(selected, "tg")
+    kb = time_toggle_kb(frozenset(selected), "tg")
     header = "가는편 시간대" if trip == "round" else "시간대"
     cnt = len(selected)
     msg = f"🕐 {header}를 선택하세요. (복수 선택 가능)\n선택: {cnt}개"
     await q.edit_message_text(msg, reply_markup=kb)
 
 
-async def cb_tgs(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """가는편 개별 시간대 토글"""
-    q = update.callback_query
-    await q.answer()
-    if not authorized(update):
-        return await deny(update)
-    code = q.data.split(":")[1]
-    sel = context.user_data.setdefault("sel_tg", set())
-    if code in sel:
-        sel.discard(code)
-    else:
-        sel.add(code)
-    await show_time_go_kb(q, context)
-
-
-async def cb_tgall(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """가는편 전체 시간대 토글"""
-    q = update.callback_query
-    await q.answer()
-    if not authorized(update):
-        return await deny(update)
-    sel = context.user_data.setdefault("sel_tg", set())
-    if sel == set(ALL_TIME_CODES):
-        sel.clear()
-    else:
-        sel.update(ALL_TIME_CODES)
-    await show_time_go_kb(q, context)
-
-
-async def cb_tgdone(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """가는편 시간대 선택 완료"""
-    q = update.callback_query
-    if not authorized(update):
-        await q.answer("⛔ 권한 없음", show_alert=True)
-        return
-    sel = context.user_data.get("sel_tg", set())
-    if not sel:
-        await q.answer("⚠️ 시간대를 1개 이상 선택하세요.", show_alert=True)
-        return
-    await q.answer()
-    context.user_data["times_go"] = sorted(sel)
-    trip = context.user_data["trip"]
-    if trip == "round":
-        context.user_data["sel_tr"] = set()
-        await show_time_ret_kb(q, context)
-    else:
-        await show_confirm(q, context)
-
-
-# ════════════════════════════ Step 8-2 → 시간 (오는편) 복수 선택 ════════════════════════════
-
-
 async def show_time_ret_kb(q, context):
     selected = context.user_data.get("sel_tr", set())
-    kb = time_toggle_kb(selected, "tr")
+    kb = time_toggle_kb(frozenset(selected), "tr")
     cnt = len(selected)
     await q.edit_message_text(f"🕐 오는편 시간대를 선택하세요. (복수 선택 가능)\n선택: {cnt}개", reply_markup=kb)
 
 
-async def cb_trs(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query
-    await q.answer()
-    if not authorized(update):
-        return await deny(update)
-    code = q.data.split(":")[1]
-    sel = context.user_data.setdefault("sel_tr", set())
-    if code in sel:
-        sel.discard(code)
-    else:
-        sel.add(code)
-    await show_time_ret_kb(q, context)
+def toggle(key: str, show, all_codes: list[str] | None = None):
+    """선택 집합 user_data[key]에서 arg 하나를 (all_codes를 주면 전체를) 켜고 끄는 단계 handler"""
+    async def handler(q, context, arg):
+        sel = context.user_data.setdefault(key, set())
+        if all_codes is None:
+            sel.symmetric_difference_update({arg})
+        elif sel == set(all_codes):
+            sel.clear()
+        else:
+            sel.update(all_codes)
+        await show(q, context)
+    return handler
 
 
-async def cb_trall(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query
-    await q.answer()
-    if not authorized(update):
-        return await deny(update)
-    sel = context.user_data.setdefault("sel_tr", set())
-    if sel == set(ALL_TIME_CODES):
-        sel.clear()
+async def cb_tgdone(q, context, arg):
+    """가는편 시간대 선택 완료"""
+    context.user_data["times_go"] = sorted(context.user_data["sel_tg"])
+    if context.user_data["trip"] == "round":
+        context.user_data["sel_tr"] = set()
+        await show_time_ret_kb(q, context)
     else:
-        sel.update(ALL_TIME_CODES)
-    await show_time_ret_kb(q, context)
+        await show_confirm(q, context)
 
 
-async def cb_trdone(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query
-    if not authorized(update):
-        await q.answer("⛔ 권한 없음", show_alert=True)
-        return
-    sel = context.user_data.get("sel_tr", set())
-    if not sel:
-        await q.answer("⚠️ 시간대를 1개 이상 선택하세요.", show_alert=True)
-        return
-    await q.answer()
-    context.user_data["times_ret"] = sorted(sel)
+async def cb_trdone(q, context, arg):
+    context.user_data["times_ret"] = sorted(context.user_data["sel_tr"])
     await show_confirm(q, context)
 
 
@@ -481,13 +568,17 @@ async def cb_trdone(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def show_confirm(q, context):
-    ud = context.user_data
+    text, kb = confirm_view(context.user_data, q.message.chat.id)
+    await q.edit_message_text(text, reply_markup=kb, parse_mode="HTML")
+
+
+def confirm_view(ud: dict, chat_id: int) -> tuple[str, InlineKeyboardMarkup]:
     train = ud["train"]
     trip = ud["trip"]
     pax = ud["pax"]
     seat = ud["seat"]
-    dep = ud["dep"]
-    arr = ud["arr"]
+    dep = station_label(ud["dep"])
+    arr = station_label(ud["arr"])
     date_go = ud["date_go"]
     times_go = ud["times_go"]
 
@@ -497,7 +588,7 @@ async def show_confirm(q, context):
     d_go = datetime.strptime(date_go, "%Y%m%d")
 
     card_info = ""
-    if train == "srt" and has_card():
+    if train == "srt" and has_card(chat_id):
         card_info = "\n💳 자동결제: ON"
     elif train == "srt":
         card_info = "\n💳 자동결제: OFF (카드 미설정)"
@@ -509,7 +600,8 @@ async def show_confirm(q, context):
         "━━━━━━━━━━━━━",
         f"🔹 {trip_kr} | {pax}명 | {seat_label_kr(seat)}",
         f"🔹 {dep} → {arr}",
-        f"🔹 {d_go.strftime('%Y.%m.%d')} ({WEEKDAYS[d_go.weekday()]})",
+        f"🔹 {dates_summary(ud.get('dates_go'))}" if ud.get("dates_go")
+        else f"🔹 {d_go.strftime('%Y.%m.%d')} ({WEEKDAYS[d_go.weekday()]})",
         f"🔹 시간: {times_summary(set(times_go))}",
     ]
 
@@ -520,39 +612,61 @@ async def show_confirm(q, context):
         lines.append(f"🔹 오는편: {d_ret.strftime('%Y.%m.%d')} ({WEEKDAYS[d_ret.weekday()]})")
         lines.append(f"🔹 오는편 시간: {times_summary(set(times_ret))}")
 
+    if ud.get("start_at"):
+        lines.append(f"⏰ 시작: {fmt_start(ud['start_at'])} (서버 시각)")
+
     lines.append(card_info)
     lines.append("\n시작할까요?")
 
-    kb = InlineKeyboardMarkup([[
-        InlineKeyboardButton("✅ 시작", callback_data="cfm:yes"),
-        InlineKeyboardButton("🔄 다시 선택", callback_data="cfm:restart"),
-        InlineKeyboardButton("❌ 취소", callback_data="cfm:cancel"),
-    ]])
-    await q.edit_message_text("\n".join(lines), reply_markup=kb, parse_mode="HTML")
-
-
-# ════════════════════════════ 확인 처리 ════════════════════════════
+    at_btn = (InlineKeyboardButton("⏱ 바로 시작으로", callback_data="cfm:now") if ud.get("start_at")
+              else InlineKeyboardButton("⏰ 시작 시각 지정", callback_data="cfm:at"))
+    kb = InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton("✅ 시작", callback_data="cfm:yes"),
+            InlineKeyboardButton("🔄 다시 선택", callback_data="cfm:restart"),
+            InlineKeyboardButton("❌ 취소", callback_data="cfm:cancel"),
+        ],
+        [at_btn],
+    ])
+    return "\n".join(lines), kb
 
 
-async def cb_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query
-    await q.answer()
+async def msg_start_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not authorized(update):
         return await deny(update)
+    start_at = parse_start(update.message.text, datetime.now())
+    if start_at is None:
+        await update.message.reply_text("HH:MM 또는 HH:MM:SS 형식으로 입력해주세요. (예: 07:00:00)")
+        return
+    context.user_data["awaiting_start"] = False
+    context.user_data["start_at"] = start_at
+    text, kb = confirm_view(context.user_data, update.effective_chat.id)
+    await update.message.reply_text(text, reply_markup=kb, parse_mode="HTML")
+
+
+# ════════════════════════════ 확인 처리 ════════════════════════════
 
-    action = q.data.split(":")[1]
 
+async def cb_confirm(q, context, action):
     if action == "cancel":
         await q.edit_message_text("❌ 취소되었습니다.")
         return
 
+    if action == "at":
+        context.user_data["awaiting_start"] = True
+        await q.edit_message_text(
+            "⏰ 첫 조회 시각을 입력하세요 (HH:MM 또는 HH:MM:SS, 서버 시각 기준).\n"
+            "그 전에 로그인·연결 예열·시계 오차 측정을 마쳐 두고 정각에 조회합니다.")
+        return
+
+    if action == "now":
+        context.user_data.pop("start_at", None)
+        await show_confirm(q, context)
+        return
+
     if action == "restart":
         context.user_data.clear()
-        kb = InlineKeyboardMarkup([[
-            InlineKeyboardButton("🚄 SRT", callback_data="train:srt"),
-            InlineKeyboardButton("🚅 KTX", callback_data="train:ktx"),
-        ]])
-        await q.edit_message_text("🚆 열차를 선택하세요.", reply_markup=kb)
+        await q.edit_message_text("🚆 열차를 선택하세요.", reply_markup=TRAIN_KB)
         return
 
     # yes → 매크로 시작
@@ -560,33 +674,47 @@ async def cb_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
     train = ud["train"]
     trip = ud["trip"]
     label = train.upper()
-    go_key = f"{train}_go"
+    chat_id = q.message.chat.id
+    go_key = macro_key(chat_id, train, "go")
 
     if go_key in macros and macros[go_key].get("running"):
         await q.edit_message_text(f"⚠️ {label} 가는편 매크로가 이미 실행 중입니다.")
         return
 
-    chat_id = update.effective_chat.id
-    app = context.application
+    if credentials(chat_id, train) is None:
+        await q.edit_message_text(f"🔐 {label} 계정이 없습니다. /account {train} 아이디 비밀번호 로 등록하세요.")
+        return
 
-    go_state = _build_state(ud, "go")
+    limit = tenants.limit(chat_id)
+    running = sum(1 for s in owned(chat_id).values() if s.get("running"))
+    if limit and running + (2 if trip == "round" else 1) > limit:
+        await q.edit_message_text(f"⚠️ 동시에 실행할 수 있는 매크로는 {limit}개입니다 (실행 중 {running}개).")
+        return
+
+    go_state = _build_state(ud, "go", chat_id)
     macros[go_key] = go_state
-    threading.Thread(target=run_macro, args=(app, chat_id, go_state), daemon=True).start()
+    await save_macro(chat_id, go_state)
+    launch(chat_id, go_state)
 
-    msg = f"🚀 {label} 가는편 매크로 시작!\n{ud['dep']} → {ud['arr']}"
+    dep, arr = station_label(ud["dep"]), station_label(ud["arr"])
+    msg = f"🚀 {label} 가는편 매크로 시작!\n{dep} → {arr}"
+    if ud.get("start_at"):
+        msg = f"⏰ {label} 가는편 매크로 예약 — {fmt_start(ud['start_at'])} 조회 시작\n{dep} → {arr}"
 
     if trip == "round":
-        ret_key = f"{train}_ret"
-        ret_state = _build_state(ud, "ret")
+        ret_key = macro_key(chat_id, train, "ret")
+        ret_state = _build_state(ud, "ret", chat_id)
         macros[ret_key] = ret_state
-        threading.Thread(target=run_macro, args=(app, chat_id, ret_state), daemon=True).start()
-        msg += f"\n🚀 {label} 오는편 매크로 시작!\n{ud['arr']} → {ud['dep']}"
+        await save_macro(chat_id, ret_state)
+        launch(chat_id, ret_state)
+        verb = "예약" if ud.get("start_at") else "시작!"
+        msg += f"\n🚀 {label} 오는편 매크로 {verb}\n{arr} → {dep}"
 
     kb = control_kb(go_key)
     await q.edit_message_text(msg, reply_markup=kb)
 
 
-def _build_state(ud: dict, direction: str) -> dict:
+def _build_state(ud: dict, direction: str, chat_id: int) -> dict:
     train = ud["train"]
     if direction == "go":
         dep, arr = ud["dep"], ud["arr"]
@@ -597,294 +725,220 @@ def _build_state(ud: dict, direction: str) -> dict:
         date_str = ud["date_ret"]
         time_codes = ud["times_ret"]
 
-    return {
-        "running": True,
-        "train": train,
-        "direction": direction,
-        "dep": dep,
-        "arr": arr,
-        "date": date_str,
-        "time_codes": time_codes,       # 복수 시간대
-        "search_time": min(time_codes),  # API 조회용 (가장 이른 시간)
-        "pax": ud["pax"],
-        "seat": ud["seat"],
-        "attempt": 0,
-        "key": f"{train}_{direction}",
-    }
-
-
-# ════════════════════════════ 매크로 실행 (스레드) ════════════════════════════
-
-
-def run_macro(app: Application, chat_id: int, state: dict):
-    train = state["train"]
-    dep = state["dep"]
-    arr = state["arr"]
-    date_str = state["date"]
-    search_time = state["search_time"]
-    time_codes = state["time_codes"]
-    pax = state["pax"]
-    seat_code = state["seat"]
-    direction = state["direction"]
-    key = state["key"]
-    label = train.upper()
-    dir_kr = "가는편" if direction == "go" else "오는편"
-    tag = f"[{label} {dir_kr}]"
-
-    # ── 로그인 헬퍼 ──
-    def do_login():
-        if train == "srt":
-            from SRT import SRT
-            return SRT(SRT_ID, SRT_PW)
-        else:
-            from korail2 import Korail
-            return Korail(KORAIL_ID, KORAIL_PW)
+    state = new_state(macro_key(chat_id, train, direction), train, direction, dep, arr, date_str, time_codes,
+                      ud["pax"], ud["seat"], dates=ud.get("dates_go") if direction == "go" else None,
+                      start_at=ud.get("start_at"))
+    state["chat_id"] = chat_id
+    return state
 
-    # ── 초기 로그인 ──
-    try:
-        client = do_login()
-    except Exception as e:
-        _send(app, chat_id, f"❌ {tag} 로그인 실패: {e}")
-        state["running"] = False
-        return
 
-    # 좌석 타입 설정
-    if train == "srt":
-        from SRT.seat_type import SeatType
-        from SRT.passenger import Adult
-        seat_map = {"all": SeatType.GENERAL_FIRST, "general_only": SeatType.GENERAL_ONLY, "special_only": SeatType.SPECIAL_ONLY}
-        seat_type = seat_map.get(seat_code, SeatType.GENERAL_FIRST)
-    else:
-        from korail2 import AdultPassenger, ReserveOption
-        seat_map = {"all": ReserveOption.GENERAL_FIRST, "general_only": ReserveOption.GENERAL_ONLY, "special_only": ReserveOption.SPECIAL_ONLY}
-        seat_type = seat_map.get(seat_code, ReserveOption.GENERAL_FIRST)
+# ════════════════════════════ 매크로 실행 (태스크) ════════════════════════════
 
-    time_desc = times_summary(set(time_codes))
-    _send(app, chat_id, f"✅ {tag} 로그인 성공\n{dep}→{arr} | {time_desc}\n조회 시작!", reply_markup=control_kb(key))
 
-    last_login = time.time()
-    LOGIN_REFRESH = 1800  # 30분마다 세션 갱신
+class ChatReporter(Reporter):
+    """매크로 알림 → 그 채팅의 텔레그램. 카드가 있는 SRT 예약은 결제 파이프라인으로 넘긴다."""
 
-    # ── 반복 조회 ──
-    for attempt in range(1, MAX_ATTEMPTS + 1):
-        if not state["running"]:
-            _send(app, chat_id, f"⏹ {tag} 매크로 중지됨 (#{attempt})")
-            return
+    def __init__(self, chat_id: int, key: str):
+        self.chat_id = chat_id
+        self.key = key
 
-        state["attempt"] = attempt
+    def send(self, text, priority=INFO, parse_mode=None):
+        _send(self.chat_id, text, parse_mode=parse_mode, priority=priority)
 
-        # ── 세션 갱신 (30분마다) ──
-        if time.time() - last_login > LOGIN_REFRESH:
-            try:
-                client = do_login()
-                last_login = time.time()
-                logger.info(f"{tag} 세션 갱신 완료")
-            except Exception as e:
-                logger.warning(f"{tag} 세션 갱신 실패: {e}")
+    def status(self, text):
+        _status(self.chat_id, self.key, text)
 
-        # ── 열차 조회 ──
-        try:
-            if train == "srt":
-                trains = client.search_train(dep, arr, date_str, search_time)
-            else:
-                trains = client.search_train(dep, arr, date_str, search_time, passengers=[AdultPassenger(pax)])
-        except Exception as e:
-            err_name = type(e).__name__
-
-            # 세션 만료 → 즉시 재로그인
-            if "NeedToLogin" in err_name:
-                logger.info(f"{tag} 세션 만료 → 재로그인")
-                try:
-                    client = do_login()
-                    last_login = time.time()
-                except Exception as le:
-                    _send(app, chat_id, f"❌ {tag} 재로그인 실패: {le}")
-                    state["running"] = False
-                    return
-                continue
-
-            # 매진 (정상) → 빠르게 재시도
-            if "NoResult" in err_name or "SoldOut" in err_name:
-                if attempt % 50 == 0:
-                    _send(app, chat_id, f"🔄 {tag} [{attempt}/{MAX_ATTEMPTS}] 매진 — 취소표 대기 중...", reply_markup=control_kb(key))
-                if not _sleep(state, random.uniform(REFRESH_MIN, REFRESH_MAX)):
-                    _send(app, chat_id, f"⏹ {tag} 매크로 중지됨 (#{attempt})")
-                    return
-                continue
-
-            # 기타 에러
-            logger.warning(f"{tag} 조회 에러 #{attempt}: {e}")
-            if not _sleep(state, REFRESH_MAX):
-                _send(app, chat_id, f"⏹ {tag} 매크로 중지됨 (#{attempt})")
-                return
-            continue
-
-        # ── 열차별 좌석 확인 ──
-        for t in trains:
-            dep_time_str = t.dep_time
-            if not train_in_time_ranges(dep_time_str, time_codes):
-                continue
-
-            # 좌석 체크
-            if train == "srt":
-                if seat_code == "general_only":
-                    available = t.general_seat_available()
-                elif seat_code == "special_only":
-                    available = t.special_seat_available()
-                else:
-                    available = t.general_seat_available() or t.special_seat_available()
-            else:
-                if seat_code == "general_only":
-                    available = t.has_general_seat()
-                elif seat_code == "special_only":
-                    available = t.has_special_seat()
-                else:
-                    available = t.has_general_seat() or t.has_special_seat()
-
-            if not available:
-                continue
-
-            # ── 예약 시도 ──
-            try:
-                if train == "srt":
-                    reservation = client.reserve(t, passengers=[Adult(pax)], special_seat=seat_type)
-                    res_num = reservation.reservation_number
-                    hh_dep = f"{t.dep_time[:2]}:{t.dep_time[2:4]}"
-                    hh_arr = f"{t.arr_time[:2]}:{t.arr_time[2:4]}"
-
-                    if has_card():
-                        try:
-                            client.pay_with_card(
-                                reservation,
-                                number=CARD_NUMBER, password=CARD_PASSWORD,
-                                validation_number=CARD_BIRTH, expire_date=CARD_EXPIRE,
-                                installment=CARD_INSTALLMENT, card_type="J",
-                            )
-                            _send(app, chat_id,
-                                f"🎉 예약+결제 성공!\n\n{tag} {dep} → {arr}\n"
-                                f"출발: {hh_dep} → 도착: {hh_arr}\n예약번호: {res_num}\n💳 카드결제 완료!")
-                        except Exception as pe:
-                            _send(app, chat_id,
-                                f"✅ 예약 성공! ⚠️ 자동결제 실패\n\n{tag} {dep} → {arr}\n"
-                                f"출발: {hh_dep}\n예약번호: {res_num}\n결제오류: {pe}\n\n"
-                                f"⚠️ <b>앱에서 수동 결제하세요!</b>", parse_mode="HTML")
-                            for i in range(10):
-                                if not _sleep(state, 30):
-                                    break
-                                _send(app, chat_id, f"🔔 [{i+1}/10] 미결제 알림! 예약번호 {res_num} — 앱에서 결제하세요!")
-                    else:
-                        _send(app, chat_id,
-                            f"✅ 예약 성공!\n\n{tag} {dep} → {arr}\n"
-                            f"출발: {hh_dep}\n예약번호: {res_num}\n\n"
-                            f"⚠️ <b>SRT 앱에서 결제하세요!</b>", parse_mode="HTML")
-                else:
-                    reservation = client.reserve(t, passengers=[AdultPassenger(pax)], option=seat_type)
-                    res_num = reservation.reservation_number
-                    hh_dep = f"{t.dep_time[:2]}:{t.dep_time[2:4]}"
-                    _send(app, chat_id,
-                        f"✅ 예약 성공!\n\n{tag} {dep} → {arr}\n"
-                        f"출발: {hh_dep}\n예약번호: {res_num}\n\n"
-                        f"⚠️ <b>코레일 앱에서 결제하세요!</b>", parse_mode="HTML")
-
-                state["running"] = False
-                return
+    def booked(self, provider, reservation, info):
+        if not (provider.card_payment and has_card(self.chat_id)):
+            return False
+        payments.submit(self.chat_id, self.key, provider.name, reservation, info)
+        return True
 
-            except Exception as e:
-                logger.warning(f"{tag} 예매 실패: {e}")
 
-        # 진행 상태 알림
-        if attempt % 50 == 0:
-            elapsed = int(time.time() - last_login) // 60
-            _send(app, chat_id, f"🔄 {tag} [{attempt}/{MAX_ATTEMPTS}] 조회 중... ({elapsed}분 경과)", reply_markup=control_kb(key))
+async def save_macro(chat_id: int, state: dict):
+    """새 매크로 저장 — 워커가 DB를 잠그고 있어도 이벤트 루프를 막지 않게 스레드풀에서"""
+    await asyncio.get_running_loop().run_in_executor(None, store.save, chat_id, state)
 
-        if not _sleep(state, random.uniform(REFRESH_MIN, REFRESH_MAX)):
-            _send(app, chat_id, f"⏹ {tag} 매크로 중지됨 (#{attempt})")
-            return
 
-    _send(app, chat_id, f"😞 {tag} {MAX_ATTEMPTS}회 조회 완료 — 예매 실패")
-    state["running"] = False
+def launch(chat_id: int, state: dict):
+    """store에 저장된 매크로 실행 — 워커 프로세스를 쓰면 워커가 저장된 행을 가져가 실행한다"""
+    if coordinator is None:
+        engine.start(state["key"], run_macro(chat_id, state))
 
 
-def _send(app, chat_id, text, parse_mode=None, reply_markup=None):
-    """논블로킹 메시지 전송 — 스레드를 멈추지 않음"""
+async def run_macro(chat_id: int, state: dict):
+    """매크로 실행. 정상 종료 시에만 완료로 기록 — 프로세스 종료로 취소되면 재시작 때 재개된다."""
     try:
-        asyncio.run_coroutine_threadsafe(
-            app.bot.send_message(
-                chat_id=chat_id, text=text,
-                parse_mode=parse_mode, reply_markup=reply_markup,
-            ),
-            app.loop,
-        )
-    except Exception as e:
-        logger.warning(f"메시지 전송 실패: {e}")
+        await _run_macro(chat_id, state)
+    except asyncio.CancelledError:
+        raise
+    except sqlite3.Error:
+        # 기록 실패로 매크로를 완료 처리하지 않는다 — DB에는 실행 중으로 남아 재시작 때 재개
+        logger.exception(f"매크로 기록 실패로 중단: {state['key']}")
+        state["running"] = False
+        outbox.end_status(state["key"])
+        return
+    except Exception:
+        logger.exception(f"매크로 예외 종료: {state['key']}")
+    state["running"] = False
+    outbox.end_status(state["key"])
+    # 종료 중 취소돼도 완료 기록은 끝까지 (예약된 매크로가 재시작 때 다시 돌지 않게)
+    await asyncio.shield(finish_macro(state["key"]))
 
 
-def _sleep(state: dict, seconds: float) -> bool:
-    """중지 가능한 슬립 — 0.3초마다 running 플래그 체크. 중지 시 False 반환."""
-    elapsed = 0.0
-    while elapsed < seconds:
-        if not state["running"]:
-            return False
-        time.sleep(0.3)
-        elapsed += 0.3
+async def finish_macro(key: str):
+    """완료 기록 — 다른 프로세스가 DB를 잠그고 있어도 이벤트 루프를 막지 않고 몇 번 더 시도한다"""
+    loop = asyncio.get_running_loop()
+    for delay in FINISH_RETRY_SEC:
+        try:
+            await loop.run_in_executor(None, store.finish, key)
+            return
+        except sqlite3.OperationalError as e:
+            logger.warning(f"매크로 완료 기록 실패 ({key}), {delay}초 후 재시도: {e}")
+            await asyncio.sleep(delay)
+    logger.error(f"매크로 완료 기록 포기: {key} — 재시작하면 다시 실행될 수 있습니다")
+
+
+async def _run_macro(chat_id: int, state: dict):
+    report = ChatReporter(chat_id, state["key"])
+    # 같은 계정의 다른 매크로와 세션 공유
+    account = account_for(chat_id, state["train"])
+    if account is None:
+        report.send(f"🔐 {macro_tag(state)} 계정이 없습니다 — /account {state['train']} 로 등록하세요", ALERT)
+        state["running"] = False
+        return
+    # 전역 객체는 벤치·워커가 바꿔 끼울 수 있으므로 실행할 때 묶는다
+    await run(Runtime(engine, sessions, searches, pacing, metrics, history, store), state, account, report)
+
+
+def _send(chat_id, text, parse_mode=None, reply_markup=None, priority=INFO):
+    """논블로킹 메시지 전송 — 발송 큐에 넣고 바로 반환 (우선순위·속도 제한은 Outbox)"""
+    outbox.send(chat_id, text, priority=priority, parse_mode=parse_mode, reply_markup=reply_markup)
+
+
+def _status(chat_id, key, text):
+    """매크로별 진행 상태 메시지 하나를 새로 보내거나 수정"""
+    outbox.status(chat_id, key, text, reply_markup=control_kb(key))
+
+
+def on_worker_event(chat_id: int | None, key: str, kind: str, data: dict):
+    """워커 프로세스가 돌려준 일 — 메시지 발송, 상태 메시지, 매크로 종료, 결제 대기 인계"""
+    if kind == "send":
+        markup = data["reply_markup"]
+        outbox.send(chat_id, data["text"], priority=data["priority"], parse_mode=data["parse_mode"],
+                    reply_markup=InlineKeyboardMarkup.de_json(markup, None) if markup else None)
+    elif kind == "status":
+        _status(chat_id, key, data["text"])
+    elif kind == "end":
+        state = macros.get(key)
+        if state is not None:
+            state["running"] = False
+        outbox.end_status(key)
+    elif kind == "payment":
+        payments.adopt(data["res_num"])
+
+
+async def refresh_attempts(states: dict[str, dict]):
+    """워커 프로세스가 실행 중인 매크로의 시도 횟수를 저장소에서 읽어 온다 (/status용)"""
+    if coordinator is not None:
+        attempts = await asyncio.get_running_loop().run_in_executor(None, store.attempts, list(states))
+        for key, attempt in attempts.items():
+            states[key]["attempt"] = attempt
+
+
+def stop_macro(key: str) -> bool:
+    """중지 플래그 + 엔진 중지 이벤트 — 대기·조회 중인 매크로가 즉시 멈춘다.
+    워커 프로세스가 실행 중이면 중지 요청을 저장하고, 워커가 다음 임대 연장 때 멈춘다."""
+    state = macros.get(key)
+    if not state or not state.get("running"):
+        return False
+    state["running"] = False
+    if coordinator is not None:
+        # 화면의 중지는 바로 — 기록은 스레드풀에서 (워커가 DB를 잠그고 있어도 루프를 막지 않게)
+        done = asyncio.get_running_loop().run_in_executor(None, store.request_stop, key)
+        done.add_done_callback(lambda f: _stop_recorded(key, f))
+    else:
+        engine.stop(key)
     return True
 
 
-# ════════════════════════════ 실행 중 제어 ════════════════════════════
+def _stop_recorded(key: str, future: asyncio.Future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning(f"중지 요청 기록 실패 ({key}): {future.exception()}")
 
 
-async def cb_ctrl(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query
-    if not authorized(update):
-        await q.answer("⛔ 권한 없음", show_alert=True)
-        return
+# ════════════════════════════ 실행 중 제어 ════════════════════════════
 
-    parts = q.data.split(":")
-    action, key = parts[1], parts[2]
+
+async def cb_ctrl(q, context, arg):
+    action, _, key = arg.partition(":")
+    mine = owned(q.message.chat.id)
 
     if action == "stop":
         await q.answer()
         stopped = []
-        train = key.split("_")[0]
-        for k in [f"{train}_go", f"{train}_ret"]:
-            if k in macros and macros[k].get("running"):
-                macros[k]["running"] = False
+        base = key.rsplit("_", 1)[0]  # "채팅:srt" — 같은 열차의 가는편·오는편
+        for k in [f"{base}_go", f"{base}_ret"]:
+            if k in mine and stop_macro(k):
                 stopped.append(k)
         if stopped:
-            kb = InlineKeyboardMarkup([[
-                InlineKeyboardButton("🚄 SRT 새로 시작", callback_data="train:srt"),
-                InlineKeyboardButton("🚅 KTX 새로 시작", callback_data="train:ktx"),
-            ]])
-            await q.edit_message_text(f"⏹ 중지됨: {', '.join(stopped)}", reply_markup=kb)
+            await q.edit_message_text(f"⏹ 중지됨: {', '.join(stopped)}", reply_markup=NEW_MACRO_KB)
         else:
             await q.edit_message_text("ℹ️ 실행 중인 매크로가 없습니다.")
 
     elif action == "status":
+        await refresh_attempts(mine)
         lines = []
-        for k, s in macros.items():
+        for k, s in mine.items():
             if s.get("running"):
                 dir_kr = "가는편" if s["direction"] == "go" else "오는편"
-                lines.append(f"🟢 {s['train'].upper()} {dir_kr}: {s['dep']}→{s['arr']} #{s['attempt']}/{MAX_ATTEMPTS}")
+                lines.append(f"🟢 {s['train'].upper()} {dir_kr}: {route_desc(s)} #{s['attempt']}/{MAX_ATTEMPTS}")
         if not lines:
             lines.append("ℹ️ 실행 중인 매크로 없음")
         await q.answer("\n".join(lines), show_alert=True)
 
 
+# callback_data 접두어 → 단계 (on_callback이 dict 조회 한 번으로 찾는다)
+WIZARD: dict[str, Step] = {
+    "train": Step(cb_train, field="train"),
+    "trip": Step(cb_trip, field="trip"),
+    "pax": Step(cb_pax),
+    "seat": Step(cb_seat, field="seat"),
+    "dep": Step(cb_dep, field="dep"),
+    "arr": Step(cb_arr, field="arr"),
+    "date": Step(cb_date, field="date_go"),
+    "mdate": Step(cb_mdate),
+    "mds": Step(toggle("sel_dates", show_dates_kb)),
+    "mddone": Step(cb_mddone, require=("sel_dates", "⚠️ 날짜를 1개 이상 선택하세요.")),
+    "rdate": Step(cb_rdate, field="date_ret"),
+    # 시간대 토글 — 가는편
+    "tgs": Step(toggle("sel_tg", show_time_go_kb)),
+    "tgall": Step(toggle("sel_tg", show_time_go_kb, ALL_TIME_CODES)),
+    "tgdone": Step(cb_tgdone, require=("sel_tg", "⚠️ 시간대를 1개 이상 선택하세요.")),
+    # 시간대 토글 — 오는편
+    "trs": Step(toggle("sel_tr", show_time_ret_kb)),
+    "trall": Step(toggle("sel_tr", show_time_ret_kb, ALL_TIME_CODES)),
+    "trdone": Step(cb_trdone, require=("sel_tr", "⚠️ 시간대를 1개 이상 선택하세요.")),
+    # 확인/제어
+    "cfm": Step(cb_confirm),
+    "ctrl": Step(cb_ctrl, answers=True),
+}
+
+
 # ════════════════════════════ /stop ════════════════════════════
 
 
 async def cmd_stop(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not authorized(update):
         return await deny(update)
-    stopped = []
-    for k in list(macros.keys()):
-        if macros[k].get("running"):
-            macros[k]["running"] = False
-            stopped.append(k)
+    chat_id = update.effective_chat.id
+    stopped = [k for k in owned(chat_id) if stop_macro(k)]
+    reminders = payments.dismiss(chat_id)
+    suffix = f"\n🔕 미결제 알림 {reminders}건 중지" if reminders else ""
     if stopped:
-        await update.message.reply_text(f"⏹ 중지됨: {', '.join(stopped)}")
+        await update.message.reply_text(f"⏹ 중지됨: {', '.join(stopped)}{suffix}")
     else:
-        await update.message.reply_text("ℹ️ 실행 중인 매크로가 없습니다.")
+        await update.message.reply_text(f"ℹ️ 실행 중인 매크로가 없습니다.{suffix}")
 
 
 # ════════════════════════════ /status ════════════════════════════
@@ -893,28 +947,190 @@ async def cmd_stop(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def cmd_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not authorized(update):
         return await deny(update)
+    chat_id = update.effective_chat.id
+    mine = owned(chat_id)
+    await refresh_attempts(mine)
     lines = []
-    for k, s in macros.items():
+    for k, s in mine.items():
         if s.get("running"):
             dir_kr = "가는편" if s["direction"] == "go" else "오는편"
-            lines.append(f"🟢 {s['train'].upper()} {dir_kr}: {s['dep']}→{s['arr']} | #{s['attempt']}/{MAX_ATTEMPTS}")
+            line = f"🟢 {s['train'].upper()} {dir_kr}: {route_desc(s)} | #{s['attempt']}/{MAX_ATTEMPTS}"
+            pace = pacing.snapshot(k)
+            if pace:
+                line += f" | 가중치 {pace['weight']}"
+                if len(pace["shares"]) > 1:
+                    line += "\n   " + ", ".join(
+                        f"{target_label(s, t)} {share:.0%}" for t, share in pace["shares"].items())
+            lines.append(line)
         else:
             lines.append(f"⚪ {k}: 종료")
+    for job in payments.pending(chat_id):
+        deadline = datetime.fromtimestamp(job.deadline).strftime("%H:%M")
+        lines.append(f"💳 {job.info['tag']} 결제 대기: 예약번호 {job.res_num} (기한 {deadline})")
     if not lines:
         lines.append("ℹ️ 매크로 없음")
-    kb = InlineKeyboardMarkup([[
-        InlineKeyboardButton("🚄 SRT 새로 시작", callback_data="train:srt"),
-        InlineKeyboardButton("🚅 KTX 새로 시작", callback_data="train:ktx"),
-    ]])
-    await update.message.reply_text("\n".join(lines), reply_markup=kb)
+    await update.message.reply_text("\n".join(lines), reply_markup=NEW_MACRO_KB)
+
+
+# ════════════════════════════ /account, /invite, /revoke ════════════════════════════
+
+
+async def cmd_account(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/account [srt|ktx 아이디 비밀번호 | srt|ktx -] — 내 열차 계정 등록·삭제 (암호화 저장)"""
+    if not authorized(update):
+        return await deny(update)
+    chat_id = update.effective_chat.id
+    args = context.args or []
+    if args and args[0].lower() in ("srt", "ktx") and len(args) in (2, 3):
+        train = args[0].lower()
+        if len(args) == 3:
+            tenants.set_account(chat_id, train, args[1], args[2])
+            try:
+                await update.message.delete()  # 비밀번호가 담긴 메시지는 채팅에 남기지 않는다
+            except Exception as e:
+                logger.warning(f"계정 메시지 삭제 실패: {e}")
+            return _send(chat_id, f"🔐 {train.upper()} 계정 저장됨 ({args[1][:3]}***, 암호화)")
+        if args[1] == "-":
+            tenants.set_account(chat_id, train, None)
+            return await update.message.reply_text(f"🗑 {train.upper()} 계정 삭제됨")
+    lines = []
+    for train in ("srt", "ktx"):
+        account = credentials(chat_id, train)
+        lines.append(f"{train.upper()}: {account[0][:3] + '***' if account else '미등록'}")
+    limit = tenants.limit(chat_id)
+    lines.append(f"동시 매크로: {limit}개까지" if limit else "동시 매크로: 제한 없음")
+    lines.append("\n등록: /account srt 아이디 비밀번호\n삭제: /account srt -")
+    await update.message.reply_text("\n".join(lines))
+
+
+def _target_chat(context) -> tuple[int | None, int | None]:
+    """/invite·/revoke 인자 → (채팅 ID, 매크로 한도)"""
+    args = context.args or []
+    try:
+        return int(args[0]), (int(args[1]) if len(args) > 1 else None)
+    except (IndexError, ValueError):
+        return None, None
+
+
+async def cmd_invite(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/invite 채팅ID [매크로 한도] — 사용자 추가 (봇 주인만)"""
+    if not TELEGRAM_CHAT_ID or not is_owner(update.effective_chat.id):
+        return await deny(update)
+    chat_id, limit = _target_chat(context)
+    if chat_id is None:
+        return await update.message.reply_text("사용법: /invite 채팅ID [매크로 한도]")
+    tenants.add(chat_id, limit)
+    shown = limit if limit is not None else TENANT_MAX_MACROS
+    await update.message.reply_text(f"👤 {chat_id} 추가 (동시 매크로 {shown or '제한 없음'})")
+
+
+async def cmd_revoke(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/revoke 채팅ID — 사용자 제거, 실행 중인 매크로·미결제 알림 중지 (봇 주인만)"""
+    if not TELEGRAM_CHAT_ID or not is_owner(update.effective_chat.id):
+        return await deny(update)
+    chat_id, _ = _target_chat(context)
+    if chat_id is None or not tenants.remove(chat_id):
+        return await update.message.reply_text("사용법: /revoke 채팅ID (등록된 사용자)")
+    stopped = [k for k in owned(chat_id) if stop_macro(k)]
+    payments.dismiss(chat_id)
+    await update.message.reply_text(f"🚫 {chat_id} 제거 (매크로 {len(stopped)}개 중지)")
+
+
+# ════════════════════════════ /stats ════════════════════════════
+
+
+async def cmd_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/stats [srt|ktx 출발역 도착역 [일수]] — 노선별 출발 시각대 잔여석 통계"""
+    if not authorized(update):
+        return await deny(update)
+    if history is None:
+        return await update.message.reply_text("ℹ️ 조회 기록이 꺼져 있습니다 (HISTORY_DIR)")
+
+    args = context.args or []
+    days = HISTORY_STATS_DAYS
+    if len(args) >= 3:
+        if args[0].lower() not in ("srt", "ktx"):
+            return await update.message.reply_text("사용법: /stats srt 수서 부산 [일수]")
+        routes = [(args[0].lower(), args[1], args[2])]
+        if len(args) >= 4 and args[3].isdigit():
+            days = int(args[3])
+    else:
+        routes = sorted({(s["train"], d, a) for s in owned(update.effective_chat.id).values()
+                         for d in s.get("deps") or [s["dep"]] for a in s.get("arrs") or [s["arr"]] if d != a})
+        if not routes:
+            names = await engine.run_blocking(history.routes, days)
+            if not names:
+                return await update.message.reply_text(f"ℹ️ 최근 {days}일 조회 기록 없음")
+            listing = "\n".join(f"• /stats {n.replace('_', ' ')}" for n in names)
+            return await update.message.reply_text(f"📊 기록된 노선 (최근 {days}일)\n{listing}")
+
+    parts = []
+    for train, dep, arr in routes:
+        t0 = time.perf_counter()
+        st = await engine.run_blocking(history.stats, train, dep, arr, days)
+        ms = (time.perf_counter() - t0) * 1000
+        lines = [f"📊 {train.upper()} {dep}→{arr} (최근 {days}일, 기록 {st['records']:,}건, {ms:.0f}ms)"]
+        for h in st["hours"]:
+            held = h["median_open_sec"]
+            held_txt = f" | 유지 {held // 60}분{held % 60:02d}초" if held is not None else ""
+            lines.append(f"{h['hour']:02d}시  잔여석 {h['open_ratio']:.1%} | 좌석 생김 {h['appeared']}회{held_txt}")
+        if not st["hours"]:
+            lines.append("기록 없음")
+        parts.append("\n".join(lines))
+    await update.message.reply_text("\n\n".join(parts))
+
+
+# ════════════════════════════ /metrics ════════════════════════════
+
+
+async def cmd_metrics(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/metrics [매크로키] — 구간별 지연 p50/p95/p99와 예외 타입별 횟수 (봇 전체 지표라 주인만)"""
+    if not is_owner(update.effective_chat.id):
+        return await deny(update)
+    macro = context.args[0] if context.args else None
+    await update.message.reply_text(metrics.summary(macro))
 
 
 # ════════════════════════════ 메인 ════════════════════════════
 
 
 async def post_init(application: Application):
-    """run_polling 내부의 실제 이벤트 루프를 저장 (백그라운드 스레드용)"""
-    application.loop = asyncio.get_running_loop()
+    """이벤트 루프가 뜬 뒤 세션 관리 태스크 시작 + 미완료 매크로 재개"""
+    sessions.start()
+    outbox.start(application.bot)
+    if coordinator is not None:
+        coordinator.start()
+    if METRICS_PORT:
+        try:
+            await metrics.start(METRICS_HOST, METRICS_PORT)
+        except OSError as e:
+            logger.warning(f"메트릭 엔드포인트 시작 실패: {e}")
+    resumed = payments.resume()
+    if resumed:
+        logger.info(f"결제 대기 {resumed}건 재개")
+    t0 = time.perf_counter()
+    pending = store.unfinished()
+    for chat_id, state in pending:
+        state.setdefault("chat_id", chat_id)  # 사용자 이름공간 이전에 저장된 매크로
+        macros[state["key"]] = state
+        launch(chat_id, state)
+    if pending:
+        ms = (time.perf_counter() - t0) * 1000
+        logger.info(f"미완료 매크로 {len(pending)}개 재개 ({ms:.1f}ms, 매크로당 {ms / len(pending):.2f}ms)")
+
+
+async def post_shutdown(application: Application):
+    """실행 중인 매크로 태스크와 스레드풀 정리"""
+    if coordinator is not None:
+        await coordinator.stop()
+    await payments.stop()
+    await sessions.stop()
+    await engine.shutdown()
+    await outbox.stop()
+    await metrics.stop()
+    store.close()
+    if history is not None:
+        history.close()
 
 
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
@@ -926,11 +1142,18 @@ def main():
     if not TELEGRAM_BOT_TOKEN:
         print("[오류] .env에 TELEGRAM_BOT_TOKEN을 입력하세요.")
         return
+    try:
+        # 계정 암호화 키는 워커를 띄우기 전에 봇이 만든다 (잘못된 TENANT_KEY는 첫 /account가 아니라 지금 실패)
+        load_key(TENANT_KEY, TENANT_KEY_FILE)
+    except (OSError, ValueError) as e:
+        print(f"[오류] 계정 암호화 키: {e}")
+        return
 
     app = (
         Application.builder()
         .token(TELEGRAM_BOT_TOKEN)
         .post_init(post_init)
+        .post_shutdown(post_shutdown)
         .build()
     )
 
@@ -941,33 +1164,27 @@ def main():
     app.add_handler(CommandHandler("start", cmd_start))
     app.add_handler(CommandHandler("stop", cmd_stop))
     app.add_handler(CommandHandler("status", cmd_status))
-
-    # 인원 수 텍스트 입력 (5명+)
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, msg_pax_input))
-
-    # 콜백 라우팅
-    app.add_handler(CallbackQueryHandler(cb_train, pattern=r"^train:"))
-    app.add_handler(CallbackQueryHandler(cb_trip, pattern=r"^trip:"))
-    app.add_handler(CallbackQueryHandler(cb_pax, pattern=r"^pax:"))
-    app.add_handler(CallbackQueryHandler(cb_seat, pattern=r"^seat:"))
-    app.add_handler(CallbackQueryHandler(cb_dep, pattern=r"^dep:"))
-    app.add_handler(CallbackQueryHandler(cb_arr, pattern=r"^arr:"))
-    app.add_handler(CallbackQueryHandler(cb_date, pattern=r"^date:"))
-    app.add_handler(CallbackQueryHandler(cb_rdate, pattern=r"^rdate:"))
-    # 시간대 토글 — 가는편
-    app.add_handler(CallbackQueryHandler(cb_tgs, pattern=r"^tgs:"))
-    app.add_handler(CallbackQueryHandler(cb_tgall, pattern=r"^tgall$"))
-    app.add_handler(CallbackQueryHandler(cb_tgdone, pattern=r"^tgdone$"))
-    # 시간대 토글 — 오는편
-    app.add_handler(CallbackQueryHandler(cb_trs, pattern=r"^trs:"))
-    app.add_handler(CallbackQueryHandler(cb_trall, pattern=r"^trall$"))
-    app.add_handler(CallbackQueryHandler(cb_trdone, pattern=r"^trdone$"))
-    # 확인/제어
-    app.add_handler(CallbackQueryHandler(cb_confirm, pattern=r"^cfm:"))
-    app.add_handler(CallbackQueryHandler(cb_ctrl, pattern=r"^ctrl:"))
-
-    print("🤖 텔레그램 봇 시작...")
-    app.run_polling(allowed_updates=Update.ALL_TYPES)
+    app.add_handler(CommandHandler("stats", cmd_stats))
+    app.add_handler(CommandHandler("metrics", cmd_metrics))
+    app.add_handler(CommandHandler("account", cmd_account))
+    app.add_handler(CommandHandler("invite", cmd_invite))
+    app.add_handler(CommandHandler("revoke", cmd_revoke))
+
+    # 텍스트 입력 (5명+ 인원 수, 시작 시각)
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, msg_text))
+
+    # 인라인 버튼 — 접두어별 단계는 WIZARD 표
+    app.add_handler(CallbackQueryHandler(on_callback))
+
+    if WEBHOOK_URL:
+        # 웹훅: 텔레그램이 업데이트를 바로 밀어 준다 (롱폴링 왕복 대기 없음). 비밀 토큰은 없으면 실행마다 새로
+        print(f"🤖 텔레그램 봇 시작 (웹훅 {WEBHOOK_URL})...")
+        asyncio.run(run_webhook(app, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT,
+                                WEBHOOK_SECRET or secrets.token_urlsafe(32), ALLOWED_UPDATES,
+                                WEBHOOK_CERT or None, WEBHOOK_KEY or None))
+    else:
+        print("🤖 텔레그램 봇 시작...")
+        app.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,305 @@
+import argparse
+import cProfile
+import gzip
+import hashlib
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import zlib
+from collections import Counter, defaultdict, deque
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from matcher import compile_plan
+
+logger = logging.getLogger(__name__)
+
+# 녹화하는 호출 — 조회만 (로그인·예약·결제 응답에는 개인정보가 있다)
+CAPTURED = {"search_train"}
+
+_local = threading.local()
+
+
+def _on_response(r: requests.Response, *args, **kwargs):
+    """requests 응답 훅 — 녹화 중인 호출(같은 스레드)의 응답 원문을 모은다. 쿼리(세션 키)는 버린다."""
+    responses = getattr(_local, "responses", None)
+    if responses is not None:
+        responses.append({
+            "path": urlsplit(r.url).path,
+            "status": r.status_code,
+            "type": r.headers.get("Content-Type", ""),
+            "ms": round(r.elapsed.total_seconds() * 1000, 1),
+            "body": r.content.decode(r.encoding or "utf-8", "replace"),
+        })
+    return r
+
+
+def _plain_kwargs(kwargs: dict) -> dict:
+    """호출 인자를 JSON으로 — 코레일 승객 목록은 인원 수만"""
+    out = {}
+    for name, value in kwargs.items():
+        if name == "passengers":
+            value = sum(p.count for p in value)
+        elif not isinstance(value, (str, int, float, bool, type(None))):
+            value = str(value)
+        out[name] = value
+    return out
+
+
+class Recorder:
+    """조회 응답 녹화 (CAPTURE_DIR). 조회 호출 하나가 한 줄 — 시각, 호출 인자, 그 호출이 받은
+    HTTP 응답 원문들(페이지 넘김 포함). gzip JSON Lines로 쓰고 첫 기록 때 파일을 연다.
+
+    스레드풀의 여러 호출이 동시에 써도 줄이 섞이지 않게 잠그고, 줄마다 flush해 프로세스가
+    죽어도 그때까지의 기록은 읽을 수 있다. 녹화는 조회 호출의 끝에 압축·쓰기 시간을 더한다.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records = 0
+        self._file = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, directory: str) -> "Recorder":
+        """프로세스마다 새 파일 (매크로 워커도 각자)"""
+        os.makedirs(directory, exist_ok=True)
+        name = f"capture-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}.jsonl.gz"
+        return cls(os.path.join(directory, name))
+
+    def wrap(self, train: str, client, method: str, fn):
+        """클라이언트 메서드 fn을 녹화하는 함수로 감싼다 (CAPTURED가 아니면 그대로)"""
+        if method not in CAPTURED:
+            return fn
+        hooks = client._session.hooks["response"]
+        if _on_response not in hooks:
+            hooks.append(_on_response)
+
+        def call(*args, **kwargs):
+            responses = _local.responses = []
+            started, t0, error = time.time(), time.perf_counter(), None
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                error = type(e).__name__
+                raise
+            finally:
+                _local.responses = None
+                self._write({
+                    "t": round(started, 3), "train": train, "method": method, "args": list(args),
+                    "kwargs": _plain_kwargs(kwargs), "elapsed": round(time.perf_counter() - t0, 4),
+                    "error": error, "responses": responses,
+                })
+
+        return call
+
+    def _write(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._closed:
+                return
+            try:
+                if self._file is None:
+                    self._file = gzip.open(self.path, "wt", encoding="utf-8")
+                    logger.info(f"조회 응답 녹화: {self.path}")
+                self._file.write(line)
+                self._file.flush()
+            except OSError as e:
+                logger.warning(f"조회 응답 녹화 실패 — 녹화 중단: {e}")
+                self._closed = True
+                return
+            self.records += 1
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_archive(path: str):
+    """녹화 파일의 기록을 차례로. 비정상 종료로 잘린 끝부분은 건너뛴다."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                if line.endswith("\n"):
+                    yield json.loads(line)
+        except (EOFError, zlib.error, gzip.BadGzipFile):
+            logger.warning(f"녹화 파일 끝이 잘림: {path}")
+
+
+# ════════════════════════════ 재생 ════════════════════════════
+
+
+class ReplayAdapter(HTTPAdapter):
+    """녹화된 응답을 경로별로 녹화 순서대로 돌려주는 전송 계층 (네트워크 없음)"""
+
+    def __init__(self):
+        super().__init__()
+        self._queues: dict[str, deque] = {}
+
+    def load(self, responses: list[dict]):
+        """다음 호출에 돌려줄 응답들 (기록 하나의 responses)"""
+        queues = defaultdict(deque)
+        for rec in responses:
+            queues[rec["path"]].append(rec)
+        self._queues = queues
+
+    def _queue(self, path: str) -> deque | None:
+        queue = self._queues.get(path)
+        if queue is None:
+            # 프록시·대역 서버(bench.standin)를 거쳐 녹화하면 경로 앞에 접두어가 붙는다
+            queue = next((q for p, q in self._queues.items() if p.endswith(path)), None)
+        return queue
+
+    def send(self, request, **kwargs):
+        path = urlsplit(request.url).path
+        queue = self._queue(path)
+        if not queue:
+            raise requests.ConnectionError(f"녹화된 응답 없음: {path}", request=request)
+        rec = queue.popleft()
+        resp = requests.Response()
+        resp.status_code = rec["status"]
+        resp.headers["Content-Type"] = rec["type"]
+        resp._content = rec["body"].encode("utf-8")
+        resp.encoding = "utf-8"
+        resp.url = request.url
+        resp.request = request
+        return resp
+
+
+def replay_client(train: str, adapter: ReplayAdapter):
+    """로그인하지 않은 클라이언트 — 모든 요청이 adapter로 간다"""
+    if train == "srt":
+        from SRT import SRT
+        client = SRT("replay", "replay", auto_login=False)
+        # NetFunnel 대기열 키는 녹화하지 않는다 (조회 응답 해석과 무관)
+        client.netfunnel_helper.generate_netfunnel_key = lambda use_cache: "replay"
+    else:
+        from korail2 import Korail
+        client = Korail("replay", "replay", auto_login=False)
+        client._session = requests.Session()  # korail2는 세션을 클래스 속성으로 공유
+    client._session.mount("https://", adapter)
+    client._session.mount("http://", adapter)
+    return client
+
+
+def _call_kwargs(train: str, kwargs: dict) -> dict:
+    kwargs = dict(kwargs)
+    if train == "ktx" and "passengers" in kwargs:
+        from korail2 import AdultPassenger
+        kwargs["passengers"] = [AdultPassenger(kwargs["passengers"])]
+    return kwargs
+
+
+def _pct(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def replay(path: str, hour_ranges: list[tuple[int, int]], speed: float = 0.0, seat: str = "all",
+           rank: str | None = None) -> dict:
+    """녹화 파일을 실제 클라이언트(응답 해석)와 열차 필터(matcher)에 다시 흘려 구간별 시간을 잰다.
+
+    speed가 0이면 쉬지 않고, 1이면 녹화 때 간격 그대로, 10이면 10배 빠르게 재생한다. 결과의
+    digest는 기록마다 고른 예약 후보(열차번호)의 해시 — 같은 녹화로 엔진 버전을 비교할 때 쓴다.
+    """
+    adapter = ReplayAdapter()
+    clients, plans = {}, {}
+    parse_ms, match_ms = [], []
+    errors, mismatched = Counter(), 0
+    digest = hashlib.sha256()
+    trains_total = hits_total = 0
+    first, t0 = None, time.perf_counter()
+
+    for rec in read_archive(path):
+        train = rec["train"]
+        if speed > 0:
+            first = rec["t"] if first is None else first
+            wait = (rec["t"] - first) / speed - (time.perf_counter() - t0)
+            if wait > 0:
+                time.sleep(wait)
+        if train not in clients:
+            clients[train] = replay_client(train, adapter)
+            plans[train] = compile_plan(train, hour_ranges, seat, rank=rank)
+        adapter.load(rec["responses"])
+
+        started = time.perf_counter()
+        error = None
+        try:
+            trains = getattr(clients[train], rec["method"])(*rec["args"], **_call_kwargs(train, rec["kwargs"]))
+        except Exception as e:
+            # NoResults·매진 등 녹화 때 난 예외는 그대로 다시 난다
+            error, trains = type(e).__name__, []
+            errors[error] += 1
+        parsed = time.perf_counter()
+        hits = plans[train].select(trains)
+        matched = time.perf_counter()
+
+        mismatched += error != rec.get("error")
+        parse_ms.append((parsed - started) * 1000)
+        match_ms.append((matched - parsed) * 1000)
+        trains_total += len(trains)
+        hits_total += len(hits)
+        digest.update(json.dumps([rec["t"], [str(plans[train].number_of(t)) for t in hits]]).encode())
+
+    return {
+        "records": len(parse_ms),
+        "trains": trains_total,
+        "hits": hits_total,
+        "errors": dict(errors),
+        "error_mismatch": mismatched,    # 녹화 때와 다른 예외 (0이 아니면 라이브러리·대역 차이)
+        "parse_ms": {"p50": _pct(parse_ms, 0.5), "p99": _pct(parse_ms, 0.99), "total": sum(parse_ms)},
+        "match_ms": {"p50": _pct(match_ms, 0.5), "p99": _pct(match_ms, 0.99), "total": sum(match_ms)},
+        "wall_sec": time.perf_counter() - t0,
+        "digest": digest.hexdigest()[:16],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="녹화한 조회 응답을 재생해 응답 해석·열차 필터 시간을 잰다")
+    parser.add_argument("archive", help="녹화 파일 (CAPTURE_DIR의 capture-*.jsonl.gz)")
+    parser.add_argument("--speed", type=float, default=0.0, help="재생 배속 (0이면 쉬지 않음, 1이면 실시간)")
+    parser.add_argument("--times", default="", help="시간대 코드, 쉼표 구분 (기본 전체)")
+    parser.add_argument("--seat", default="all", help="all / general_only / special_only")
+    parser.add_argument("--rank", default=None, help="예약 후보 우선순위 (matcher.RANKINGS)")
+    parser.add_argument("--profile", action="store_true", help="cProfile 상위 함수 출력")
+    parser.add_argument("--json", help="결과를 JSON으로 저장할 경로")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(asctime)s - %(levelname)s - %(message)s", level=logging.WARNING)
+    from macro import ALL_TIME_CODES, TIME_RANGES  # 프로파일에 봇 모듈 import가 섞이지 않게 먼저
+
+    times = [t.strip() for t in args.times.split(",") if t.strip()] or ALL_TIME_CODES
+    if any(t not in TIME_RANGES for t in times):
+        parser.error(f"시간대는 {', '.join(ALL_TIME_CODES)} 중에서 고르세요")
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
+    result = replay(args.archive, [TIME_RANGES[t] for t in times], args.speed, args.seat, args.rank)
+    if profiler is not None:
+        profiler.disable()
+
+    print(f"기록 {result['records']}개 | 열차 {result['trains']}편 | 후보 {result['hits']}편 | "
+          f"예외 {result['errors'] or '-'} (녹화와 다름 {result['error_mismatch']})")
+    for phase in ("parse", "match"):
+        m = result[f"{phase}_ms"]
+        print(f"{phase:<6} p50 {m['p50']:8.3f}ms  p99 {m['p99']:8.3f}ms  합계 {m['total']:9.1f}ms")
+    print(f"digest {result['digest']} | {result['wall_sec']:.1f}s")
+    if profiler is not None:
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import math
+import time
+from email.utils import parsedate_to_datetime
+
+
+def _probe(session, url: str, timeout: float) -> tuple[float, float]:
+    """요청 한 번으로 얻는 오프셋 범위 [lo, hi). 서버는 요청을 보낸 뒤~응답 받기 전 사이에 Date를 찍는다."""
+    t0 = time.time()
+    resp = session.head(url, timeout=timeout, allow_redirects=False)
+    t1 = time.time()
+    resp.close()
+    date = resp.headers.get("Date")
+    if not date:
+        raise ValueError(f"Date 헤더 없음: {url}")
+    server = parsedate_to_datetime(date).timestamp()   # 초 단위로 잘린 서버 시각
+    return server - t1, server + 1 - t0
+
+
+def measure_offset(session, url: str, rounds: int = 6, timeout: float = 5.0) -> tuple[float, float]:
+    """로컬 시계와 서버 시계의 차이를 HTTP Date 헤더로 잰다 (블로킹, 약 rounds + 1초).
+
+    반환: (offset, bound) 초 — 서버 시각 ≈ time.time() + offset, 오차는 ±bound 이내.
+    Date 헤더는 1초 단위라, 먼저 0.1초 간격 요청으로 서버의 초가 바뀌는 순간을 0.1초 안쪽으로
+    좁히고, 이어서 다음 초 경계가 남은 범위의 한가운데 걸리도록 요청 시각을 맞춰 범위를
+    매번 반으로 줄인다. 정밀도는 결국 왕복 시간(RTT)에 묶인다.
+    """
+    lo, hi = -math.inf, math.inf
+    rtt = 0.0
+
+    def narrow(a, b):
+        nonlocal lo, hi
+        if max(lo, a) >= min(hi, b):
+            lo, hi = a, b   # 앞선 표본과 모순 (로드밸런서 뒤 서버 간 시계 차 등) → 최신 표본부터 다시
+        else:
+            lo, hi = max(lo, a), min(hi, b)
+
+    for _ in range(11):
+        t0 = time.perf_counter()
+        narrow(*_probe(session, url, timeout))
+        rtt = max(rtt, time.perf_counter() - t0)
+        time.sleep(0.1)
+
+    for _ in range(rounds):
+        mid = (lo + hi) / 2
+        boundary = math.floor(time.time() + mid) + 1          # 다음 서버 초 경계
+        send_at = boundary - mid - rtt / 2                     # 요청이 도착할 때 경계가 되도록
+        time.sleep(max(0.0, send_at - time.time()))
+        narrow(*_probe(session, url, timeout))
+    return (lo + hi) / 2, (hi - lo) / 2
@@ -11,6 +11,9 @@ DEP_STATION = os.getenv("DEP_STATION", "수서")
 ARR_STATION = os.getenv("ARR_STATION", "부산")
 DEP_DATE = os.getenv("DEP_DATE")
 DEP_TIME = os.getenv("DEP_TIME", "060000")
+DEP_TIMES = os.getenv("DEP_TIMES", "")
+SEAT_CLASS = os.getenv("SEAT_CLASS", "general_only")
+PAX = int(os.getenv("PAX", 1))
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
 CARD_NUMBER = os.getenv("CARD_NUMBER")
@@ -21,3 +24,44 @@ CARD_INSTALLMENT = int(os.getenv("CARD_INSTALLMENT", 0))
 REFRESH_MIN = int(os.getenv("REFRESH_INTERVAL_MIN", 3))
 REFRESH_MAX = int(os.getenv("REFRESH_INTERVAL_MAX", 10))
 MAX_ATTEMPTS = int(os.getenv("MAX_ATTEMPTS", 1000))
+MACRO_WORKERS = int(os.getenv("MACRO_WORKERS", 16))
+SEARCH_SHARE_SEC = float(os.getenv("SEARCH_SHARE_SEC", 2.0))
+SESSION_REFRESH_SEC = int(os.getenv("SESSION_REFRESH_SEC", 1500))
+SESSION_DIR = os.getenv("SESSION_DIR", ".sessions")
+MACRO_DB = os.getenv("MACRO_DB", "macros.db")
+TG_GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", 25))
+TG_CHAT_INTERVAL = float(os.getenv("TG_CHAT_INTERVAL", 1.0))
+# 0이면 조회 간격 계산이 0으로 나누므로 하한을 둔다 (분당 1회, 새벽 배율 1%)
+POLL_BUDGET_PER_MIN = max(1.0, float(os.getenv("POLL_BUDGET_PER_MIN", 20)))
+POLL_MAX_SEC = float(os.getenv("POLL_MAX_SEC", 60))
+POLL_QUIET_HOURS = os.getenv("POLL_QUIET_HOURS", "1-6")
+POLL_QUIET_FACTOR = max(0.01, float(os.getenv("POLL_QUIET_FACTOR", 0.3)))
+HISTORY_DIR = os.getenv("HISTORY_DIR", "history")
+HISTORY_STATS_DAYS = int(os.getenv("HISTORY_STATS_DAYS", 30))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+RESERVE_RACE = max(1, int(os.getenv("RESERVE_RACE", 2)))
+RESERVE_RANK = os.getenv("RESERVE_RANK", "departure")
+PAY_RETRIES = int(os.getenv("PAY_RETRIES", 3))
+PAY_RETRY_SEC = float(os.getenv("PAY_RETRY_SEC", 5))
+PAY_REMIND_SEC = float(os.getenv("PAY_REMIND_SEC", 30))
+PAY_REMIND_COUNT = int(os.getenv("PAY_REMIND_COUNT", 10))
+PAY_DEADLINE_SEC = float(os.getenv("PAY_DEADLINE_SEC", 600))
+START_PREP_SEC = float(os.getenv("START_PREP_SEC", 60))
+START_WARM_SEC = float(os.getenv("START_WARM_SEC", 15))
+GOVERNOR_RATE_PER_MIN = float(os.getenv("GOVERNOR_RATE_PER_MIN", 60))
+GOVERNOR_BURST = float(os.getenv("GOVERNOR_BURST", 6))
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8443))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_CERT = os.getenv("WEBHOOK_CERT", "")
+WEBHOOK_KEY = os.getenv("WEBHOOK_KEY", "")
+TENANT_KEY = os.getenv("TENANT_KEY", "")
+TENANT_KEY_FILE = os.getenv("TENANT_KEY_FILE", ".tenant.key")
+TENANT_MAX_MACROS = int(os.getenv("TENANT_MAX_MACROS", 4))
+TENANT_MAX_INFLIGHT = int(os.getenv("TENANT_MAX_INFLIGHT", 4))
+MACRO_PROCS = int(os.getenv("MACRO_PROCS", 0))
+WORKER_MACROS = int(os.getenv("WORKER_MACROS", 500))
+WORKER_LEASE_SEC = float(os.getenv("WORKER_LEASE_SEC", 15))
+CAPTURE_DIR = os.getenv("CAPTURE_DIR", "")
@@ -0,0 +1,153 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class MacroEngine:
+    """모든 매크로를 봇 이벤트 루프 위의 태스크로 실행하는 엔진.
+
+    SRT/코레일 클라이언트는 동기식이므로 블로킹 호출은 크기가 고정된
+    스레드풀에서만 실행한다. 매크로 수가 늘어도 스레드 수는 max_workers를 넘지 않는다.
+
+    대기와 중지는 매크로별 asyncio.Event로 처리한다. 쉬고 있는 매크로는 루프의
+    타이머 하나(단조 시계)만 차지하고, stop()은 대기 중인 sleep/조회를 즉시 깨운다.
+    """
+
+    def __init__(self, max_workers: int):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="macro-io")
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._stops: dict[str, asyncio.Event] = {}
+        self._cleanups: set[asyncio.Task] = set()
+
+    def start(self, key: str, coro) -> asyncio.Task:
+        """매크로 코루틴을 태스크로 등록한다. 같은 key의 이전 태스크는 교체된다."""
+        self._stops[key] = asyncio.Event()
+        task = asyncio.get_running_loop().create_task(coro, name=f"macro:{key}")
+        self._tasks[key] = task
+        task.add_done_callback(functools.partial(self._on_done, key))
+        return task
+
+    def _on_done(self, key: str, task: asyncio.Task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+            self._stops.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"매크로 태스크 비정상 종료: {key}", exc_info=task.exception())
+
+    def is_running(self, key: str) -> bool:
+        task = self._tasks.get(key)
+        return task is not None and not task.done()
+
+    def active_count(self) -> int:
+        return len(self._tasks)
+
+    def active_keys(self) -> list[str]:
+        return list(self._tasks)
+
+    def cancel(self, key: str):
+        """중지와 달리 매크로를 끝내지 않고 태스크만 취소한다 (다른 워커가 이어 실행할 때)"""
+        task = self._tasks.get(key)
+        if task is not None:
+            task.cancel()
+
+    # ── 중지 / 타이머 ──
+
+    def stop(self, key: str) -> bool:
+        """매크로에 중지 신호. 대기 중이던 sleep()·unless_stopped()가 즉시 반환된다."""
+        event = self._stops.get(key)
+        if event is None or event.is_set():
+            return False
+        event.set()
+        return True
+
+    def stopped(self, key: str) -> bool:
+        event = self._stops.get(key)
+        return event is None or event.is_set()
+
+    async def sleep(self, key: str, seconds: float) -> bool:
+        """seconds 동안 대기. 중지되면 즉시 False, 시간이 다 되면 True."""
+        event = self._stops.get(key)
+        if event is None or event.is_set():
+            return False
+        try:
+            await asyncio.wait_for(event.wait(), timeout=max(0.0, seconds))
+        except asyncio.TimeoutError:
+            return True
+        return False
+
+    async def unless_stopped(self, key: str, coro):
+        """coro를 기다리되 먼저 중지되면 coro를 취소한다. 반환: (완료 여부, 결과)"""
+        event = self._stops.get(key)
+        task = asyncio.ensure_future(coro)
+        if event is None:
+            return True, await task
+        waiter = asyncio.ensure_future(event.wait())
+        try:
+            await asyncio.wait({task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            waiter.cancel()
+        if task.done():
+            return True, task.result()
+        task.cancel()
+        return False, None
+
+    async def first_success(self, coros: list, rollback) -> tuple[object | None, list[Exception]]:
+        """coros를 동시에 실행해 가장 먼저 성공한 결과를 반환. 반환: (결과 또는 None, 실패 예외 목록)
+
+        스레드풀 호출은 중간에 멈출 수 없으므로 남은 시도는 취소하지 않고 백그라운드에서
+        끝까지 기다렸다가, 성공한 결과를 rollback(result) 코루틴으로 되돌린다.
+        동시에 끝난 성공이 여럿이면 coros 순서(우선순위)가 앞선 것을 고른다.
+        """
+        tasks = [asyncio.ensure_future(c) for c in coros]
+        pending = set(tasks)
+        winner, errors = None, []
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in (t for t in tasks if t in done):
+                    if task.exception() is not None:
+                        errors.append(task.exception())
+                    elif winner is None:
+                        winner = task
+                    else:
+                        pending.add(task)  # 함께 성공한 나머지 → 되돌림
+        finally:
+            # 매크로가 취소되어도 이미 나간 요청의 결과는 되돌린다
+            if pending:
+                cleanup = asyncio.get_running_loop().create_task(self._roll_back(pending, rollback))
+                self._cleanups.add(cleanup)
+                cleanup.add_done_callback(self._cleanups.discard)
+        return (winner.result() if winner else None), errors
+
+    @staticmethod
+    async def _roll_back(tasks, rollback):
+        for task in tasks:
+            try:
+                result = await task
+            except Exception:
+                continue
+            try:
+                await rollback(result)
+            except Exception as e:
+                logger.error(f"되돌리기 실패: {e}")
+
+    async def run_blocking(self, fn, *args, **kwargs):
+        """동기 함수를 공용 스레드풀에서 실행하고 결과를 기다린다."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    async def shutdown(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._cleanups:
+            # 되돌리기(예약 취소 등)는 스레드풀을 닫기 전에 끝낼 기회를 준다
+            await asyncio.wait(self._cleanups, timeout=10)
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,110 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+RESERVE = 0     # 예약 — 항상 조회보다 먼저
+SEARCH = 1
+
+# 제한 대상 클라이언트 메서드 (SRT·코레일 공통 이름)
+GOVERNED = {"search_train": SEARCH, "reserve": RESERVE}
+
+# 지금 호출하는 매크로 — 매크로 태스크(run_macro) 안에서 설정하면 그 태스크가 만든 하위 태스크까지 이어진다
+current_macro: contextvars.ContextVar[str] = contextvars.ContextVar("current_macro", default="")
+
+
+class _Bucket:
+    """계정 하나의 토큰 버킷과 대기열. 예약 대기열이 비어야 조회 대기열을 꺼낸다."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.reserves: list = []        # (순번, future)
+        self.searches: list = []        # (가상 종료 시각, 순번, future)
+        self.vtime = 0.0                # 마지막으로 내보낸 조회의 가상 종료 시각
+        self.finish: dict[str, float] = {}  # 매크로 → 마지막 가상 종료 시각
+        self.timer: asyncio.TimerHandle | None = None
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def waiting(self) -> int:
+        return len(self.reserves) + len(self.searches)
+
+
+class Governor:
+    """(제공자, 계정)별 토큰 버킷으로 업스트림 호출(search_train·reserve) 총량을 묶는다.
+
+    PollController가 매크로마다 조회 간격을 정한다면, 이쪽은 매크로 수와 상관없이 계정의
+    호출률이 rate_per_min(순간 burst)을 넘지 않게 하는 상한이다. 토큰이 모자라 기다리는
+    호출은 예약이 먼저, 조회는 매크로 가중치(weight_of)에 따른 가중 공정 큐(WFQ) 순서로
+    내보낸다 — 한 매크로가 호출을 쏟아내도 다른 매크로의 몫을 빼앗지 못한다.
+    """
+
+    def __init__(self, rate_per_min: float, burst: float, weight_of=None, metrics=None):
+        self._rate = rate_per_min / 60.0
+        self._burst = max(1.0, burst)
+        self._weight_of = weight_of     # 매크로 키 → 가중치 (없거나 0 이하면 1)
+        self._metrics = metrics
+        self._buckets: dict[tuple[str, str], _Bucket] = {}
+        self._seq = itertools.count()
+
+    def waiting(self) -> int:
+        return sum(b.waiting() for b in self._buckets.values())
+
+    async def acquire(self, account: tuple[str, str], kind: int):
+        """토큰 하나를 얻을 때까지 대기. account = (열차, 계정 ID)"""
+        bucket = self._buckets.get(account)
+        if bucket is None:
+            bucket = self._buckets[account] = _Bucket(self._rate, self._burst)
+        now = time.monotonic()
+        bucket.refill(now)
+        if bucket.tokens >= 1 and not bucket.waiting():
+            bucket.tokens -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        if kind == RESERVE:
+            heapq.heappush(bucket.reserves, (next(self._seq), future))
+        else:
+            macro = current_macro.get()
+            weight = (self._weight_of(macro) if self._weight_of and macro else 0) or 1.0
+            start = max(bucket.vtime, bucket.finish.get(macro, 0.0))
+            bucket.finish[macro] = tag = start + 1.0 / weight
+            heapq.heappush(bucket.searches, (tag, next(self._seq), future))
+        if bucket.timer is None:
+            self._pump(bucket)
+        try:
+            await future
+        finally:
+            if self._metrics is not None:
+                self._metrics.observe("governor", account[0], time.monotonic() - now, current_macro.get())
+
+    def _pump(self, bucket: _Bucket):
+        bucket.timer = None
+        bucket.refill(time.monotonic())
+        while bucket.tokens >= 1:
+            if bucket.reserves:
+                _, future = heapq.heappop(bucket.reserves)
+            elif bucket.searches:
+                tag, _, future = heapq.heappop(bucket.searches)
+                bucket.vtime = tag
+            else:
+                break
+            if future.done():
+                continue  # 기다리다 취소된 호출 (매크로 중지 등)
+            future.set_result(None)
+            bucket.tokens -= 1
+        if not bucket.waiting():
+            # 한가해지면 가상 시각 기록을 비워 오래 쉰 매크로가 밀린 몫을 한꺼번에 쓰지 않게
+            bucket.finish.clear()
+        elif bucket.timer is None:
+            delay = (1 - bucket.tokens) / bucket.rate
+            bucket.timer = asyncio.get_running_loop().call_later(delay, self._pump, bucket)
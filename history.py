@@ -0,0 +1,332 @@
+import json
+import logging
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from matcher import SEAT_PREDICATES, TRAIN_NUMBER
+
+logger = logging.getLogger(__name__)
+
+# 레코드 하나 = 조회 스냅샷 속 열차 하나 (12바이트 고정폭, 리틀엔디언)
+#   H  time2     기록 시각 (자정 이후 초 / 2)
+#   H  train_no  열차번호
+#   H  dep_min   출발 시각 (자정 이후 분)
+#   B  days      출발일 - 기록일 (일, 최대 255)
+#   B  slot      출발 시 << 3 | 상태 비트 (OPEN / OPENED / CLOSED)
+#   H  open_sec  CLOSED 레코드: 좌석이 열려 있던 시간(초, 최대 65535)
+#   B  seats     GENERAL | SPECIAL
+#   x  (패딩)
+RECORD = struct.Struct("<HHHBBHBx")
+_SLOT_OFFSET = 7
+_OPEN_SEC = struct.Struct("<H")
+_OPEN_SEC_OFFSET = 8
+_DAYS_OFFSET = 6
+
+OPEN = 1      # 잔여석 있음
+OPENED = 2    # 직전 스냅샷에는 없다가 생김
+CLOSED = 4    # 직전 스냅샷에는 있다가 없어짐
+GENERAL = 1
+SPECIAL = 2
+
+# .sum 집계 형식 — 바뀌면 예전 .sum은 다시 만든다
+_SUM_VERSION = 2
+
+
+def route_name(train: str, dep: str, arr: str) -> str:
+    return f"{train}_{dep}_{arr}"
+
+
+class HistoryStore:
+    """조회 스냅샷을 날짜별 폴더, 노선별 파일에 고정폭 레코드로 덧붙여 기록한다.
+
+    업스트림 조회 결과만 기록하므로(SearchHub 공유분 제외) 같은 스냅샷이 두 번 쌓이지 않는다.
+    열차별 직전 상태를 메모리에 들고 있다가 좌석이 생기고 없어지는 순간을 상태 비트로 남겨,
+    조회 시에는 파일을 mmap으로 열어 slot 열만 잘라 세면 된다.
+
+    record()는 대기열에 넣기만 하고, 파일 쓰기·flush·날짜가 바뀔 때의 집계(.sum)는 기록
+    스레드가 맡는다 — 조회 루프(이벤트 루프)에 디스크 지연이 끼지 않는다.
+    """
+
+    def __init__(self, base_dir: str):
+        self._dir = base_dir
+        self._files: dict[str, object] = {}         # 경로 → 열린 파일
+        self._day = None
+        self._last: dict[tuple, tuple[bool, float]] = {}  # (노선, 출발일, 열차번호) → (열림 여부, 시각)
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._writer: threading.Thread | None = None
+        self._writer_lock = threading.Lock()
+
+    # ── 기록 ──
+
+    def record(self, train: str, dep: str, arr: str, date_str: str, trains: list):
+        """조회 결과 하나를 기록 대기열에 넣는다. trains는 수정하지 않으므로 공유 결과를 그대로 넘겨도 된다."""
+        if not trains:
+            return
+        if self._writer is None:
+            with self._writer_lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+                    self._writer.start()
+        self._queue.put((time.time(), train, dep, arr, date_str, trains))
+
+    def _write_loop(self):
+        # 지난 날짜 중 집계가 없는 파일 (이 프로세스가 쓰지 않았거나 날짜가 바뀔 때 꺼져 있던 경우)
+        self._seal_days(datetime.now().strftime("%Y%m%d"))
+        while True:
+            item = self._queue.get()
+            stop = item is None
+            batch = [] if stop else [item]
+            while not stop:  # 쌓인 만큼 한꺼번에 쓰고 flush는 파일마다 한 번
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                stop = item is None
+                if not stop:
+                    batch.append(item)
+            touched = {}
+            for item in batch:
+                try:
+                    f = self._append(*item)
+                except Exception as e:
+                    logger.warning(f"조회 기록 실패 ({route_name(*item[1:4])}): {e}")
+                    continue
+                if f is not None:
+                    touched[id(f)] = f
+            for f in touched.values():
+                try:
+                    f.flush()
+                except OSError as e:
+                    logger.warning(f"조회 기록 실패: {e}")
+            if stop:
+                return
+
+    def _append(self, now: float, train: str, dep: str, arr: str, date_str: str, trains: list):
+        today = datetime.fromtimestamp(now)
+        day = today.strftime("%Y%m%d")
+        if day != self._day:
+            self._rotate(day)
+        route = route_name(train, dep, arr)
+        days = min(255, max(0, (datetime.strptime(date_str, "%Y%m%d") - today.replace(
+            hour=0, minute=0, second=0, microsecond=0)).days))
+        time2 = (today.hour * 3600 + today.minute * 60 + today.second) // 2
+        preds = SEAT_PREDICATES[train]
+        general, special, number_of = preds["general_only"], preds["special_only"], TRAIN_NUMBER[train]
+
+        buf = bytearray()
+        for t in trains:
+            try:
+                no = int(number_of(t)) & 0xFFFF
+            except (TypeError, ValueError):
+                no = 0
+            hour, minute = int(t.dep_time[:2]), int(t.dep_time[2:4])
+            seats = (GENERAL if general(t) else 0) | (SPECIAL if special(t) else 0)
+            is_open = bool(seats)
+            state, open_sec = OPEN if is_open else 0, 0
+            key = (route, date_str, no)
+            prev = self._last.get(key)
+            if prev is not None and prev[0] != is_open:
+                if is_open:
+                    state |= OPENED
+                else:
+                    state |= CLOSED
+                    open_sec = min(0xFFFF, int(now - prev[1]))
+            if prev is None or prev[0] != is_open:
+                self._last[key] = (is_open, now)
+            buf += RECORD.pack(time2, no, hour * 60 + minute, days, hour << 3 | state, open_sec, seats)
+
+        try:
+            f = self._open(os.path.join(self._dir, day, route + ".bin"))
+            f.write(buf)
+        except OSError as e:
+            logger.warning(f"조회 기록 실패 ({route}): {e}")
+            return None
+        return f
+
+    def _open(self, path: str):
+        f = self._files.get(path)
+        if f is None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            f = self._files[path] = open(path, "ab")
+        return f
+
+    def _rotate(self, day: str):
+        """날짜가 바뀌면 어제 파일을 닫아 집계(.sum)를 만들고, 이미 떠난 열차의 직전 상태를 버린다"""
+        rolled = self._day is not None
+        self._close_files()
+        self._day = day
+        self._last = {k: v for k, v in self._last.items() if k[1] >= day}
+        if rolled:
+            self._seal_days(day)  # 다른 프로세스(매크로 워커)가 쓴 노선도 함께
+
+    def _seal_days(self, today: str):
+        """today 이전 날짜 파일 중 .sum이 없거나 파일보다 오래된 것을 집계해 둔다 — 첫 /stats가 느리지 않게"""
+        try:
+            days = [d for d in os.listdir(self._dir) if d.isdigit() and d < today]
+        except FileNotFoundError:
+            return
+        for d in sorted(days):
+            try:
+                names = os.listdir(os.path.join(self._dir, d))
+            except OSError:
+                continue
+            for name in names:
+                if not name.endswith(".bin"):
+                    continue
+                path = os.path.join(self._dir, d, name)
+                if not _sealed(path):
+                    _summary(path, final=True)
+
+    def close(self):
+        """대기열에 남은 기록을 모두 쓰고 파일을 닫는다"""
+        with self._writer_lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            self._queue.put(None)
+            writer.join()
+        self._close_files()
+
+    def _close_files(self):
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+
+    # ── 조회 ──
+
+    def stats(self, train: str, dep: str, arr: str, days: int) -> dict:
+        """최근 days일 동안 노선의 출발 시각별 관측 수·잔여석 비율·좌석이 생긴 횟수·유지 시간"""
+        route = route_name(train, dep, arr)
+        observed, opened = [0] * 24, [0] * 24
+        appeared, held = [0] * 24, [[] for _ in range(24)]
+        records = 0
+        today = datetime.now()
+        for back in range(days):
+            path = os.path.join(self._dir, (today - timedelta(days=back)).strftime("%Y%m%d"), route + ".bin")
+            day = _summary(path, final=back > 0)
+            if day is None:
+                continue
+            records += day["records"]
+            for h in range(24):
+                observed[h] += day["observed"][h]
+                opened[h] += day["opened"][h]
+                appeared[h] += day["appeared"][h]
+                held[h].extend(day["held"][h])
+        return {
+            "records": records,
+            "hours": [
+                {
+                    "hour": h,
+                    "observed": observed[h],
+                    "open_ratio": opened[h] / observed[h],
+                    "appeared": appeared[h],
+                    "median_open_sec": sorted(held[h])[len(held[h]) // 2] if held[h] else None,
+                }
+                for h in range(24) if observed[h]
+            ],
+        }
+
+    def appeared(self, train: str, dep: str, arr: str, dates: list[str], hours: set[int], days: int) -> dict[str, int]:
+        """최근 days일 기록에서 출발일별로 좌석이 생긴 횟수 (hours 시간대만) — 날짜마다 취소표가 얼마나 도는지.
+        지난 날짜는 .sum 집계만 읽고 오늘 파일만 훑는다."""
+        route = route_name(train, dep, arr)
+        counts = dict.fromkeys(dates, 0)
+        today = datetime.now()
+        for back in range(days):
+            path = os.path.join(self._dir, (today - timedelta(days=back)).strftime("%Y%m%d"), route + ".bin")
+            day = _summary(path, final=back > 0)
+            if day is None:
+                continue
+            for date_str, by_hour in day["departures"].items():
+                if date_str in counts:
+                    counts[date_str] += sum(by_hour[h] for h in hours)
+        return counts
+
+    def routes(self, days: int) -> list[str]:
+        """최근 days일 동안 기록이 있는 노선 이름"""
+        found = set()
+        today = datetime.now()
+        for back in range(days):
+            try:
+                names = os.listdir(os.path.join(self._dir, (today - timedelta(days=back)).strftime("%Y%m%d")))
+            except FileNotFoundError:
+                continue
+            found.update(n[:-4] for n in names if n.endswith(".bin"))
+        return sorted(found)
+
+
+def _scan(path: str) -> dict | None:
+    """하루치 노선 파일을 mmap으로 열어 slot 열만 잘라 집계"""
+    observed, opened, appeared = [0] * 24, [0] * 24, [0] * 24
+    held = [[] for _ in range(24)]
+    departures: dict[str, list[int]] = {}   # 출발일 → 시간대별 좌석이 생긴 횟수 (appeared())
+    recorded = datetime.strptime(os.path.basename(os.path.dirname(path)), "%Y%m%d")
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            n = len(mm) // RECORD.size
+            slots = mm[_SLOT_OFFSET:n * RECORD.size:RECORD.size]
+            for slot, count in Counter(slots).items():
+                hour, state = slot >> 3, slot & 7
+                observed[hour] += count
+                if state & OPEN:
+                    opened[hour] += count
+                if state & OPENED:
+                    appeared[hour] += count
+            # CLOSED 레코드는 드물어 해당 바이트만 찾아가며 유지 시간을 읽는다
+            for hour in range(24):
+                marker = bytes([hour << 3 | CLOSED])
+                i = slots.find(marker)
+                while i >= 0:
+                    held[hour].append(_OPEN_SEC.unpack_from(mm, i * RECORD.size + _OPEN_SEC_OFFSET)[0])
+                    i = slots.find(marker, i + 1)
+                # OPENED도 드물다 — 출발일(days 열)만 읽어 출발일별로 센다
+                marker = bytes([hour << 3 | OPEN | OPENED])
+                i = slots.find(marker)
+                while i >= 0:
+                    date_str = (recorded + timedelta(days=mm[i * RECORD.size + _DAYS_OFFSET])).strftime("%Y%m%d")
+                    departures.setdefault(date_str, [0] * 24)[hour] += 1
+                    i = slots.find(marker, i + 1)
+    except (FileNotFoundError, ValueError):
+        return None  # 기록 없는 날 / 빈 파일
+    return {"version": _SUM_VERSION, "records": n, "size": n * RECORD.size, "observed": observed,
+            "opened": opened, "appeared": appeared, "held": held, "departures": departures}
+
+
+def _sealed(path: str) -> bool:
+    """.sum이 파일보다 새롭고 지금 형식인지 — 집계 전체를 읽지 않고 앞부분만 본다"""
+    sum_path = path[:-4] + ".sum"
+    try:
+        if os.path.getmtime(sum_path) < os.path.getmtime(path):
+            return False
+        with open(sum_path, encoding="utf-8") as f:
+            return f.read(32).startswith(f'{{"version": {_SUM_VERSION},')
+    except OSError:
+        return False
+
+
+def _summary(path: str, final: bool) -> dict | None:
+    """지난 날짜 파일은 더 늘지 않으므로 집계를 옆에 .sum으로 저장해 다음부터 파일을 다시 읽지 않는다"""
+    sum_path = path[:-4] + ".sum"
+    if final:
+        try:
+            with open(sum_path, encoding="utf-8") as f:
+                day = json.load(f)
+            if day.get("version") == _SUM_VERSION and day["size"] == os.path.getsize(path) // RECORD.size * RECORD.size:
+                return day
+        except (OSError, ValueError, KeyError):
+            pass
+    day = _scan(path)
+    if day is not None and final:
+        tmp = f"{sum_path}.{os.getpid()}.tmp"  # 봇과 매크로 워커가 같은 날을 동시에 집계해도 겹치지 않게
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(day, f)
+            os.replace(tmp, sum_path)
+        except OSError as e:
+            logger.warning(f"조회 기록 집계 저장 실패 ({sum_path}): {e}")
+    return day
@@ -0,0 +1,472 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+from config import (
+    REFRESH_MIN,
+    REFRESH_MAX,
+    MAX_ATTEMPTS,
+    MACRO_WORKERS,
+    SEARCH_SHARE_SEC,
+    SESSION_REFRESH_SEC,
+    SESSION_DIR,
+    POLL_BUDGET_PER_MIN,
+    POLL_MAX_SEC,
+    POLL_QUIET_HOURS,
+    POLL_QUIET_FACTOR,
+    HISTORY_DIR,
+    CAPTURE_DIR,
+    HISTORY_STATS_DAYS,
+    RESERVE_RACE,
+    RESERVE_RANK,
+    START_PREP_SEC,
+    START_WARM_SEC,
+    GOVERNOR_RATE_PER_MIN,
+    GOVERNOR_BURST,
+    TENANT_MAX_INFLIGHT,
+)
+from engine import MacroEngine
+from governor import Governor, current_macro
+from capture import Recorder
+from history import HistoryStore
+from matcher import SEAT_PREDICATES, compile_plan
+from metrics import Metrics
+from outbox import ALERT, INFO, RESULT
+from pacing import FixedPacing, PollController, parse_hours
+from planner import plan_windows
+from providers import PROVIDERS, Provider, fetch_window
+from search import SearchHub, search_key
+from session import LoginFailed, SessionPool
+
+logger = logging.getLogger(__name__)
+
+# ════════════════════════════ 조회 조건 ════════════════════════════
+
+TIME_SLOTS = [
+    ("새벽 00~06", "000000"),
+    ("오전 06~09", "060000"),
+    ("오전 09~12", "090000"),
+    ("오후 12~15", "120000"),
+    ("오후 15~18", "150000"),
+    ("저녁 18~21", "180000"),
+    ("야간 21~24", "210000"),
+]
+
+ALL_TIME_CODES = [code for _, code in TIME_SLOTS]
+
+# 각 시간대의 시작~끝 (HHMMSS)
+TIME_RANGES = {
+    "000000": (0, 6),
+    "060000": (6, 9),
+    "090000": (9, 12),
+    "120000": (12, 15),
+    "150000": (15, 18),
+    "180000": (18, 21),
+    "210000": (21, 24),
+}
+
+WEEKDAYS = ["월", "화", "수", "목", "금", "토", "일"]
+
+
+def new_state(key: str, train: str, direction: str, dep: str, arr: str, date_str: str, time_codes: list[str],
+              pax: int, seat: str, dates: list[str] | None = None, start_at: float | None = None) -> dict:
+    """매크로 상태 (MacroStore에 JSON으로 저장된다). dep·arr는 "수서+동탄" 같은 대체역 묶음일 수 있다."""
+    deps, arrs = dep.split("+"), arr.split("+")
+    return {
+        "running": True,
+        "train": train,
+        "direction": direction,
+        "dep": deps[0],
+        "arr": arrs[0],
+        "deps": deps if len(deps) > 1 else None,  # 대체역 묶음 (노선 조합을 모두 조회)
+        "arrs": arrs if len(arrs) > 1 else None,
+        "date": date_str,               # 여러 날짜면 가장 이른 날짜
+        "dates": dates,                 # 여러 날짜 (편도)
+        "time_codes": time_codes,       # 복수 시간대 (조회 구간은 planner가 계산)
+        "pax": pax,
+        "seat": seat,
+        "attempt": 0,
+        "rank": RESERVE_RANK,           # 예약 후보 우선순위 (matcher.RANKINGS)
+        "start_at": start_at,           # 첫 조회 시각 (서버 시각 epoch, 없으면 바로)
+        "key": key,
+    }
+
+
+def macro_tag(state: dict) -> str:
+    """알림 머리말 — 이름이 있는 매크로(배치 작업)는 이름으로"""
+    if state.get("name"):
+        return f"[{state['name']}]"
+    dir_kr = "가는편" if state["direction"] == "go" else "오는편"
+    return f"[{state['train'].upper()} {dir_kr}]"
+
+
+def fmt_date(d: datetime) -> str:
+    return f"{d.month}/{d.day}({WEEKDAYS[d.weekday()]})"
+
+
+def dates_summary(dates: list[str]) -> str:
+    return ", ".join(fmt_date(datetime.strptime(d, "%Y%m%d")) for d in dates)
+
+
+def fmt_start(ts: float) -> str:
+    d = datetime.fromtimestamp(ts)
+    return f"{fmt_date(d)} {d.strftime('%H:%M:%S')}"
+
+
+def parse_start(text: str, now: datetime) -> float | None:
+    """"HH:MM" / "HH:MM:SS" / "HH:MM:SS.fff" → 다음에 오는 그 시각 (epoch 초)"""
+    for fmt in ("%H:%M", "%H:%M:%S", "%H:%M:%S.%f"):
+        try:
+            t = datetime.strptime(text.strip(), fmt)
+        except ValueError:
+            continue
+        at = now.replace(hour=t.hour, minute=t.minute, second=t.second, microsecond=t.microsecond)
+        if at <= now:
+            at += timedelta(days=1)
+        return at.timestamp()
+    return None
+
+
+def route_desc(state: dict) -> str:
+    return f"{'·'.join(state.get('deps') or [state['dep']])}→{'·'.join(state.get('arrs') or [state['arr']])}"
+
+
+def times_summary(selected: set) -> str:
+    """선택한 시간대를 요약 문자열로."""
+    if selected == set(ALL_TIME_CODES):
+        return "전체 (00~24시)"
+    labels = []
+    for label, code in TIME_SLOTS:
+        if code in selected:
+            labels.append(label)
+    return ", ".join(labels) if labels else "미선택"
+
+
+# ════════════════════════════ 실행 환경 ════════════════════════════
+
+
+class Runtime(NamedTuple):
+    """매크로가 함께 쓰는 객체들 — 봇·CLI·배치 실행기가 각자 만들어 넘긴다"""
+    engine: MacroEngine
+    sessions: SessionPool
+    searches: SearchHub
+    pacing: PollController
+    metrics: Metrics
+    history: HistoryStore | None = None
+    store: object | None = None     # MacroStore (진행 상태 기록, 없으면 기록 안 함)
+
+
+def standalone(fixed: bool = False) -> Runtime:
+    """봇 없이 실행할 때의 Runtime. 설정은 봇과 같은 환경변수를 쓴다.
+
+    배치 실행기는 봇과 같이 계정별 조회 예산(POLL_*)·호출 상한·조회 기록을 쓰고,
+    fixed(CLI)면 예전처럼 REFRESH_INTERVAL_MIN~MAX초 고정 간격으로 조회하며 호출 상한·조회 기록이 없다.
+    """
+    engine = MacroEngine(MACRO_WORKERS)
+    metrics = Metrics()
+    if fixed:
+        pacing, governor, history = FixedPacing(REFRESH_MIN, REFRESH_MAX), None, None
+    else:
+        pacing = PollController(
+            POLL_BUDGET_PER_MIN, REFRESH_MIN, POLL_MAX_SEC, parse_hours(POLL_QUIET_HOURS), POLL_QUIET_FACTOR)
+        governor = (Governor(GOVERNOR_RATE_PER_MIN, GOVERNOR_BURST, pacing.weight, metrics)
+                    if GOVERNOR_RATE_PER_MIN > 0 else None)
+        history = HistoryStore(HISTORY_DIR) if HISTORY_DIR else None
+    sessions = SessionPool(engine, SESSION_REFRESH_SEC, MACRO_WORKERS, SESSION_DIR or None, metrics, governor,
+                           TENANT_MAX_INFLIGHT, Recorder.open(CAPTURE_DIR) if CAPTURE_DIR else None)
+    return Runtime(engine, sessions, SearchHub(SEARCH_SHARE_SEC), pacing, metrics, history)
+
+
+class Reporter:
+    """매크로 진행·결과를 알리는 곳. 기본은 로그만 — 봇은 텔레그램, CLI는 콘솔로 바꿔 쓴다."""
+
+    def send(self, text: str, priority: int = INFO, parse_mode: str | None = None):
+        logger.info(text)
+
+    def status(self, text: str):
+        """진행 상황 (봇은 매크로별 메시지 하나를 수정)"""
+        logger.info(text)
+
+    def booked(self, provider: Provider, reservation, info: dict) -> bool:
+        """예약 확정. 결제까지 넘겨받았으면 True — False면 앱 결제 안내를 보낸다."""
+        return False
+
+
+# ════════════════════════════ 매크로 실행 ════════════════════════════
+
+
+async def run(rt: Runtime, state: dict, account, report: Reporter):
+    """매크로 하나를 예약 성공·중지·시도 소진까지 실행한다. account: session.ProviderSession"""
+    current_macro.set(state["key"])  # 호출 상한(Governor)의 매크로별 공정 배분용
+    try:
+        await _run(rt, state, account, report)
+    finally:
+        rt.pacing.leave(state["key"])
+
+
+async def _run(rt: Runtime, state: dict, account, report: Reporter):
+    engine, pacing, metrics, history = rt.engine, rt.pacing, rt.metrics, rt.history
+    train = state["train"]
+    provider = PROVIDERS[train]
+    dates = state.get("dates") or [state["date"]]
+    # 조회 대상 = 출발일 × 출발역 × 도착역 (대체역 묶음이면 노선 조합 전부, 한 예산 안에서 번갈아 조회)
+    routes = [(d, a) for d in state.get("deps") or [state["dep"]] for a in state.get("arrs") or [state["arr"]] if d != a]
+    targets = [(date_str, d, a) for date_str in dates for d, a in routes]
+    route = route_desc(state)
+    time_codes = state["time_codes"]
+    hour_ranges = [TIME_RANGES[c] for c in time_codes]
+    windows = plan_windows(hour_ranges)
+    pax = state["pax"]
+    seat_code = state["seat"]
+    key = state["key"]
+    tag = macro_tag(state)
+
+    def progress(attempt: int):
+        if rt.store is not None:
+            rt.store.progress(key, attempt, time.time())
+
+    # ── 초기 로그인 (같은 계정의 다른 매크로와 세션 공유) ──
+    try:
+        await account.ready()
+    except Exception as e:
+        report.send(f"❌ {tag} 로그인 실패: {e}", ALERT)
+        state["running"] = False
+        return
+
+    # 열차 필터는 시작 시 한 번만 컴파일 (시간대 비트맵 + 좌석 판정 + 열차번호 허용/제외)
+    plan = compile_plan(train, hour_ranges, seat_code, state.get("train_allow"), state.get("train_deny"),
+                        state.get("rank", RESERVE_RANK), state.get("dep_after"))
+    any_seat = SEAT_PREDICATES[train]["all"]
+    time_desc = times_summary(set(time_codes))
+
+    # 날짜·노선별 과거 좌석 발생 횟수 → 변동이 잦았던 대상에 조회를 더 배분 (대상이 하나여도 매크로
+    # 가중치가 되어 같은 계정의 다른 매크로와 예산을 나눌 때 반영). 기록 읽기는 첫 조회를 늦추지 않게
+    # 백그라운드로 — 예약 시작 대기 중이면 그동안 끝나고, 아니면 끝나는 대로 pacing에 들어간다.
+    churn = None
+    if history is not None:
+        churn = asyncio.get_running_loop().create_task(_load_churn(rt, tag, train, routes, dates, hour_ranges))
+
+    # ── 예약 시작: 정해진 시각까지 로그인·연결 예열·시계 오차 측정을 끝내고 정각에 첫 조회 ──
+    fresh_since = None
+    start_at = state.get("start_at")
+    if start_at and start_at > time.time():
+        report.status(f"⏰ {tag} 로그인 성공 — {fmt_start(start_at)} 조회 시작 예약\n{route} | {time_desc}")
+        if not await wait_for_start(rt, key, tag, account, start_at, report):
+            report.send(f"⏹ {tag} 예약 시작 전 중지됨")
+            return
+        fresh_since = time.monotonic()
+
+    pacing.join(key, (train, account.account_id), targets, hour_ranges, len(windows))
+    if len(dates) > 1:
+        time_desc = f"{dates_summary(dates)} | {time_desc}"
+    if churn is not None:
+        churn.add_done_callback(lambda t: t.cancelled() or pacing.set_history(key, t.result()))
+
+    if fresh_since is None:  # 예약 시작은 준비 완료 메시지로 갈음 (정각 직후 발송 큐를 비워 둠)
+        if state["attempt"]:
+            report.status(f"♻️ {tag} 재시작 후 매크로 재개 (#{state['attempt']})\n{route} | {time_desc}")
+        else:
+            report.status(f"✅ {tag} 로그인 성공\n{route} | {time_desc}\n조회 시작!")
+
+    started = time.time()
+
+    # ── 업스트림 조회 (구간별로 SearchHub가 같은 키의 다른 매크로와 공유) ──
+    async def fetch(target, window):
+        date_str, dep, arr = target
+        with metrics.timed("search", train, key):
+            result = await fetch_window(account, train, dep, arr, date_str, window, pax)
+        if history is not None:
+            history.record(train, dep, arr, date_str, result.trains)
+        return result
+
+    async def search_all(target, verbose: bool, since: float | None = None) -> tuple[list, int]:
+        date_str, dep, arr = target
+        found, calls = [], 0
+        for window in windows:
+            result = await rt.searches.search(
+                search_key(train, dep, arr, date_str, window, pax),
+                lambda w=window: fetch(target, w),
+                since,
+            )
+            if verbose:
+                logger.info(f"{tag} 조회 구간 {window[0][:2]}~{window[1][:2]}시: 호출별 기여 열차 {result.calls}")
+            found.extend(result.trains)
+            calls += len(result.calls)
+        return found, calls
+
+    # ── 예약 (동시 시도용) ──
+    async def reserve(t):
+        with metrics.timed("reserve", train, key):
+            reservation = await provider.reserve(account, t, pax, seat_code)
+        return t, reservation
+
+    async def roll_back(booked):
+        """동시 시도 중 늦게 확정된 예약은 취소해 좌석을 돌려놓는다"""
+        t, reservation = booked
+        res_num = provider.reservation_number(reservation)
+        try:
+            with metrics.timed("rollback", train, key):
+                await account.call("cancel", reservation)
+            logger.info(f"{tag} 추가 예약 취소: {res_num}")
+        except Exception as e:
+            report.send(f"⚠️ {tag} 중복 예약 취소 실패 — 예약번호 {res_num}, 앱에서 취소하세요! ({e})", ALERT)
+
+    # ── 반복 조회 ──
+    first_attempt = state["attempt"] + 1
+    for attempt in range(first_attempt, MAX_ATTEMPTS + 1):
+        if not state["running"]:
+            report.send(f"⏹ {tag} 매크로 중지됨 (#{attempt})")
+            return
+
+        state["attempt"] = attempt
+
+        # 여러 날짜·노선이면 이번에 조회할 대상 하나 (임박·변동이 큰 대상일수록 자주)
+        target = pacing.pick(key)
+        if target is None:
+            report.send(f"⌛ {tag} 선택한 날짜·시간대가 모두 지났습니다 (#{attempt})", ALERT)
+            state["running"] = False
+            return
+
+        # ── 열차 조회 ──
+        try:
+            finished, searched = await engine.unless_stopped(
+                key, search_all(target, attempt == first_attempt, fresh_since if attempt == first_attempt else None))
+        except Exception as e:
+            progress(attempt)
+            err_name = type(e).__name__
+
+            # 세션 만료(NeedToLogin 등) 재로그인은 SessionPool이 처리 — 그마저 실패하면 중지
+            if isinstance(e, LoginFailed):
+                report.send(f"❌ {tag} 재로그인 실패: {e}", ALERT)
+                state["running"] = False
+                return
+
+            # 매진 (정상) → 빠르게 재시도
+            if "NoResult" in err_name or "SoldOut" in err_name:
+                pacing.observe(key, frozenset(), len(windows), target)
+                if attempt % 50 == 0:
+                    report.status(f"🔄 {tag} [{attempt}/{MAX_ATTEMPTS}] 매진 — 취소표 대기 중...")
+                if not await engine.sleep(key, pacing.delay(key)):
+                    report.send(f"⏹ {tag} 매크로 중지됨 (#{attempt})")
+                    return
+                continue
+
+            # 기타 에러
+            logger.warning(f"{tag} 조회 에러 #{attempt}: {e}")
+            pacing.error(key)
+            if not await engine.sleep(key, pacing.delay(key)):
+                report.send(f"⏹ {tag} 매크로 중지됨 (#{attempt})")
+                return
+            continue
+
+        if not finished:
+            report.send(f"⏹ {tag} 매크로 중지됨 (#{attempt})")
+            return
+
+        progress(attempt)
+        trains, calls = searched
+        pacing.observe(key, frozenset(plan.number_of(t) for t in trains if any_seat(t)), calls, target)
+
+        # ── 조건에 맞는 빈 좌석 열차 (선호 순) ──
+        with metrics.timed("match", train, key):
+            candidates = plan.select(trains)
+
+        # ── 예약 시도: 상위 RESERVE_RACE개를 동시에, 먼저 확정된 하나만 남기고 나머지는 취소 ──
+        booked = None
+        for i in range(0, len(candidates), RESERVE_RACE):
+            booked, errors = await engine.first_success(
+                [reserve(t) for t in candidates[i:i + RESERVE_RACE]], roll_back)
+            for e in errors:
+                logger.warning(f"{tag} 예매 실패: {e}")
+            if booked is not None:
+                break
+
+        if booked is not None:
+            t, reservation = booked
+            date_str, dep, arr = target
+            hh_dep = f"{t.dep_time[:2]}:{t.dep_time[2:4]}"
+            if len(dates) > 1:
+                hh_dep = f"{fmt_date(datetime.strptime(date_str, '%Y%m%d'))} {hh_dep}"
+            res_num = provider.reservation_number(reservation)
+            state["booked"] = res_num
+            info = {"tag": tag, "dep": dep, "arr": arr, "hh_dep": hh_dep,
+                    "hh_arr": f"{t.arr_time[:2]}:{t.arr_time[2:4]}"}
+            # 결제·미결제 알림은 Reporter 쪽 (봇: 결제 파이프라인) — 매크로는 여기서 끝나고 세션·조회 슬롯을 돌려준다
+            if not report.booked(provider, reservation, info):
+                report.send(
+                    f"✅ 예약 성공!\n\n{tag} {dep} → {arr}\n"
+                    f"출발: {hh_dep}\n예약번호: {res_num}\n\n"
+                    f"⚠️ <b>{provider.app}에서 결제하세요!</b>", RESULT, parse_mode="HTML")
+            state["running"] = False
+            return
+
+        # 진행 상태 알림
+        if attempt % 50 == 0:
+            elapsed = int(time.time() - started) // 60
+            report.status(f"🔄 {tag} [{attempt}/{MAX_ATTEMPTS}] 조회 중... ({elapsed}분 경과)")
+
+        if not await engine.sleep(key, pacing.delay(key)):
+            report.send(f"⏹ {tag} 매크로 중지됨 (#{attempt})")
+            return
+
+    report.send(f"😞 {tag} {MAX_ATTEMPTS}회 조회 완료 — 예매 실패", ALERT)
+    state["running"] = False
+
+
+async def _load_churn(rt: Runtime, tag: str, train: str, routes: list[tuple[str, str]], dates: list[str],
+                      hour_ranges: list[tuple[int, int]]) -> dict[tuple, int]:
+    """대상 (출발일, 출발역, 도착역) → 최근 HISTORY_STATS_DAYS일 동안 좌석이 생긴 횟수. 실패하면 빈 dict"""
+    hours = {h for start, end in hour_ranges for h in range(start, end)}
+    churn = {}
+    try:
+        for d, a in routes:
+            counts = await rt.engine.run_blocking(rt.history.appeared, train, d, a, dates, hours, HISTORY_STATS_DAYS)
+            churn.update({(date_str, d, a): n for date_str, n in counts.items()})
+    except Exception as e:
+        logger.warning(f"{tag} 조회 기록 읽기 실패: {e}")
+    return churn
+
+
+async def wait_for_start(rt: Runtime, key: str, tag: str, account, start_at: float, report: Reporter) -> bool:
+    """start_at(서버 시각)까지 대기. 중지되면 False.
+
+    START_PREP_SEC 전에 세션을 보장하고(시작 시점에 만료될 세션이면 미리 재로그인) 서버 시계
+    오프셋을 잰 뒤, 남은 시간 동안 START_WARM_SEC마다 조회 경로의 커넥션을 데워 둔다. 마지막
+    몇 ms는 짧은 sleep으로 맞춘다. 첫 조회가 목표보다 늦은 정도는 metrics의 start 구간에 남는다.
+    """
+    engine = rt.engine
+    offset, prepared, warmed_at = 0.0, False, 0.0
+    while True:
+        left = start_at - (time.time() + offset)
+        if left <= 0.05:
+            break
+        if not prepared and left <= START_PREP_SEC:
+            prepared = True
+            try:
+                if account.age + left > rt.sessions.refresh_sec:
+                    await account.relogin(account.generation)
+                if left > 10:  # 측정에 7초 남짓 걸림
+                    offset, bound = await account.clock_offset()
+                    logger.info(f"{tag} 서버 시계 오프셋 {offset * 1000:+.1f}ms (±{bound * 1000:.1f}ms)")
+                    report.status(f"⏰ {tag} 준비 완료 — 서버 시계 {offset * 1000:+.0f}ms "
+                                  f"(±{bound * 1000:.0f}ms), {fmt_start(start_at)} 조회 시작")
+            except Exception as e:
+                logger.warning(f"{tag} 예약 시작 준비 실패 (로컬 시계 사용): {e}")
+            continue
+        if prepared and time.monotonic() - warmed_at >= START_WARM_SEC:
+            await account.warm()
+            warmed_at = time.monotonic()
+            continue
+        step = left - START_PREP_SEC if not prepared else min(left - 0.05, START_WARM_SEC)
+        if not await engine.sleep(key, max(0.0, step)):
+            return False
+
+    target = start_at - offset
+    while (remaining := target - time.time()) > 0:
+        await asyncio.sleep(remaining if remaining > 0.002 else 0)
+    if engine.stopped(key):
+        return False
+    rt.metrics.observe("start", account.train, time.time() - target, key)
+    return True
@@ -0,0 +1,110 @@
+from operator import attrgetter, methodcaller
+
+# "HH" → 시 (dep_time 앞 두 자리를 int() 없이 비트 위치로)
+_HOUR = {f"{h:02d}": h for h in range(24)}
+
+# 열차 × 좌석등급 → 잔여석 판정 메서드
+SEAT_PREDICATES = {
+    "srt": {
+        "all": methodcaller("seat_available"),
+        "general_only": methodcaller("general_seat_available"),
+        "special_only": methodcaller("special_seat_available"),
+    },
+    "ktx": {
+        "all": methodcaller("has_seat"),
+        "general_only": methodcaller("has_general_seat"),
+        "special_only": methodcaller("has_special_seat"),
+    },
+}
+
+TRAIN_NUMBER = {"srt": attrgetter("train_number"), "ktx": attrgetter("train_no")}
+
+
+def _norm_no(no) -> str:
+    return str(no).lstrip("0") or "0"
+
+
+def _minutes(hhmmss: str) -> int:
+    return int(hhmmss[:2]) * 60 + int(hhmmss[2:4])
+
+
+def _duration(t) -> int:
+    """소요 시간(분). 자정을 넘기면 다음 날 도착"""
+    d = _minutes(t.arr_time) - _minutes(t.dep_time)
+    return d + 1440 if d < 0 else d
+
+
+def _by_departure(train: str):
+    return attrgetter("dep_time")
+
+
+def _by_duration(train: str):
+    return lambda t: (_duration(t), t.dep_time)
+
+
+def _by_seat(train: str):
+    """일반실이 남은 열차 먼저 (GENERAL_FIRST 예약과 같은 선호), 그다음 이른 출발"""
+    general = SEAT_PREDICATES[train]["general_only"]
+    return lambda t: (not general(t), t.dep_time)
+
+
+# 예약 후보 정렬 기준: 열차 종류 → 정렬 키 함수. 출발 시각 "HHMMSS"는 문자열 비교로 충분
+RANKINGS = {"departure": _by_departure, "duration": _by_duration, "seat": _by_seat}
+
+
+class MatchPlan:
+    """매크로 시작 시 한 번 컴파일하는 열차 필터.
+
+    시간대는 24비트 비트맵, 좌석 판정은 열차 종류에 묶인 함수 하나, 열차번호는
+    허용/제외 집합으로 미리 준비해 조회 결과마다 분기를 다시 타지 않는다.
+    결과 리스트를 수정하지 않으므로 SearchHub가 공유하는 결과에도 그대로 쓸 수 있다.
+    rank가 있으면 후보를 사용자 선호(RANKINGS) 순으로 정렬해 돌려준다. after("HHMMSS")가 있으면
+    그보다 먼저 출발하는 열차는 시간대 안이어도 뺀다.
+    """
+
+    __slots__ = ("hours", "seat_ok", "number_of", "allow", "deny", "rank", "after")
+
+    def __init__(self, hours: int, seat_ok, number_of, allow: frozenset | None, deny: frozenset, rank=None,
+                 after: str | None = None):
+        self.hours = hours
+        self.seat_ok = seat_ok
+        self.number_of = number_of
+        self.allow = allow
+        self.deny = deny
+        self.rank = rank
+        self.after = after
+
+    def select(self, trains) -> list:
+        """조건에 맞고 잔여석이 있는 열차를 선호 순(rank가 없으면 조회 순)으로 반환"""
+        hours, seat_ok = self.hours, self.seat_ok
+        hits = [t for t in trains if hours >> _HOUR[t.dep_time[:2]] & 1 and seat_ok(t)]
+        if self.after is not None:
+            after = self.after
+            hits = [t for t in hits if t.dep_time >= after]
+        if self.allow is not None or self.deny:
+            number_of, allow, deny = self.number_of, self.allow, self.deny
+            hits = [
+                t for t in hits
+                if (no := _norm_no(number_of(t))) not in deny and (allow is None or no in allow)
+            ]
+        if self.rank is not None and len(hits) > 1:
+            hits.sort(key=self.rank)
+        return hits
+
+
+def compile_plan(train: str, hour_ranges: list[tuple[int, int]], seat_code: str,
+                 allow=None, deny=None, rank: str | None = None, after: str | None = None) -> MatchPlan:
+    hours = 0
+    for start, end in hour_ranges:
+        for h in range(start, end):
+            hours |= 1 << h
+    seat_ok = SEAT_PREDICATES[train].get(seat_code, SEAT_PREDICATES[train]["all"])
+    return MatchPlan(
+        hours,
+        seat_ok,
+        TRAIN_NUMBER[train],
+        frozenset(_norm_no(n) for n in allow) if allow else None,
+        frozenset(_norm_no(n) for n in deny or ()),
+        RANKINGS[rank](train) if rank in RANKINGS else None,
+        after,
+    )
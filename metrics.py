@@ -0,0 +1,198 @@
+import asyncio
+import bisect
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# 히스토그램 구간 상한(초) — 조회·예약 수십 ms부터 로그인·텔레그램 대기 수십 초까지
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+PREFIX = "train_macro"
+
+
+class Histogram:
+    """고정 구간 히스토그램. 기록은 bisect 한 번과 덧셈 두 번."""
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)   # 마지막 칸은 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def merge(self, other: "Histogram"):
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.sum += other.sum
+        self.count += other.count
+
+    def quantile(self, q: float) -> float:
+        """구간 안에서 선형 보간한 분위수 (Prometheus histogram_quantile과 같은 방식)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if seen + c >= rank and c:
+                if i == len(BUCKETS):
+                    return BUCKETS[-1]
+                lower = BUCKETS[i - 1] if i else 0.0
+                return lower + (BUCKETS[i] - lower) * (rank - seen) / c
+            seen += c
+        return BUCKETS[-1]
+
+
+def _labels(**labels) -> str:
+    def esc(v):
+        return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return ",".join(f'{k}="{esc(v)}"' for k, v in labels.items())
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.0f}ms" if seconds < 10 else f"{seconds:.1f}s"
+
+
+class Metrics:
+    """구간별 지연 히스토그램과 에러 카운터. (구간, 제공자, 매크로) 단위로 쌓는다.
+
+    구간: login, search, match, reserve, payment, governor(호출 상한 대기), telegram(API 호출),
+    telegram_queue(큐 대기 포함).
+    매크로에 묶이지 않는 측정(공유 세션 로그인, 텔레그램)은 매크로 라벨이 빈 문자열이다.
+    """
+
+    def __init__(self):
+        self._hist: dict[tuple[str, str, str], Histogram] = {}
+        self._errors: Counter = Counter()       # (구간, 제공자, 매크로, 예외 이름) → 횟수
+        self._collectors: list[tuple[str, str, str, object]] = []
+        self._server: asyncio.AbstractServer | None = None
+        self.started = time.time()
+
+    # ── 기록 ──
+
+    def observe(self, phase: str, provider: str, seconds: float, macro: str = ""):
+        key = (phase, provider, macro)
+        hist = self._hist.get(key)
+        if hist is None:
+            hist = self._hist[key] = Histogram()
+        hist.observe(seconds)
+
+    def error(self, phase: str, provider: str, exc: BaseException, macro: str = ""):
+        self._errors[phase, provider, macro, type(exc).__name__] += 1
+
+    @contextmanager
+    def timed(self, phase: str, provider: str, macro: str = ""):
+        """with 블록의 소요 시간을 기록하고, 예외는 타입 이름으로 세어 그대로 다시 던진다"""
+        t0 = time.perf_counter()
+        try:
+            yield
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.error(phase, provider, e, macro)
+            self.observe(phase, provider, time.perf_counter() - t0, macro)
+            raise
+        self.observe(phase, provider, time.perf_counter() - t0, macro)
+
+    def collect(self, name: str, help_text: str, fn, kind: str = "gauge"):
+        """조회 시점에 fn()으로 값을 읽는 게이지/카운터 (실행 중 매크로 수, 발송 건수 등)"""
+        self._collectors.append((name, help_text, kind, fn))
+
+    # ── 요약 ──
+
+    def summary(self, macro: str | None = None) -> str:
+        """/metrics 응답. macro를 주면 그 매크로의 측정만."""
+        merged: dict[tuple[str, str], Histogram] = {}
+        for (phase, provider, m), hist in self._hist.items():
+            if macro is not None and m != macro:
+                continue
+            merged.setdefault((phase, provider), Histogram()).merge(hist)
+        errors = Counter()
+        for (phase, provider, m, name), n in self._errors.items():
+            if macro is None or m == macro:
+                errors[phase, provider, name] += n
+
+        uptime = int(time.time() - self.started) // 60
+        lines = [f"📈 구간별 지연{f' ({macro})' if macro else ''} — p50 / p95 / p99, 가동 {uptime}분"]
+        for (phase, provider), hist in sorted(merged.items()):
+            lines.append(
+                f"{phase:<14} {provider:<8} {_ms(hist.quantile(0.5))} / {_ms(hist.quantile(0.95))}"
+                f" / {_ms(hist.quantile(0.99))}  ({hist.count:,}회)")
+        if not merged:
+            lines.append("측정 없음")
+        if errors:
+            lines.append("\n❗ 에러")
+            for (phase, provider, name), n in errors.most_common(15):
+                lines.append(f"{phase:<14} {provider:<8} {name} {n:,}")
+        if macro is None and self._collectors:
+            lines.append("")
+            lines += [f"{name} {fn()}" for name, _, _, fn in self._collectors]
+        return "\n".join(lines)
+
+    # ── Prometheus ──
+
+    def render(self) -> str:
+        """Prometheus 텍스트 노출 형식"""
+        out = [
+            f"# HELP {PREFIX}_phase_seconds 구간별 소요 시간",
+            f"# TYPE {PREFIX}_phase_seconds histogram",
+        ]
+        for (phase, provider, macro), hist in sorted(self._hist.items()):
+            base = _labels(phase=phase, provider=provider, macro=macro)
+            cumulative = 0
+            for bound, c in zip(BUCKETS, hist.counts):
+                cumulative += c
+                out.append(f'{PREFIX}_phase_seconds_bucket{{{base},le="{bound}"}} {cumulative}')
+            out.append(f'{PREFIX}_phase_seconds_bucket{{{base},le="+Inf"}} {hist.count}')
+            out.append(f"{PREFIX}_phase_seconds_sum{{{base}}} {hist.sum:.6f}")
+            out.append(f"{PREFIX}_phase_seconds_count{{{base}}} {hist.count}")
+
+        out += [
+            f"# HELP {PREFIX}_errors_total 구간별 예외 (예외 타입 이름)",
+            f"# TYPE {PREFIX}_errors_total counter",
+        ]
+        for (phase, provider, macro, name), n in sorted(self._errors.items()):
+            out.append(f"{PREFIX}_errors_total{{{_labels(phase=phase, provider=provider, macro=macro, error=name)}}} {n}")
+
+        for name, help_text, kind, fn in self._collectors:
+            out += [f"# HELP {PREFIX}_{name} {help_text}", f"# TYPE {PREFIX}_{name} {kind}", f"{PREFIX}_{name} {fn()}"]
+        return "\n".join(out) + "\n"
+
+    async def start(self, host: str, port: int):
+        """로컬 HTTP 엔드포인트 (GET /metrics). 외부 의존성 없이 asyncio 서버로."""
+        if self._server is None:
+            self._server = await asyncio.start_server(self._handle, host, port)
+            logger.info(f"메트릭 엔드포인트: http://{host}:{port}/metrics")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+                pass  # 헤더는 읽고 버림
+            parts = request.split()
+            if len(parts) >= 2 and parts[0] == b"GET" and parts[1].split(b"?")[0] == b"/metrics":
+                status, body = "200 OK", self.render().encode()
+                ctype = "text/plain; version=0.0.4; charset=utf-8"
+            else:
+                status, body, ctype = "404 Not Found", b"not found\n", "text/plain"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {ctype}\r\nContent-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,193 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from telegram.error import BadRequest, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# 우선순위 (작을수록 먼저)
+RESULT = 0     # 예약/결제 결과
+ALERT = 1      # 실패·미결제 알림
+INFO = 2       # 시작/중지 등 일반 안내
+PROGRESS = 3   # 진행 상황 (매크로별 상태 메시지 수정)
+
+
+class _Message:
+    __slots__ = ("chat_id", "text", "parse_mode", "reply_markup", "priority", "status_key", "tries", "dropped",
+                 "queued_at")
+
+    def __init__(self, chat_id, text, parse_mode, reply_markup, priority, status_key=None):
+        self.chat_id = chat_id
+        self.text = text
+        self.parse_mode = parse_mode
+        self.reply_markup = reply_markup
+        self.priority = priority
+        self.status_key = status_key
+        self.tries = 0
+        self.dropped = False
+        self.queued_at = time.perf_counter()
+
+
+def _seconds(retry_after) -> float:
+    return retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+
+
+class Outbox:
+    """텔레그램 발송 큐.
+
+    채팅별 우선순위 큐에서 보낼 수 있는 채팅(채팅당 chat_interval초에 1건) 중
+    가장 급한 메시지를 골라, 전체 global_rate건/초 안에서 보낸다. 예약 결과는
+    진행 알림보다 항상 먼저 나간다. 진행 상황은 매크로마다 메시지 하나를 수정하며,
+    아직 나가지 않은 상태 갱신은 최신 내용 하나로 합쳐진다. RetryAfter를 받으면
+    지시된 시간만큼 쉬었다가 다시 보낸다.
+    metrics를 주면 API 호출 시간(telegram)과 큐에 들어온 뒤 전달까지(telegram_queue)를 기록한다.
+    """
+
+    def __init__(self, global_rate: float, chat_interval: float, metrics=None):
+        self._global_interval = 1.0 / global_rate
+        self._chat_interval = chat_interval
+        self._metrics = metrics
+        self._bot = None
+        self._queues: dict[int, list] = {}
+        self._seq = itertools.count()
+        self._chat_ready: dict[int, float] = {}
+        self._global_ready = 0.0
+        self._live: dict[str, int] = {}             # 상태 키 → 수정할 message_id
+        self._pending: dict[str, _Message] = {}     # 상태 키 → 아직 안 보낸 상태 메시지
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self.sent = 0
+        self.failed = 0
+
+    def start(self, bot):
+        self._bot = bot
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run(), name="outbox")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    # ── 보내기 ──
+
+    def send(self, chat_id: int, text: str, priority: int = INFO, parse_mode=None, reply_markup=None):
+        self._push(_Message(chat_id, text, parse_mode, reply_markup, priority))
+
+    def status(self, chat_id: int, key: str, text: str, reply_markup=None):
+        """매크로 key의 상태 메시지를 갱신. 첫 호출은 새 메시지, 이후는 같은 메시지 수정."""
+        pending = self._pending.get(key)
+        if pending is not None:
+            pending.text, pending.reply_markup = text, reply_markup
+            return
+        msg = _Message(chat_id, text, None, reply_markup, PROGRESS, status_key=key)
+        self._pending[key] = msg
+        self._push(msg)
+
+    def end_status(self, key: str):
+        """매크로 종료 — 대기 중인 상태 갱신은 버리고, 같은 key의 다음 매크로는 새 메시지로 시작."""
+        pending = self._pending.pop(key, None)
+        if pending is not None:
+            pending.dropped = True
+        self._live.pop(key, None)
+
+    def _push(self, msg: _Message):
+        heapq.heappush(self._queues.setdefault(msg.chat_id, []), (msg.priority, next(self._seq), msg))
+        self._wake.set()
+
+    # ── 발송 루프 ──
+
+    def _pick(self, now: float):
+        """보낼 수 있는 채팅 중 가장 급한 메시지. 없으면 (None, 다음 준비 시각)"""
+        best, best_chat, next_ready = None, None, None
+        for chat_id, queue in self._queues.items():
+            ready = self._chat_ready.get(chat_id, 0.0)
+            if ready > now:
+                next_ready = ready if next_ready is None else min(next_ready, ready)
+                continue
+            if best is None or queue[0] < best:
+                best, best_chat = queue[0], chat_id
+        if best is None:
+            return None, next_ready
+        queue = self._queues[best_chat]
+        heapq.heappop(queue)
+        if not queue:
+            del self._queues[best_chat]
+        return best[2], None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if self._global_ready > now:
+                await asyncio.sleep(self._global_ready - now)
+                continue
+            msg, next_ready = self._pick(now)
+            if msg is None:
+                self._wake.clear()
+                timeout = None if next_ready is None else next_ready - now
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if msg.dropped:
+                continue
+            self._global_ready = now + self._global_interval
+            self._chat_ready[msg.chat_id] = now + self._chat_interval
+            await self._deliver(msg, loop)
+
+    async def _deliver(self, msg: _Message, loop):
+        key = msg.status_key
+        if key is not None:
+            self._pending.pop(key, None)
+        t0 = time.perf_counter()
+        try:
+            message_id = self._live.get(key) if key is not None else None
+            if message_id is not None:
+                try:
+                    await self._bot.edit_message_text(
+                        chat_id=msg.chat_id, message_id=message_id, text=msg.text, reply_markup=msg.reply_markup)
+                except BadRequest as e:
+                    if "not modified" in str(e):
+                        return
+                    message_id = None  # 지워진 메시지 등 → 새로 보냄
+            if message_id is None:
+                sent = await self._bot.send_message(
+                    chat_id=msg.chat_id, text=msg.text, parse_mode=msg.parse_mode, reply_markup=msg.reply_markup)
+                if key is not None and not msg.dropped:
+                    self._live[key] = sent.message_id
+            self.sent += 1
+            if self._metrics is not None:
+                done = time.perf_counter()
+                self._metrics.observe("telegram", "telegram", done - t0)
+                self._metrics.observe("telegram_queue", "telegram", done - msg.queued_at)
+        except RetryAfter as e:
+            if self._metrics is not None:
+                self._metrics.error("telegram", "telegram", e)
+            wait = _seconds(e.retry_after)
+            logger.warning(f"텔레그램 속도 제한 — {wait:.0f}초 대기")
+            self._global_ready = loop.time() + wait
+            self._requeue(msg)
+        except Exception as e:
+            if self._metrics is not None:
+                self._metrics.error("telegram", "telegram", e)
+            msg.tries += 1
+            if msg.priority <= ALERT and msg.tries < 3:
+                logger.warning(f"메시지 전송 실패 (재시도 {msg.tries}/3): {e}")
+                self._chat_ready[msg.chat_id] = loop.time() + 2 * msg.tries
+                self._requeue(msg)
+            else:
+                self.failed += 1
+                logger.warning(f"메시지 전송 실패: {e}")
+
+    def _requeue(self, msg: _Message):
+        if msg.status_key is not None:
+            if msg.status_key in self._pending:
+                return  # 더 새로운 상태 갱신이 이미 대기 중
+            self._pending[msg.status_key] = msg
+        self._push(msg)
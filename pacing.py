@@ -0,0 +1,222 @@
+import math
+import random
+import time
+from datetime import datetime, timedelta
+
+# 출발 임박도 가중치 상한 — 계정의 매크로 가중치 합이 이 값이면 예산을 다 쓴다
+_FULL_WEIGHT = 4.0
+# 잔여석 변화 점수 반감 시간(초)
+_ACTIVITY_HALF_LIFE = 600.0
+# 조회 에러율 EWMA 계수
+_ERROR_ALPHA = 0.2
+# 과거 기록상 좌석이 이만큼 생긴 대상은 가중치 2배 (그 이하는 비례)
+_HISTORY_FULL = 20
+
+
+def parse_hours(spec: str) -> tuple[int, int] | None:
+    """"1-6" → (1, 6) (1시 이상 6시 미만). 빈 값이면 None"""
+    if not spec:
+        return None
+    start, end = spec.split("-")
+    return int(start), int(end)
+
+
+def next_departure(date_str: str, hour_ranges: list[tuple[int, int]], now: datetime) -> datetime:
+    """선택한 시간대 중 아직 지나지 않은 가장 이른 출발 시각 (모두 지났으면 마지막 시간대 끝)"""
+    day = datetime.strptime(date_str, "%Y%m%d")
+    last = day
+    for start, end in sorted(hour_ranges):
+        last = day + timedelta(hours=end)
+        if last > now:
+            return max(day + timedelta(hours=start), now)
+    return last
+
+
+def departed(date_str: str, hour_ranges: list[tuple[int, int]], now: datetime) -> bool:
+    """선택한 시간대가 모두 지났는지"""
+    return datetime.strptime(date_str, "%Y%m%d") + timedelta(hours=max(end for _, end in hour_ranges)) <= now
+
+
+class _Target:
+    """매크로가 조회하는 (출발일, 출발역, 도착역) 하나의 상태"""
+
+    __slots__ = ("available", "activity", "changed_at", "history", "stride")
+
+    def __init__(self):
+        self.available = None       # 직전 조회에서 잔여석이 있던 열차번호 집합
+        self.activity = 0.0         # 잔여석 변화 점수 (시간에 따라 감쇠)
+        self.changed_at = 0.0
+        self.history = 0            # 과거 기록상 이 출발일·노선에 좌석이 생긴 횟수
+        self.stride = 0.0           # 대상 배분용 누적값 (stride scheduling)
+
+
+class _Pace:
+    __slots__ = ("account", "targets", "hour_ranges", "calls")
+
+    def __init__(self, account, targets, hour_ranges, calls):
+        self.account = account
+        self.targets = {t: _Target() for t in targets}
+        self.hour_ranges = hour_ranges
+        self.calls = calls          # 시도 1회당 업스트림 호출 수 (관측값으로 갱신)
+
+
+class PollController:
+    """계정별 조회 예산을 그 계정의 매크로들에 나눠 조회 간격을 정한다.
+
+    매크로 가중치 = 출발 임박도(24시간 / 남은 시간, 0.25~4) × (1 + 최근 잔여석 변화 점수).
+    가중치 합이 _FULL_WEIGHT 이상이면 계정 예산(budget_per_min)을 가중치 비율로 나누고,
+    그보다 작으면 남는 예산은 쓰지 않는다 — 출발이 먼 매크로는 천천히, 취소표가 나오는
+    출발 직전·변화가 잦은 매크로는 빠르게 조회한다. 새벽(quiet_hours)에는 예산을
+    quiet_factor배로, 조회 에러가 잦으면 에러율에 따라 줄인다.
+
+    여러 날짜·대체역 노선을 맡은 매크로는 가장 급한 대상의 가중치로 예산을 한 몫만 받고,
+    시도마다 pick()이 대상 (출발일, 출발역, 도착역) 가중치(임박도 × 잔여석 변화 × 과거 기록상
+    변동) 비율대로 하나를 고른다 — 대상마다 매크로를 따로 돌릴 때보다 업스트림 호출이 대상
+    수만큼 줄어든다.
+    """
+
+    def __init__(self, budget_per_min: float, min_sec: float, max_sec: float,
+                 quiet_hours: tuple[int, int] | None = None, quiet_factor: float = 1.0):
+        self._budget = budget_per_min / 60.0
+        self._min = min_sec
+        self._max = max_sec
+        self._quiet = quiet_hours
+        self._quiet_factor = quiet_factor
+        self._paces: dict[str, _Pace] = {}
+        self._errors: dict[tuple, float] = {}   # 계정 → 에러율 EWMA
+
+    def join(self, key: str, account: tuple, targets: list[tuple[str, str, str]],
+             hour_ranges: list[tuple[int, int]], calls: int = 1):
+        """targets: (출발일, 출발역, 도착역) 목록"""
+        self._paces[key] = _Pace(account, targets, hour_ranges, calls)
+
+    def leave(self, key: str):
+        self._paces.pop(key, None)
+
+    # ── 관측 ──
+
+    def observe(self, key: str, available: frozenset, calls: int, target: tuple | None = None):
+        """조회 성공: 잔여석 열차 집합과 이번 시도의 업스트림 호출 수 (target 생략 시 첫 대상)"""
+        pace = self._paces.get(key)
+        if pace is None:
+            return
+        tgt = pace.targets.get(target) if target else next(iter(pace.targets.values()))
+        if tgt is None:
+            return
+        now = time.monotonic()
+        pace.calls = max(1, calls)
+        if tgt.available is not None and available != tgt.available:
+            tgt.activity = self._decayed(tgt, now) + 1.0
+            tgt.changed_at = now
+        tgt.available = available
+        self._record(pace.account, 0.0)
+
+    def set_history(self, key: str, appeared: dict[tuple, int]):
+        """대상별 과거 좌석 발생 횟수 (HistoryStore.appeared)"""
+        pace = self._paces.get(key)
+        if pace is None:
+            return
+        for target, count in appeared.items():
+            if target in pace.targets:
+                pace.targets[target].history = count
+
+    def error(self, key: str):
+        pace = self._paces.get(key)
+        if pace is not None:
+            self._record(pace.account, 1.0)
+
+    def _record(self, account, value: float):
+        prev = self._errors.get(account, 0.0)
+        self._errors[account] = prev + _ERROR_ALPHA * (value - prev)
+
+    @staticmethod
+    def _decayed(tgt: _Target, now: float) -> float:
+        if not tgt.activity:
+            return 0.0
+        return tgt.activity * math.exp2(-(now - tgt.changed_at) / _ACTIVITY_HALF_LIFE)
+
+    # ── 간격 계산 ──
+
+    def _target_weight(self, target: tuple, tgt: _Target, hour_ranges, now: datetime, mono: float) -> float:
+        hours = (next_departure(target[0], hour_ranges, now) - now).total_seconds() / 3600
+        urgency = min(_FULL_WEIGHT, max(0.25, 24.0 / max(hours, 0.1)))
+        churn = 1.0 + min(tgt.history, _HISTORY_FULL) / _HISTORY_FULL
+        return urgency * (1.0 + min(self._decayed(tgt, mono), 3.0)) * churn
+
+    def _live(self, pace: _Pace, now: datetime) -> dict[tuple, _Target]:
+        return {t: tgt for t, tgt in pace.targets.items() if not departed(t[0], pace.hour_ranges, now)}
+
+    def _weight(self, pace: _Pace, now: datetime, mono: float) -> float:
+        """매크로 가중치 = 남은 대상 중 가장 큰 대상 가중치"""
+        live = self._live(pace, now) or pace.targets
+        return max(self._target_weight(t, tgt, pace.hour_ranges, now, mono) for t, tgt in live.items())
+
+    def pick(self, key: str) -> tuple | None:
+        """이번 시도에 조회할 대상. 모든 날짜의 출발 시간대가 지났으면 None"""
+        pace = self._paces.get(key)
+        if pace is None:
+            return None
+        now, mono = datetime.now(), time.monotonic()
+        live = self._live(pace, now)
+        if len(live) <= 1:
+            return next(iter(live), None)
+        # stride scheduling: 누적값이 가장 작은 대상을 고르고 1/가중치만큼 더한다
+        target = min(live, key=lambda t: live[t].stride)
+        tgt = live[target]
+        tgt.stride += 1.0 / self._target_weight(target, tgt, pace.hour_ranges, now, mono)
+        return target
+
+    def weight(self, key: str) -> float:
+        """매크로 가중치 (Governor의 공정 큐 배분용). 모르는 매크로는 0"""
+        pace = self._paces.get(key)
+        if pace is None:
+            return 0.0
+        return self._weight(pace, datetime.now(), time.monotonic())
+
+    def budget(self, account) -> float:
+        """지금 이 계정이 쓸 수 있는 초당 업스트림 호출 수"""
+        budget = self._budget / (1.0 + 4.0 * self._errors.get(account, 0.0))
+        if self._quiet is not None:
+            start, end = self._quiet
+            if start <= datetime.now().hour < end:
+                budget *= self._quiet_factor
+        return budget
+
+    def delay(self, key: str) -> float:
+        """다음 조회까지 기다릴 시간(초)"""
+        pace = self._paces.get(key)
+        if pace is None:
+            return random.uniform(self._min, self._max)
+        now, mono = datetime.now(), time.monotonic()
+        weights = {k: self._weight(p, now, mono) for k, p in self._paces.items() if p.account == pace.account}
+        share = weights[key] / max(sum(weights.values()), _FULL_WEIGHT)
+        rate = self.budget(pace.account) * share
+        interval = pace.calls / rate if rate > 0 else self._max  # 예산 0(직접 만든 PollController 등)이면 가장 느리게
+        # 여러 매크로가 같은 박자로 몰리지 않도록 ±20% 흔들기
+        return min(self._max, max(self._min, interval * random.uniform(0.8, 1.2)))
+
+    def snapshot(self, key: str) -> dict | None:
+        pace = self._paces.get(key)
+        if pace is None:
+            return None
+        now, mono = datetime.now(), time.monotonic()
+        weights = {t: self._target_weight(t, tgt, pace.hour_ranges, now, mono)
+                   for t, tgt in self._live(pace, now).items()}
+        total = sum(weights.values()) or 1.0
+        return {
+            "weight": round(self._weight(pace, now, mono), 2),
+            "activity": round(max((self._decayed(tgt, mono) for tgt in pace.targets.values()), default=0.0), 2),
+            "errors": round(self._errors.get(pace.account, 0.0), 2),
+            "shares": {t: round(w / total, 2) for t, w in weights.items()},
+        }
+
+
+class FixedPacing(PollController):
+    """CLI(srt_macro.py / ktx_macro.py)용 고정 간격 — 예산 배분 없이 매번 min_sec~max_sec초 사이 무작위.
+    여러 날짜·대체역 노선은 pick()이 그대로 돌아가며 고른다."""
+
+    def __init__(self, min_sec: float, max_sec: float):
+        super().__init__(0.0, min_sec, max_sec)
+
+    def delay(self, key: str) -> float:
+        return random.uniform(self._min, self._max)
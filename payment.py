@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+from outbox import ALERT, INFO, RESULT
+
+logger = logging.getLogger(__name__)
+
+
+def payment_deadline(reservation, fallback_sec: float) -> float:
+    """SRT 예약의 결제기한(payment_date + payment_time) → epoch 초. 없으면 지금 + fallback_sec"""
+    date, hhmmss = getattr(reservation, "payment_date", None), getattr(reservation, "payment_time", None)
+    try:
+        return datetime.strptime(f"{date}{hhmmss}", "%Y%m%d%H%M%S").timestamp()
+    except (TypeError, ValueError):
+        return time.time() + fallback_sec
+
+
+def _clock(ts: float) -> str:
+    return datetime.fromtimestamp(ts).strftime("%H:%M")
+
+
+class _Job:
+    __slots__ = ("chat_id", "key", "train", "res_num", "info", "deadline", "quiet")
+
+    def __init__(self, chat_id, key, train, res_num, info, deadline):
+        self.chat_id = chat_id
+        self.key = key
+        self.train = train
+        self.res_num = res_num
+        self.info = info            # tag, dep, arr, hh_dep, hh_arr (알림 문구용)
+        self.deadline = deadline
+        self.quiet = False
+
+
+class PaymentPipeline:
+    """예약 이후 단계(카드 결제·미결제 알림)를 매크로와 분리해 처리한다 (SRT 자동결제).
+
+    매크로는 예약번호가 생기는 즉시 submit()하고 끝나므로 조회 슬롯과 세션이 결제를 기다리지 않는다.
+    결제는 retries번까지 지수 백오프로 다시 시도하되, 재시도 전에 예약 목록을 다시 읽어 이미
+    결제됐는지(응답만 유실된 경우) 확인한다. 끝내 실패하면 결제기한까지 remind_sec마다(최대
+    remind_count번) 알림을 보내고, 앱에서 결제하면 알림을 멈춘다. 처리 중인 작업은 MacroStore에
+    남겨 재시작 후 이어서 처리한다.
+    """
+
+    def __init__(self, store, outbox, account_for, card: dict, metrics, retries: int = 3,
+                 retry_sec: float = 5.0, remind_sec: float = 30.0, remind_count: int = 10,
+                 deadline_sec: float = 600.0):
+        self._store = store
+        self._outbox = outbox
+        self._account_for = account_for     # (chat_id, train) → ProviderSession
+        self._card = card
+        self._metrics = metrics
+        self._retries = retries
+        self._retry_sec = retry_sec
+        self._remind_sec = remind_sec
+        self._remind_count = remind_count
+        self._deadline_sec = deadline_sec
+        self._jobs: dict[str, _Job] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    def submit(self, chat_id: int, key: str, train: str, reservation, info: dict):
+        """확정된 예약을 넘기고 바로 반환. 결과는 텔레그램으로 알린다."""
+        res_num = reservation.reservation_number
+        deadline = payment_deadline(reservation, self._deadline_sec)
+        self._store.save_payment(chat_id, key, train, res_num, info, deadline)
+        self._start(_Job(chat_id, key, train, res_num, info, deadline), reservation)
+
+    def resume(self) -> int:
+        """재시작 전 끝나지 않은 결제·알림을 이어서 처리. 예약 객체는 예약 목록에서 다시 찾는다."""
+        rows = self._store.pending_payments()
+        for row in rows:
+            self._start(_Job(**row), None)
+        return len(rows)
+
+    def adopt(self, res_num: str) -> bool:
+        """다른 프로세스(매크로 워커)가 저장한 결제 대기를 이어받는다"""
+        if res_num in self._jobs:
+            return False
+        rows = self._store.pending_payments(res_num)
+        for row in rows:
+            self._start(_Job(**row), None)
+        return bool(rows)
+
+    def pending(self, chat_id: int | None = None) -> list[_Job]:
+        return [job for job in self._jobs.values() if chat_id is None or job.chat_id == chat_id]
+
+    def dismiss(self, chat_id: int | None = None) -> int:
+        """/stop — 그 채팅의 미결제 알림을 멈춘다 (결제 시도 중인 작업은 끝까지 진행)"""
+        jobs = self.pending(chat_id)
+        for job in jobs:
+            job.quiet = True
+        return len(jobs)
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _start(self, job: _Job, reservation):
+        self._jobs[job.res_num] = job
+        task = asyncio.get_running_loop().create_task(self._run(job, reservation), name=f"payment:{job.res_num}")
+        self._tasks[job.res_num] = task
+        task.add_done_callback(lambda t, r=job.res_num: (self._jobs.pop(r, None), self._tasks.pop(r, None)))
+
+    # ── 처리 ──
+
+    async def _run(self, job: _Job, reservation):
+        account = self._account_for(job.chat_id, job.train)
+        if account is None:
+            logger.warning(f"결제 계정 없음 (사용자 해제·계정 삭제): {job.res_num}")
+            self._store.finish_payment(job.res_num, "failed")
+            return
+        try:
+            outcome = await self._pay(job, account, reservation)
+            if outcome is None:
+                outcome = await self._remind(job, account)
+        except asyncio.CancelledError:
+            raise  # 종료 → 재시작 때 재개
+        except Exception:
+            logger.exception(f"결제 파이프라인 예외: {job.res_num}")
+            outcome = "failed"
+        self._store.finish_payment(job.res_num, outcome)
+
+    async def _find(self, account, res_num: str):
+        for r in await account.call("get_reservations"):
+            if r.reservation_number == res_num:
+                return r
+        return None
+
+    async def _pay(self, job: _Job, account, reservation) -> str | None:
+        """결제 성공 "paid", 예약이 사라짐 "gone", 재시도 소진 None (→ 미결제 알림)"""
+        info, last = job.info, None
+        for attempt in range(self._retries + 1):
+            if attempt:
+                wait = min(self._retry_sec * 2 ** (attempt - 1), job.deadline - time.time() - self._retry_sec)
+                if wait < 0:
+                    break  # 결제기한 임박 — 더 기다리지 않고 사용자에게 넘긴다
+                await asyncio.sleep(wait)
+            if reservation is None:
+                try:
+                    reservation = await self._find(account, job.res_num)
+                except Exception as e:
+                    last = e
+                    continue
+                if reservation is None:
+                    self._send(job, f"⚠️ {info['tag']} 예약번호 {job.res_num}을 찾을 수 없습니다 (취소 또는 결제기한 만료)",
+                               ALERT)
+                    return "gone"
+                if reservation.paid:
+                    self._send_paid(job)
+                    return "paid"
+            try:
+                with self._metrics.timed("payment", job.train, job.key):
+                    await account.call("pay_with_card", reservation, **self._card)
+            except Exception as e:
+                last, reservation = e, None
+                logger.warning(f"{info['tag']} 자동결제 실패 ({attempt + 1}/{self._retries + 1}): {e}")
+                if attempt == 0 and self._retries:
+                    self._send(job, f"✅ 예약 성공! 자동결제 재시도 중...\n\n{info['tag']} {info['dep']} → {info['arr']}\n"
+                                    f"출발: {info['hh_dep']}\n예약번호: {job.res_num}\n결제기한: {_clock(job.deadline)}",
+                               RESULT)
+                continue
+            self._send_paid(job)
+            return "paid"
+
+        self._send(job,
+            f"✅ 예약 성공! ⚠️ 자동결제 실패\n\n{info['tag']} {info['dep']} → {info['arr']}\n"
+            f"출발: {info['hh_dep']}\n예약번호: {job.res_num}\n결제오류: {last}\n결제기한: {_clock(job.deadline)}\n\n"
+            f"⚠️ <b>앱에서 수동 결제하세요!</b>", RESULT, parse_mode="HTML")
+        return None
+
+    async def _remind(self, job: _Job, account) -> str:
+        for i in range(self._remind_count):
+            await asyncio.sleep(max(0.0, min(self._remind_sec, job.deadline - time.time())))
+            if job.quiet:
+                return "dismissed"
+            if time.time() >= job.deadline:
+                self._send(job, f"⌛ {job.info['tag']} 결제기한이 지났습니다 — 예약번호 {job.res_num}", ALERT)
+                return "expired"
+            try:
+                reservation = await self._find(account, job.res_num)
+            except Exception as e:
+                logger.warning(f"{job.info['tag']} 예약 확인 실패: {e}")
+            else:
+                if reservation is None:
+                    return "gone"
+                if reservation.paid:
+                    self._send(job, f"💳 {job.info['tag']} 결제 확인 — 예약번호 {job.res_num}", INFO)
+                    return "paid"
+            minutes = max(0, int(job.deadline - time.time()) // 60)
+            self._send(job, f"🔔 [{i+1}/{self._remind_count}] 미결제 알림! 예약번호 {job.res_num} — "
+                            f"결제기한까지 {minutes}분, 앱에서 결제하세요!", ALERT)
+        return "failed"
+
+    def _send_paid(self, job: _Job):
+        info = job.info
+        self._send(job,
+            f"🎉 예약+결제 성공!\n\n{info['tag']} {info['dep']} → {info['arr']}\n"
+            f"출발: {info['hh_dep']} → 도착: {info['hh_arr']}\n예약번호: {job.res_num}\n💳 카드결제 완료!", RESULT)
+
+    def _send(self, job: _Job, text: str, priority: int, parse_mode=None):
+        self._outbox.send(job.chat_id, text, priority=priority, parse_mode=parse_mode)
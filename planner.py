@@ -0,0 +1,21 @@
+from typing import NamedTuple
+
+
+class SearchResult(NamedTuple):
+    trains: list
+    calls: list[int]  # 업스트림 호출별로 구간 안에 들어온 열차 수
+
+
+def plan_windows(hour_ranges: list[tuple[int, int]]) -> list[tuple[str, str]]:
+    """선택한 시간대 [(시작시, 끝시), ...]를 덮는 최소 조회 구간 [(HHMMSS, HHMMSS), ...].
+
+    붙어 있거나 겹치는 시간대는 하나로 합치고, 떨어진 시간대는 구간을 나눠
+    그 사이 열차를 받아오느라 호출을 낭비하지 않는다.
+    """
+    merged: list[list[int]] = []
+    for start, end in sorted(hour_ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(f"{s:02d}0000", f"{e - 1:02d}5959") for s, e in merged]
@@ -0,0 +1,117 @@
+import logging
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+
+from planner import SearchResult
+
+logger = logging.getLogger(__name__)
+
+# 코레일 조회 1회는 한 페이지(약 10편)만 돌려주므로 구간 끝까지 이어서 조회 (라이브러리 allday와 같은 상한)
+KTX_MAX_PAGES = 15
+
+
+class Provider(ABC):
+    """열차 예매 서비스(제공자)별 차이. 매크로 엔진(macro.py)은 이 인터페이스로만 제공자를 다룬다.
+
+    로그인·세션 유지는 session.ProviderSession이 맡고, 여기서는 조회·예약 호출의 인자와
+    결과 모양만 맞춘다. account는 모두 ProviderSession이다.
+    """
+
+    name = ""               # 설정·저장소에서 쓰는 키 ("srt" / "ktx")
+    label = ""              # 알림 표시용
+    app = ""                # 수동 결제 안내에 쓰는 앱 이름
+    card_payment = False    # 카드 자동결제(pay_with_card) 지원
+
+    @abstractmethod
+    async def search(self, account, dep: str, arr: str, date_str: str, window: tuple[str, str],
+                     pax: int) -> SearchResult:
+        """조회 구간 하나의 열차를 모두 가져온다"""
+
+    @abstractmethod
+    async def reserve(self, account, train, pax: int, seat_code: str):
+        """seat_code("all" / "general_only" / "special_only")로 예약하고 제공자의 예약 객체를 돌려준다"""
+
+    @abstractmethod
+    def reservation_number(self, reservation) -> str:
+        """예약 객체의 예약번호"""
+
+
+class SRTProvider(Provider):
+    name = "srt"
+    label = "SRT"
+    app = "SRT 앱"
+    card_payment = True
+
+    async def search(self, account, dep, arr, date_str, window, pax):
+        start, end = window
+        # SRTrain은 time_limit까지 내부에서 페이지를 넘기며 조회. 매진 열차도 받아야 조회 기록(history)에
+        # 좌석이 생기고 없어지는 순간이 남는다 — 잔여석 판정은 MatchPlan이 한다
+        trains = await account.call("search_train", dep, arr, date_str, start, time_limit=end,
+                                    available_only=False)
+        return SearchResult(trains, [len(trains)])
+
+    async def reserve(self, account, train, pax, seat_code):
+        from SRT.passenger import Adult
+        from SRT.seat_type import SeatType
+
+        seat_map = {"all": SeatType.GENERAL_FIRST, "general_only": SeatType.GENERAL_ONLY,
+                    "special_only": SeatType.SPECIAL_ONLY}
+        return await account.call("reserve", train, passengers=[Adult(pax)],
+                                  special_seat=seat_map.get(seat_code, SeatType.GENERAL_FIRST))
+
+    def reservation_number(self, reservation):
+        return reservation.reservation_number
+
+
+class KorailProvider(Provider):
+    name = "ktx"
+    label = "KTX"
+    app = "코레일 앱"
+
+    async def search(self, account, dep, arr, date_str, window, pax):
+        from korail2 import AdultPassenger, NoResultsError
+
+        start, end = window
+        trains, calls = [], []
+        cursor = start
+        for _ in range(KTX_MAX_PAGES):
+            try:
+                # 매진 열차도 받아야 페이지의 마지막 출발시각으로 다음 페이지를 이어갈 수 있다
+                page = await account.call(
+                    "search_train", dep, arr, date_str, cursor,
+                    passengers=[AdultPassenger(pax)], include_no_seats=True)
+            except NoResultsError:
+                calls.append(0)
+                break
+            in_window = [t for t in page if t.dep_time <= end]
+            trains.extend(in_window)
+            calls.append(len(in_window))
+            if len(in_window) < len(page):
+                break
+            nxt = (datetime.strptime(page[-1].dep_time, "%H%M%S") + timedelta(minutes=1)).strftime("%H%M%S")
+            if nxt <= cursor or nxt > end:  # 자정 넘김 또는 구간 끝
+                break
+            cursor = nxt
+        return SearchResult(trains, calls)
+
+    async def reserve(self, account, train, pax, seat_code):
+        from korail2 import AdultPassenger, ReserveOption
+
+        seat_map = {"all": ReserveOption.GENERAL_FIRST, "general_only": ReserveOption.GENERAL_ONLY,
+                    "special_only": ReserveOption.SPECIAL_ONLY}
+        return await account.call("reserve", train, passengers=[AdultPassenger(pax)],
+                                  option=seat_map.get(seat_code, ReserveOption.GENERAL_FIRST))
+
+    def reservation_number(self, reservation):
+        return reservation.rsv_id  # korail2 Reservation은 rsv_id
+
+
+PROVIDERS: dict[str, Provider] = {p.name: p for p in (SRTProvider(), KorailProvider())}
+
+
+async def fetch_window(account, train: str, dep: str, arr: str, date_str: str,
+                       window: tuple[str, str], pax: int) -> SearchResult:
+    """조회 구간 하나의 열차를 모두 가져온다. account: session.ProviderSession"""
+    result = await PROVIDERS[train].search(account, dep, arr, date_str, window, pax)
+    logger.debug(f"[{train.upper()}] {dep}→{arr} {date_str} {window[0]}~{window[1]}: 호출별 기여 열차 {result.calls}")
+    return result
@@ -0,0 +1,252 @@
+import argparse
+import asyncio
+import html
+import json
+import logging
+import os
+import re
+import signal
+import sys
+from datetime import datetime
+
+from config import (
+    SRT_ID,
+    SRT_PW,
+    KORAIL_ID,
+    KORAIL_PW,
+    DEP_STATION,
+    ARR_STATION,
+    DEP_DATE,
+    DEP_TIME,
+    DEP_TIMES,
+    SEAT_CLASS,
+    PAX,
+    REFRESH_MIN,
+    REFRESH_MAX,
+    MAX_ATTEMPTS,
+)
+from macro import (
+    ALL_TIME_CODES,
+    TIME_RANGES,
+    Reporter,
+    dates_summary,
+    new_state,
+    parse_start,
+    route_desc,
+    run,
+    standalone,
+    times_summary,
+)
+from matcher import RANKINGS, SEAT_PREDICATES
+from outbox import ALERT, INFO
+from providers import PROVIDERS
+
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO,
+)
+logger = logging.getLogger(__name__)
+
+
+# ════════════════════════════ 작업 정의 ════════════════════════════
+
+
+def _as_list(value) -> list:
+    return value if isinstance(value, list) else [value]
+
+
+def load_jobs(path: str) -> list[dict]:
+    """작업 파일(JSON, .yaml/.yml이면 YAML)을 읽는다. 최상위는 작업 목록 또는 {"jobs": [...]}"""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    if path.endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("YAML 작업 파일은 PyYAML이 필요합니다 (pip install pyyaml) — 또는 JSON으로 작성하세요")
+        try:
+            data = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise ValueError(f"YAML 형식 오류: {e}")
+    else:
+        data = json.loads(text)
+    jobs = data.get("jobs") if isinstance(data, dict) else data
+    if not isinstance(jobs, list) or not all(isinstance(job, dict) for job in jobs):
+        raise ValueError("작업 파일은 작업 목록이어야 합니다")
+    return jobs
+
+
+def job_state(spec: dict, index: int) -> dict:
+    """작업 정의 하나 → 매크로 상태. 잘못된 값은 ValueError"""
+    train = str(spec.get("train", "srt")).lower()
+    name = str(spec.get("name") or f"{train}-{index}")
+    if train not in PROVIDERS:
+        raise ValueError(f"{name}: train은 {'/'.join(PROVIDERS)} 중 하나여야 합니다")
+    for field in ("dep", "arr", "date"):
+        if not spec.get(field):
+            raise ValueError(f"{name}: {field}가 없습니다")
+
+    # YAML은 따옴표 없는 20260213·060000을 숫자로 읽는다
+    dates = sorted({str(d) for d in _as_list(spec["date"])})
+    for d in dates:
+        try:
+            datetime.strptime(d, "%Y%m%d")
+        except ValueError:
+            raise ValueError(f"{name}: 날짜는 YYYYMMDD 형식이어야 합니다 ({d})")
+    times = [str(t).zfill(6) for t in _as_list(spec.get("times") or ALL_TIME_CODES)]
+    if any(t not in TIME_RANGES for t in times):
+        raise ValueError(f"{name}: 시간대는 {', '.join(ALL_TIME_CODES)} 중에서 고르세요")
+    seat = str(spec.get("seat", "all"))
+    if seat not in SEAT_PREDICATES[train]:
+        raise ValueError(f"{name}: seat는 {'/'.join(SEAT_PREDICATES[train])} 중 하나여야 합니다")
+    start_at = None
+    if spec.get("start"):
+        start_at = parse_start(str(spec["start"]), datetime.now())
+        if start_at is None:
+            raise ValueError(f"{name}: start는 \"HH:MM\" 또는 \"HH:MM:SS\" 형식이어야 합니다")
+
+    state = new_state(name, train, "go", str(spec["dep"]), str(spec["arr"]), dates[0], times,
+                      int(spec.get("pax", 1)), seat, dates=dates if len(dates) > 1 else None, start_at=start_at)
+    state["name"] = name
+    if spec.get("trains"):
+        state["train_allow"] = [str(n) for n in _as_list(spec["trains"])]
+    if spec.get("exclude"):
+        state["train_deny"] = [str(n) for n in _as_list(spec["exclude"])]
+    if spec.get("rank"):
+        if spec["rank"] not in RANKINGS:
+            raise ValueError(f"{name}: rank는 {'/'.join(RANKINGS)} 중 하나여야 합니다")
+        state["rank"] = spec["rank"]
+    if spec.get("after"):
+        after = str(spec["after"]).zfill(6)
+        if not (after.isdigit() and len(after) == 6 and after < "240000"):
+            raise ValueError(f"{name}: after는 HHMMSS 형식이어야 합니다 ({spec['after']})")
+        state["dep_after"] = after
+    return state
+
+
+def job_account(spec: dict, train: str) -> tuple[str, str] | None:
+    """작업의 계정 — id와 password_env(비밀번호를 담은 환경변수 이름), 없으면 .env 계정"""
+    if spec.get("id"):
+        password = os.getenv(str(spec.get("password_env", "")), "")
+        return (str(spec["id"]), password) if password else None
+    account_id, password = (SRT_ID, SRT_PW) if train == "srt" else (KORAIL_ID, KORAIL_PW)
+    return (account_id, password) if account_id and password else None
+
+
+def env_job(train: str) -> dict:
+    """.env의 열차 조건(DEP_*) → 작업 정의 (srt_macro.py / ktx_macro.py)"""
+    times = [t.strip() for t in DEP_TIMES.split(",") if t.strip()]
+    job = {"name": train.upper(), "train": train, "dep": DEP_STATION, "arr": ARR_STATION,
+           "date": [d.strip() for d in (DEP_DATE or "").split(",") if d.strip()], "times": times,
+           "pax": PAX, "seat": SEAT_CLASS}
+    if not times:
+        # DEP_TIME 이후 = 그 시각이 든 시간대부터 조회하고, 시간대 안에서 DEP_TIME보다 이른 열차는 뺀다
+        hour = int(DEP_TIME[:2])
+        job["times"] = [code for code, (_, end) in TIME_RANGES.items() if end > hour]
+        job["after"] = DEP_TIME
+    return job
+
+
+# ════════════════════════════ 실행 ════════════════════════════
+
+
+class ConsoleReporter(Reporter):
+    """헤드리스 실행 알림 — 로그로 남기고, 예약 결과·실패는 notify(메시지)로도 보낸다 (텔레그램 등)"""
+
+    def __init__(self, notify=None):
+        self._notify = notify
+
+    def send(self, text, priority=INFO, parse_mode=None):
+        logger.info(re.sub(r"<[^>]+>", "", text) if parse_mode == "HTML" else text)
+        if self._notify is not None and priority <= ALERT:
+            message = text if parse_mode == "HTML" else html.escape(text)
+            # notify는 동기 HTTP 호출 — 조회 루프를 막지 않게 기본 스레드풀에서
+            asyncio.get_running_loop().run_in_executor(None, self._notify, message)
+
+    def status(self, text):
+        logger.info(text)
+
+
+async def run_jobs(jobs: list[tuple[dict, tuple[str, str]]], report: Reporter, fixed: bool = False) -> list[dict]:
+    """(매크로 상태, 계정) 목록을 한 프로세스에서 동시에 실행한다. 같은 계정의 세션·같은 조건의 조회·
+    계정별 호출 상한은 작업끼리 공유한다. 종료 신호(SIGINT/SIGTERM)를 받으면 모두 중지하고 끝낸다.
+    fixed면 CLI처럼 고정 간격으로 조회한다 (macro.standalone)."""
+    rt = standalone(fixed)
+    states = [state for state, _ in jobs]
+
+    def stop_all():
+        logger.info("종료 신호 — 매크로 중지")
+        for state in states:
+            state["running"] = False
+            rt.engine.stop(state["key"])
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_all)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    rt.sessions.start()
+    try:
+        tasks = [rt.engine.start(state["key"], run(rt, state, rt.sessions.get(state["train"], *account), report))
+                 for state, account in jobs]
+        await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        await rt.engine.shutdown()
+        await rt.sessions.stop()
+        if rt.history is not None:
+            rt.history.close()
+    return states
+
+
+def run_cli(train: str, account_id: str, password: str, notify):
+    """srt_macro.py / ktx_macro.py 공용 — .env 조건 하나를 매크로 엔진으로 실행"""
+    try:
+        state = job_state(env_job(train), 1)
+    except ValueError as e:
+        print(f"[오류] {e}")
+        sys.exit(1)
+    label = PROVIDERS[train].label
+    logger.info(f"[{label}] {route_desc(state)} | {dates_summary(state.get('dates') or [state['date']])} | "
+                f"{times_summary(set(state['time_codes']))} | {state['pax']}명 | {state['seat']}")
+    logger.info(f"[{label}] 조회 간격: {REFRESH_MIN}~{REFRESH_MAX}초 | 최대 {MAX_ATTEMPTS}회")
+    asyncio.run(run_jobs([(state, (account_id, password))], ConsoleReporter(notify), fixed=True))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="작업 파일의 매크로를 텔레그램 없이 한 프로세스에서 실행")
+    parser.add_argument("jobs", help="작업 파일 (.json / .yaml)")
+    parser.add_argument("--notify", action="store_true", help="예약 결과·실패를 텔레그램(TELEGRAM_CHAT_ID)으로도 알림")
+    args = parser.parse_args()
+
+    try:
+        jobs, names = [], set()
+        for i, spec in enumerate(load_jobs(args.jobs), 1):
+            state = job_state(spec, i)
+            if state["key"] in names:
+                raise ValueError(f"{state['key']}: 작업 이름이 겹칩니다")
+            names.add(state["key"])
+            account = job_account(spec, state["train"])
+            if account is None:
+                raise ValueError(f"{state['key']}: {state['train'].upper()} 계정이 없습니다 (.env 또는 id·password_env)")
+            jobs.append((state, account))
+    except (OSError, ValueError) as e:
+        print(f"[오류] {e}")
+        sys.exit(1)
+
+    notify = None
+    if args.notify:
+        from notify import send_telegram
+        notify = send_telegram
+
+    logger.info(f"작업 {len(jobs)}개 시작")
+    states = asyncio.run(run_jobs(jobs, ConsoleReporter(notify)))
+    for state in states:
+        result = f"예약번호 {state['booked']}" if state.get("booked") else f"예약 못 함 (#{state['attempt']})"
+        logger.info(f"[{state['name']}] {result}")
+    sys.exit(0 if all(state.get("booked") for state in states) else 1)
+
+
+if __name__ == "__main__":
+    main()
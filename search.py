@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def search_key(train: str, dep: str, arr: str, date_str: str, window, pax: int) -> tuple:
+    """공유 조회 키. 코레일은 인원 수에 따라 잔여석 판정이 달라지므로 인원을 포함한다.
+    SRT 조회는 항상 1명 기준이라 좌석등급·인원이 달라도 같은 키를 쓴다."""
+    return (train, dep, arr, date_str, window, pax if train == "ktx" else 1)
+
+
+def shared_error(exc: BaseException) -> bool:
+    """구독자끼리 나눠도 되는 조회 예외 — 조회 조건에 대한 답(결과 없음·매진)뿐.
+    로그인 실패·통신 에러는 조회를 실행한 계정의 사정이라 다른 매크로에 넘기지 않는다."""
+    name = type(exc).__name__
+    return "NoResult" in name or "SoldOut" in name
+
+
+class SearchHub:
+    """여러 매크로의 동일 조건 열차 조회를 하나로 합치는 계층.
+
+    같은 키의 조회가 진행 중이면 그 결과를 함께 기다리고, share_sec 안에 끝난
+    결과(또는 NoResult 같은 예외)는 그대로 재사용한다. 업스트림 호출 수는
+    매크로 수가 아니라 서로 다른 노선 수에 비례한다. 공유 키에는 계정이 없으므로
+    그 밖의 예외는 조회를 실행한 매크로에만 전하고, 함께 기다리던 매크로는 자기 세션으로 다시 조회한다.
+    """
+
+    def __init__(self, share_sec: float):
+        self._share_sec = share_sec
+        self._inflight: dict[tuple, tuple[asyncio.Task, float]] = {}   # 키 → (조회 태스크, 시작 시각)
+        self._latest: dict[tuple, tuple[float, list | None, BaseException | None, float]] = {}
+        self.upstream_calls = 0
+        self.shared_hits = 0
+
+    async def search(self, key: tuple, fetch, since: float | None = None):
+        """fetch: 인자 없는 업스트림 조회 코루틴 함수. 반환된 리스트는 구독자끼리 공유되므로 수정 금지.
+        since(monotonic)를 주면 그보다 먼저 시작된 조회 결과는 공유받지 않는다 (예약 시작 직후 첫 조회)."""
+        latest = self._latest.get(key)
+        if latest and time.monotonic() - latest[0] < self._share_sec and (since is None or latest[3] >= since):
+            self.shared_hits += 1
+            return self._unwrap(latest)
+
+        inflight = self._inflight.get(key)
+        if inflight is None or (since is not None and inflight[1] < since):
+            return await asyncio.shield(self._start(key, fetch))
+        self.shared_hits += 1
+        try:
+            return await asyncio.shield(inflight[0])
+        except Exception as e:
+            if shared_error(e):
+                raise
+        # 다른 계정의 조회가 실패 — 그 예외 대신 자기 세션으로 다시 (이후 구독자는 이 조회를 공유)
+        return await asyncio.shield(self._start(key, fetch))
+
+    def _start(self, key: tuple, fetch) -> asyncio.Task:
+        self.upstream_calls += 1
+        # 조회를 시작한 매크로가 중지되어도 다른 구독자는 결과를 받도록 별도 태스크로 실행
+        started = time.monotonic()
+        task = asyncio.get_running_loop().create_task(fetch())
+        self._inflight[key] = (task, started)
+        task.add_done_callback(lambda t, k=key, s=started: self._on_done(k, t, s))
+        return task
+
+    def _on_done(self, key: tuple, task: asyncio.Task, started: float):
+        if self._inflight.get(key, (None,))[0] is task:
+            del self._inflight[key]
+        if task.cancelled():
+            return
+        latest = self._latest.get(key)
+        if latest is not None and latest[3] > started:
+            return  # 더 늦게 시작한 조회가 먼저 끝남
+        now = time.monotonic()
+        exc = task.exception()
+        if exc is not None and not shared_error(exc):
+            return  # 계정에 묶인 예외는 재사용하지 않는다
+        self._latest[key] = (now, None if exc else task.result(), exc, started)
+        if len(self._latest) > 256:
+            for k in [k for k, v in self._latest.items() if now - v[0] >= self._share_sec]:
+                del self._latest[k]
+
+    @staticmethod
+    def _unwrap(entry):
+        _, trains, exc, _ = entry
+        if exc is not None:
+            raise exc
+        return trains
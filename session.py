@@ -0,0 +1,348 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from clock import measure_offset
+from governor import GOVERNED
+
+logger = logging.getLogger(__name__)
+
+
+class LoginFailed(Exception):
+    """로그인/재로그인 실패"""
+
+
+def needs_login(e: Exception) -> bool:
+    """세션 만료로 재로그인이 필요한 예외인지 판별 (SRT/코레일 공통)."""
+    name = type(e).__name__
+    if "NeedToLogin" in name or "NotLoggedIn" in name:
+        return True
+    return name == "SRTResponseError" and "로그인" in str(e)
+
+
+def login(train: str, account_id: str, password: str, pool_size: int = 10):
+    """새 클라이언트를 만들어 로그인한다 (블로킹)."""
+    if train == "srt":
+        from SRT import SRT
+        client = SRT(account_id, password)
+        _prepare_http(client, train, pool_size)
+        return client
+
+    from korail2 import Korail
+    client = Korail(account_id, password, auto_login=False)
+    # korail2는 requests 세션을 클래스 속성으로 공유하므로 계정별로 분리
+    client._session = requests.Session()
+    _prepare_http(client, train, pool_size)
+    if not client.login():
+        raise LoginFailed("코레일 로그인 실패 (ID/PW 확인)")
+    return client
+
+
+def _prepare_http(client, train: str, pool_size: int):
+    if train == "ktx":
+        from korail2.korail2 import DEFAULT_USER_AGENT
+        client._session.headers.update({"User-Agent": DEFAULT_USER_AGENT})
+    # 여러 매크로가 동시에 같은 클라이언트를 쓰므로 keep-alive 커넥션 풀을 넉넉히
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    client._session.mount("https://", adapter)
+    client._session.mount("http://", adapter)
+
+
+def warm_targets(train: str, client) -> list[tuple[requests.Session, str]]:
+    """조회 경로가 쓰는 (HTTP 세션, 주소) — 미리 요청해 두면 첫 조회에서 TLS 핸드셰이크가 빠진다.
+    첫 항목은 제공자 API 서버 (시계 오프셋 측정용)."""
+    if train == "srt":
+        from SRT.constants import API_ENDPOINTS
+        from SRT.netfunnel import NetFunnelHelper
+        return [(client._session, API_ENDPOINTS["main"]),
+                (client.netfunnel_helper.session, NetFunnelHelper.NETFUNNEL_URL)]
+    import korail2.korail2 as korail_module
+    return [(client._session, korail_module.KORAIL_SEARCH_SCHEDULE)]
+
+
+# ════════════════════════════ 세션 디스크 캐시 ════════════════════════════
+
+# 로그인 후 클라이언트에 저장되는 식별자 (쿠키와 함께 있어야 인증 요청이 가능)
+_SESSION_ATTRS = {
+    "srt": ["membership_number"],
+    "ktx": ["_key", "membership_number", "name", "email"],
+}
+
+
+def _session_path(directory: str, train: str, account_id: str) -> str:
+    # 파일명에 계정 ID(전화번호 등)가 드러나지 않도록 해시 사용
+    digest = hashlib.sha256(account_id.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(directory, f"{train}-{digest}.json")
+
+
+def _verifier(password: str, salt: bytes) -> str:
+    # 캐시를 만든 비밀번호를 아는 쪽만 복원 — 같은 ID를 등록한 다른 사용자가 남의 세션을 쓰지 못하게
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, 100_000).hex()
+
+
+def save_session(directory: str, train: str, account_id: str, password: str, client):
+    """쿠키와 세션 식별자를 0600 권한 파일로 원자적으로 저장한다."""
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    salt = os.urandom(16)
+    data = {
+        "saved_at": time.time(),
+        "salt": salt.hex(),
+        "verifier": _verifier(password, salt),
+        "cookies": [
+            {"name": c.name, "value": c.value, "domain": c.domain, "path": c.path,
+             "expires": c.expires, "secure": c.secure}
+            for c in client._session.cookies
+        ],
+        "attrs": {a: getattr(client, a, None) for a in _SESSION_ATTRS[train]},
+    }
+    path = _session_path(directory, train, account_id)
+    tmp = f"{path}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def restore_session(directory: str, train: str, account_id: str, password: str, pool_size: int = 10):
+    """저장된 세션으로 로그인 요청 없이 클라이언트를 복원한다. 없거나 깨졌거나 비밀번호가 다르면 (None, 0).
+
+    유효성은 여기서 확인하지 않는다 — 만료된 세션은 첫 인증 요청에서 재로그인된다.
+    반환: (client, saved_at)
+    """
+    path = _session_path(directory, train, account_id)
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        salt = bytes.fromhex(data["salt"])
+    except (OSError, ValueError, KeyError):
+        return None, 0.0
+    if not hmac.compare_digest(_verifier(password, salt), data.get("verifier", "")):
+        return None, 0.0
+    if train == "srt":
+        from SRT import SRT
+        client = SRT(account_id, password, auto_login=False)
+        client.is_login = True
+    else:
+        from korail2 import Korail
+        client = Korail(account_id, password, auto_login=False)
+        client._session = requests.Session()
+        client.logined = True
+    _prepare_http(client, train, pool_size)
+    for c in data.get("cookies", []):
+        client._session.cookies.set(
+            c["name"], c["value"], domain=c["domain"], path=c["path"],
+            expires=c["expires"], secure=c["secure"])
+    for attr, value in data.get("attrs", {}).items():
+        setattr(client, attr, value)
+    return client, data.get("saved_at", 0.0)
+
+
+# ════════════════════════════ 세션 풀 ════════════════════════════
+
+
+class ProviderSession:
+    """계정 하나의 인증된 클라이언트. 모든 매크로가 공유한다."""
+
+    def __init__(self, pool: "SessionPool", train: str, account_id: str, password: str):
+        self._pool = pool
+        self.train = train
+        self.account_id = account_id
+        self._password = password
+        self.client = None
+        self.generation = 0
+        self.logged_in_at = 0.0
+        self.last_used = 0.0
+        self._lock = asyncio.Lock()
+        # 계정(사용자)당 동시 업스트림 호출 수 — 한 사용자의 매크로가 공용 스레드풀을 독차지하지 않게
+        self._slots = asyncio.Semaphore(pool.max_inflight) if pool.max_inflight > 0 else None
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.logged_in_at
+
+    async def ready(self):
+        """로그인된 클라이언트를 보장한다. 오래 쉬어서 만료가 임박했으면 먼저 갱신."""
+        if self.client is None and self._pool.store_dir:
+            self._restore()
+        if self.client is None or self.age > self._pool.refresh_sec:
+            await self.relogin(self.generation)
+        return self.client
+
+    def _restore(self):
+        client, saved_at = restore_session(
+            self._pool.store_dir, self.train, self.account_id, self._password, self._pool.pool_size)
+        if client is None:
+            return
+        self.client = client
+        self.generation += 1
+        self.logged_in_at = time.monotonic() - max(0.0, time.time() - saved_at)
+        logger.info(f"[{self.train.upper()} {self.account_id[:3]}***] 저장된 세션 복원 — 로그인 생략")
+        # 유효성은 조회 경로 밖에서 확인: 만료됐으면 예약 전에 미리 재로그인
+        asyncio.get_running_loop().create_task(self._validate())
+
+    async def _validate(self):
+        generation = self.generation
+        method = "get_reservations" if self.train == "srt" else "reservations"
+        try:
+            await self._pool.engine.run_blocking(getattr(self.client, method))
+        except Exception as e:
+            if not needs_login(e):
+                logger.warning(f"[{self.train.upper()}] 복원 세션 확인 실패: {e}")
+                return
+            logger.info(f"[{self.train.upper()}] 복원 세션 만료 → 재로그인")
+            try:
+                await self.relogin(generation)
+            except Exception as le:
+                logger.warning(f"[{self.train.upper()}] 재로그인 실패: {le}")
+
+    async def relogin(self, seen_generation: int):
+        """seen_generation 이후 다른 매크로가 이미 갱신했다면 다시 로그인하지 않는다."""
+        async with self._lock:
+            if self.generation != seen_generation:
+                return
+            t0 = time.perf_counter()
+            try:
+                client = await self._pool.engine.run_blocking(
+                    login, self.train, self.account_id, self._password, self._pool.pool_size)
+            except Exception as e:
+                self._observe_login(t0, e)
+                if isinstance(e, LoginFailed):
+                    raise
+                raise LoginFailed(str(e)) from e
+            self._observe_login(t0)
+            self.client = client
+            self.generation += 1
+            self.logged_in_at = time.monotonic()
+            if self._pool.store_dir:
+                try:
+                    save_session(self._pool.store_dir, self.train, self.account_id, self._password, client)
+                except OSError as e:
+                    logger.warning(f"세션 저장 실패: {e}")
+            logger.info(f"[{self.train.upper()} {self.account_id[:3]}***] 세션 갱신 (#{self.generation})")
+
+    def _observe_login(self, t0: float, exc: Exception | None = None):
+        metrics = self._pool.metrics
+        if metrics is None:
+            return
+        metrics.observe("login", self.train, time.perf_counter() - t0)
+        if exc is not None:
+            metrics.error("login", self.train, exc)
+
+    async def warm(self, timeout: float = 5.0):
+        """조회 경로의 keep-alive 커넥션을 열어 두거나 유지한다 (응답 내용은 버림)."""
+        client = await self.ready()
+        for session, url in warm_targets(self.train, client):
+            try:
+                await self._pool.engine.run_blocking(_touch, session, url, timeout)
+            except Exception as e:
+                logger.debug(f"[{self.train.upper()}] 연결 예열 실패 {url}: {e}")
+
+    async def clock_offset(self) -> tuple[float, float]:
+        """제공자 서버 시계와의 차이 (offset, ±bound) 초 — 서버 시각 ≈ time.time() + offset"""
+        client = await self.ready()
+        session, url = warm_targets(self.train, client)[0]
+        return await self._pool.engine.run_blocking(measure_offset, session, url)
+
+    async def call(self, method: str, *args, **kwargs):
+        """클라이언트 메서드를 스레드풀에서 호출. 세션 만료 시 한 번 재로그인 후 재시도.
+        조회·예약은 계정별 호출 상한(Governor)을 거치고, 동시 호출은 계정당 max_inflight개까지."""
+        client = await self.ready()
+        generation = self.generation
+        self.last_used = time.monotonic()
+        await self._govern(method)
+        try:
+            return await self._run(self._method(client, method), *args, **kwargs)
+        except Exception as e:
+            if not needs_login(e):
+                raise
+            logger.info(f"[{self.train.upper()}] 세션 만료 → 재로그인")
+            if self._pool.metrics is not None:
+                self._pool.metrics.error("login", self.train, e)  # 세션 만료(NeedToLogin 등)로 인한 재로그인
+        await self.relogin(generation)
+        await self._govern(method)
+        return await self._run(self._method(self.client, method), *args, **kwargs)
+
+    def _method(self, client, method: str):
+        fn = getattr(client, method)
+        if self._pool.capture is not None:
+            fn = self._pool.capture.wrap(self.train, client, method, fn)
+        return fn
+
+    async def _run(self, fn, *args, **kwargs):
+        if self._slots is None:
+            return await self._pool.engine.run_blocking(fn, *args, **kwargs)
+        async with self._slots:
+            return await self._pool.engine.run_blocking(fn, *args, **kwargs)
+
+    async def _govern(self, method: str):
+        kind = GOVERNED.get(method)
+        if kind is not None and self._pool.governor is not None:
+            await self._pool.governor.acquire((self.train, self.account_id), kind)
+
+
+def _touch(session: requests.Session, url: str, timeout: float):
+    session.head(url, timeout=timeout, allow_redirects=False).close()
+
+
+class SessionPool:
+    """(열차, 계정) 별로 클라이언트를 하나만 유지하고 만료 전에 백그라운드로 갱신한다.
+
+    같은 계정 ID라도 비밀번호가 다르면 다른 세션이다 — 여러 사용자가 한 봇을 쓸 때 ID만 알고
+    남의 로그인 세션을 빌려 쓰지 못하게.
+    """
+
+    def __init__(self, engine, refresh_sec: float, pool_size: int, store_dir: str | None = None, metrics=None,
+                 governor=None, max_inflight: int = 0, capture=None):
+        self.engine = engine
+        self.capture = capture  # capture.Recorder — 조회 응답 녹화 (CAPTURE_DIR)
+        self.max_inflight = max_inflight
+        self.metrics = metrics
+        self.governor = governor
+        self.refresh_sec = refresh_sec
+        self.pool_size = pool_size
+        self.store_dir = store_dir
+        self._sessions: dict[tuple[str, str, str], ProviderSession] = {}
+        self._keeper: asyncio.Task | None = None
+
+    def get(self, train: str, account_id: str, password: str) -> ProviderSession:
+        key = (train, account_id, password)
+        sess = self._sessions.get(key)
+        if sess is None:
+            sess = ProviderSession(self, train, account_id, password)
+            self._sessions[key] = sess
+        return sess
+
+    def start(self):
+        if self._keeper is None:
+            self._keeper = asyncio.get_running_loop().create_task(self._keep_alive(), name="session-keeper")
+
+    async def stop(self):
+        if self._keeper is not None:
+            self._keeper.cancel()
+            await asyncio.gather(self._keeper, return_exceptions=True)
+            self._keeper = None
+        if self.capture is not None:
+            self.capture.close()
+
+    async def _keep_alive(self):
+        """만료 전(refresh_sec)에 최근 사용된 세션만 미리 갱신해 조회 경로에서 로그인을 없앤다."""
+        interval = min(60.0, self.refresh_sec / 10)
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for sess in list(self._sessions.values()):
+                if sess.client is None or sess.age < self.refresh_sec - interval * 2:
+                    continue
+                if now - sess.last_used > self.refresh_sec:
+                    continue  # 쉬고 있는 계정은 다음 사용 시 ready()에서 갱신
+                try:
+                    await sess.relogin(sess.generation)
+                except Exception as e:
+                    logger.warning(f"[{sess.train.upper()}] 백그라운드 세션 갱신 실패: {e}")
@@ -0,0 +1,340 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 다른 프로세스(봇·워커)가 쓰기 잠금을 쥐고 있을 때 기다리는 시간 (sqlite3 기본 5초 대신 명시)
+BUSY_TIMEOUT_SEC = 10.0
+# 진행 기록이 잠금에 걸렸을 때 다시 쓰기까지
+_PROGRESS_RETRY_SEC = 1.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS macros (
+    key         TEXT PRIMARY KEY,
+    chat_id     INTEGER NOT NULL,
+    spec        TEXT NOT NULL,
+    status      TEXT NOT NULL,
+    attempt     INTEGER NOT NULL DEFAULT 0,
+    last_search REAL,
+    updated_at  REAL NOT NULL,
+    worker      TEXT,
+    lease       REAL
+);
+CREATE INDEX IF NOT EXISTS macros_status ON macros (status);
+CREATE TABLE IF NOT EXISTS payments (
+    res_num     TEXT PRIMARY KEY,
+    chat_id     INTEGER NOT NULL,
+    key         TEXT NOT NULL,
+    train       TEXT NOT NULL,
+    info        TEXT NOT NULL,
+    deadline    REAL NOT NULL,
+    status      TEXT NOT NULL,
+    updated_at  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id     INTEGER,
+    key         TEXT NOT NULL,
+    kind        TEXT NOT NULL,
+    data        TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS workers (
+    id          TEXT PRIMARY KEY,
+    seen        REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tenants (
+    chat_id     INTEGER PRIMARY KEY,
+    sealed      BLOB,
+    max_macros  INTEGER,
+    updated_at  REAL NOT NULL
+);
+"""
+
+
+class MacroStore:
+    """매크로 정의와 진행 상태를 SQLite(WAL)에 보관해 봇이 죽어도 이어서 실행한다.
+
+    진행 기록은 시도마다 한 행 UPDATE만 하며, WAL + synchronous=NORMAL이라
+    커밋마다 fsync하지 않는다 (전원 장애 시 마지막 몇 건만 유실될 수 있음).
+
+    매크로 워커 프로세스(worker.py)를 쓰면 macros 테이블이 곧 작업 큐다 — 워커가 행을
+    임대(worker, lease)해 실행하고, 텔레그램 메시지 등 봇에 돌려줄 일은 events에 쌓는다.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        self._pending: dict[str, tuple[int, float, float]] = {}  # 키 → 아직 못 쓴 진행 기록
+        self._pending_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._writer: threading.Thread | None = None
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        """첫 사용 때 연다 — bot을 import만 하는 도구(워커·벤치마크)가 DB 파일을 만들지 않게"""
+        if self._conn is None:
+            with self._open_lock:
+                if self._conn is None:
+                    self._conn = self._connect()
+        return self._conn
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self._path, timeout=BUSY_TIMEOUT_SEC, isolation_level=None, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(_SCHEMA)
+        columns = {row[1] for row in db.execute("PRAGMA table_info(macros)")}
+        for column, kind in (("worker", "TEXT"), ("lease", "REAL")):
+            if column in columns:
+                continue
+            try:  # 워커 임대 열이 없던 DB — 봇과 워커가 동시에 열면 한쪽이 먼저 추가한다
+                db.execute(f"ALTER TABLE macros ADD COLUMN {column} {kind}")
+            except sqlite3.OperationalError as e:
+                if "duplicate column" not in str(e):
+                    raise
+        return db
+
+    def save(self, chat_id: int, state: dict):
+        """새 매크로 등록 (같은 key는 덮어씀)"""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO macros (key, chat_id, spec, status, attempt, last_search, updated_at)"
+                " VALUES (?, ?, ?, 'running', ?, NULL, ?)",
+                (state["key"], chat_id, json.dumps(state, ensure_ascii=False), state.get("attempt", 0), time.time()),
+            )
+
+    def progress(self, key: str, attempt: int, last_search: float):
+        """진행 기록 — 호출자(이벤트 루프)를 막지 않는다. 전용 스레드가 키마다 마지막 값만 모아
+        한 트랜잭션으로 쓰고, DB가 잠겨 있으면 예외 대신 다음 차례로 미룬다 (최선 노력)."""
+        with self._pending_lock:
+            self._pending[key] = (attempt, last_search, time.time())
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_progress, name="store-progress", daemon=True)
+                self._writer.start()
+        self._wake.set()
+
+    def _write_progress(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            if not self._flush_progress():
+                time.sleep(_PROGRESS_RETRY_SEC)
+                self._wake.set()
+
+    def _flush_progress(self) -> bool:
+        with self._pending_lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return True
+        try:
+            with self._lock:
+                self._db.execute("BEGIN")
+                try:
+                    self._db.executemany(
+                        "UPDATE macros SET attempt = ?, last_search = ?, updated_at = ? WHERE key = ?",
+                        [(attempt, last_search, at, key) for key, (attempt, last_search, at) in batch.items()],
+                    )
+                    self._db.execute("COMMIT")
+                except BaseException:
+                    self._db.execute("ROLLBACK")
+                    raise
+            return True
+        except sqlite3.Error as e:
+            logger.warning(f"진행 기록 보류 ({len(batch)}건): {e}")
+            with self._pending_lock:
+                for key, value in batch.items():
+                    self._pending.setdefault(key, value)  # 그 사이 들어온 더 새 값이 우선
+            return False
+
+    def finish(self, key: str):
+        """정상 종료(예매 성공/중지/횟수 소진) — 재시작 시 재개하지 않음"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE macros SET status = 'done', updated_at = ? WHERE key = ?", (time.time(), key))
+
+    def unfinished(self) -> list[tuple[int, dict]]:
+        """재개할 매크로 목록: [(chat_id, state), ...]"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT chat_id, spec, attempt, last_search FROM macros WHERE status = 'running'").fetchall()
+        result = []
+        for chat_id, spec, attempt, last_search in rows:
+            state = json.loads(spec)
+            state["running"] = True
+            state["attempt"] = attempt
+            state["last_search"] = last_search
+            result.append((chat_id, state))
+        return result
+
+    def attempts(self, keys: list[str]) -> dict[str, int]:
+        """매크로별 시도 횟수 (다른 프로세스가 실행 중인 매크로의 진행 상황)"""
+        if not keys:
+            return {}
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT key, attempt FROM macros WHERE key IN ({','.join('?' * len(keys))})", keys).fetchall()
+        return dict(rows)
+
+    # ── 워커 임대 ──
+
+    def claim(self, worker: str, limit: int, lease_sec: float) -> list[tuple[int, dict]]:
+        """임대가 없거나 끝난 매크로를 limit개까지 가져간다. [(chat_id, state), ...]
+
+        한 사용자(채팅)의 매크로는 한 워커에만 준다 — 계정별 호출 상한·조회 예산·조회 공유가
+        프로세스 안에서 이뤄지므로 같은 계정을 여러 워커가 나눠 돌리면 상한이 워커 수만큼 늘어난다.
+        새 사용자의 매크로는 살아 있는 워커 수로 나눈 몫까지만 가져가 워커끼리 고르게 나눈다.
+        """
+        now = time.time()
+        live = "status IN ('running', 'stopping') AND lease >= ?"
+        free = "status = 'running' AND (lease IS NULL OR lease < ?)"
+        columns = "key, chat_id, spec, attempt, last_search"
+        self.heartbeat(worker)
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                # 중지 요청 후 실행하던 워커가 죽은 매크로는 그대로 끝낸다
+                self._db.execute(
+                    "UPDATE macros SET status = 'done', updated_at = ?"
+                    " WHERE status = 'stopping' AND (lease IS NULL OR lease < ?)", (now, now))
+                # 이미 맡은 사용자의 나머지 매크로
+                rows = self._db.execute(
+                    f"SELECT {columns} FROM macros WHERE {free} AND chat_id IN ("
+                    f" SELECT chat_id FROM macros WHERE {live} AND worker = ?) LIMIT ?",
+                    (now, now, worker, limit)).fetchall()
+                workers = self._db.execute(
+                    "SELECT COUNT(*) FROM workers WHERE seen >= ?", (now - lease_sec,)).fetchone()[0]
+                total = self._db.execute("SELECT COUNT(*) FROM macros WHERE status = 'running'").fetchone()[0]
+                mine = self._db.execute(
+                    f"SELECT COUNT(*) FROM macros WHERE {live} AND worker = ?", (now, worker)).fetchone()[0]
+                share = min(limit - len(rows), -(-total // max(1, workers)) - mine - len(rows))
+                if share > 0:
+                    rows += self._db.execute(
+                        f"SELECT {columns} FROM macros WHERE {free} AND chat_id NOT IN ("
+                        f" SELECT chat_id FROM macros WHERE {live}) ORDER BY updated_at LIMIT ?",
+                        (now, now, share)).fetchall()
+                self._db.executemany(
+                    "UPDATE macros SET worker = ?, lease = ? WHERE key = ?",
+                    [(worker, now + lease_sec, row[0]) for row in rows])
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        result = []
+        for _, chat_id, spec, attempt, last_search in rows:
+            state = json.loads(spec)
+            state.update(running=True, attempt=attempt, last_search=last_search)
+            result.append((chat_id, state))
+        return result
+
+    def heartbeat(self, worker: str):
+        """워커 생존 신호 (claim이 몫을 나눌 워커 수)"""
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO workers (id, seen) VALUES (?, ?)", (worker, time.time()))
+
+    def renew(self, worker: str, keys: list[str], lease_sec: float) -> tuple[list[str], list[str]]:
+        """실행 중인 매크로의 임대 연장. 반환: (중지 요청된 키, 임대를 잃은 키)"""
+        if not keys:
+            return [], []
+        marks = ",".join("?" * len(keys))
+        with self._lock:
+            self._db.execute(
+                f"UPDATE macros SET lease = ? WHERE worker = ? AND key IN ({marks})",
+                (time.time() + lease_sec, worker, *keys))
+            rows = self._db.execute(
+                f"SELECT key, status, worker FROM macros WHERE key IN ({marks})", keys).fetchall()
+        stopping = [k for k, status, owner in rows if status == "stopping" and owner == worker]
+        lost = [k for k, status, owner in rows if owner != worker]
+        return stopping, lost
+
+    def release(self, worker: str):
+        """워커 종료 — 끝나지 않은 매크로를 다른 워커가 바로 가져가게 임대를 푼다"""
+        with self._lock:
+            self._db.execute("UPDATE macros SET worker = NULL, lease = NULL WHERE worker = ?", (worker,))
+            self._db.execute("DELETE FROM workers WHERE id = ?", (worker,))
+
+    def request_stop(self, key: str):
+        """다른 프로세스에서 실행 중인 매크로 중지 요청 (워커가 임대 연장 때 확인)"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE macros SET status = 'stopping', updated_at = ? WHERE key = ? AND status = 'running'",
+                (time.time(), key))
+
+    # ── 워커 → 봇 이벤트 ──
+
+    def push_event(self, chat_id: int | None, key: str, kind: str, data: dict):
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO events (chat_id, key, kind, data) VALUES (?, ?, ?, ?)",
+                (chat_id, key, kind, json.dumps(data, ensure_ascii=False)))
+
+    def events(self, after: int, limit: int = 500) -> list[tuple[int, int | None, str, str, dict]]:
+        """[(id, chat_id, key, kind, data), ...] — 처리한 뒤 drop_events(마지막 id)"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, chat_id, key, kind, data FROM events WHERE id > ? ORDER BY id LIMIT ?",
+                (after, limit)).fetchall()
+        return [(i, c, k, kind, json.loads(d)) for i, c, k, kind, d in rows]
+
+    def drop_events(self, upto: int):
+        with self._lock:
+            self._db.execute("DELETE FROM events WHERE id <= ?", (upto,))
+
+    # ── 결제 대기 (예약 이후 파이프라인) ──
+
+    def save_payment(self, chat_id: int, key: str, train: str, res_num: str, info: dict, deadline: float):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO payments (res_num, chat_id, key, train, info, deadline, status, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, 'pending', ?)",
+                (res_num, chat_id, key, train, json.dumps(info, ensure_ascii=False), deadline, time.time()),
+            )
+
+    def finish_payment(self, res_num: str, status: str):
+        """paid / failed / expired / gone — 재시작 시 다시 처리하지 않음"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE payments SET status = ?, updated_at = ? WHERE res_num = ?", (status, time.time(), res_num))
+
+    def pending_payments(self, res_num: str | None = None) -> list[dict]:
+        with self._lock:
+            if res_num is None:
+                rows = self._db.execute(
+                    "SELECT res_num, chat_id, key, train, info, deadline FROM payments"
+                    " WHERE status = 'pending'").fetchall()
+            else:
+                rows = self._db.execute(
+                    "SELECT res_num, chat_id, key, train, info, deadline FROM payments"
+                    " WHERE status = 'pending' AND res_num = ?", (res_num,)).fetchall()
+        return [
+            {"res_num": r, "chat_id": c, "key": k, "train": t, "info": json.loads(i), "deadline": d}
+            for r, c, k, t, i, d in rows
+        ]
+
+    # ── 사용자 (계정 정보는 tenants.Tenants가 암호화해서 넘긴다) ──
+
+    def save_tenant(self, chat_id: int, sealed: bytes | None, max_macros: int | None):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO tenants (chat_id, sealed, max_macros, updated_at) VALUES (?, ?, ?, ?)",
+                (chat_id, sealed, max_macros, time.time()),
+            )
+
+    def delete_tenant(self, chat_id: int):
+        with self._lock:
+            self._db.execute("DELETE FROM tenants WHERE chat_id = ?", (chat_id,))
+
+    def tenants(self) -> list[tuple[int, bytes | None, int | None]]:
+        with self._lock:
+            return self._db.execute("SELECT chat_id, sealed, max_macros FROM tenants").fetchall()
+
+    def close(self):
+        self._flush_progress()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
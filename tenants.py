@@ -0,0 +1,147 @@
+import base64
+import json
+import logging
+import os
+from functools import cached_property
+
+from Crypto.Cipher import AES
+
+logger = logging.getLogger(__name__)
+
+_NONCE = 12
+_TAG = 16
+
+
+def load_key(value: str, path: str) -> bytes:
+    """계정 암호화 키 (AES-256). value(base64)가 있으면 그걸, 없으면 path 파일을 읽거나 새로 만든다."""
+    if value:
+        key = base64.urlsafe_b64decode(value)
+        if len(key) != 32:
+            raise ValueError("TENANT_KEY는 32바이트 base64여야 합니다")
+        return key
+    try:
+        with open(path, "rb") as f:
+            return base64.urlsafe_b64decode(f.read().strip())
+    except FileNotFoundError:
+        pass
+    key = os.urandom(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(base64.urlsafe_b64encode(key))
+    logger.info(f"계정 암호화 키 생성: {path}")
+    return key
+
+
+class _Tenant:
+    __slots__ = ("sealed", "max_macros")
+
+    def __init__(self, sealed: bytes | None, max_macros: int | None):
+        self.sealed = sealed            # 암호화된 {열차: [ID, 비밀번호]}
+        self.max_macros = max_macros    # None이면 기본 한도
+
+
+class Tenants:
+    """채팅별 사용자(테넌트)와 그 사용자의 열차 계정.
+
+    계정 정보는 AES-GCM으로 암호화해 MacroStore에 두고, 쓸 때만 복호화한다. 채팅 ID를
+    AAD로 묶어 암호문을 다른 사용자 행으로 옮겨도 열리지 않는다. 목록은 메모리에 올려 두어
+    업데이트마다 하는 권한 확인이 dict 조회 한 번이다.
+    """
+
+    def __init__(self, store, load_key, default_limit: int):
+        """load_key: 암호화 키를 돌려주는 함수. 키와 사용자 목록은 처음 쓸 때 읽는다 (import만으로
+        키 파일·DB가 생기지 않게)."""
+        self._store = store
+        self._load_key = load_key
+        self._default_limit = default_limit
+
+    @cached_property
+    def _key(self) -> bytes:
+        return self._load_key()
+
+    @cached_property
+    def _tenants(self) -> dict[int, _Tenant]:
+        return self._read()
+
+    def reload(self):
+        """저장소에서 다시 읽는다 (봇 프로세스가 바꾼 사용자·계정을 매크로 워커가 받아 올 때)"""
+        self._tenants = self._read()
+
+    def _read(self) -> dict[int, _Tenant]:
+        return {chat_id: _Tenant(sealed, limit) for chat_id, sealed, limit in self._store.tenants()}
+
+    def __len__(self) -> int:
+        return len(self._tenants)
+
+    def __contains__(self, chat_id: int) -> bool:
+        return chat_id in self._tenants
+
+    def add(self, chat_id: int, max_macros: int | None = None):
+        """사용자 등록 (이미 있으면 한도만 바꾼다)"""
+        tenant = self._tenants.get(chat_id)
+        if tenant is None:
+            tenant = self._tenants[chat_id] = _Tenant(None, None)
+        tenant.max_macros = max_macros
+        self._save(chat_id, tenant)
+
+    def remove(self, chat_id: int) -> bool:
+        if self._tenants.pop(chat_id, None) is None:
+            return False
+        self._store.delete_tenant(chat_id)
+        return True
+
+    def limit(self, chat_id: int) -> int:
+        """동시에 실행할 수 있는 매크로 수 (0이면 제한 없음)"""
+        tenant = self._tenants.get(chat_id)
+        if tenant is None or tenant.max_macros is None:
+            return self._default_limit
+        return tenant.max_macros
+
+    # ── 계정 ──
+
+    def account(self, chat_id: int, train: str) -> tuple[str, str] | None:
+        pair = self._accounts(chat_id).get(train)
+        return (pair[0], pair[1]) if pair else None
+
+    def account_ids(self, chat_id: int) -> dict[str, str]:
+        """열차 → 계정 ID (표시용)"""
+        return {train: pair[0] for train, pair in self._accounts(chat_id).items()}
+
+    def set_account(self, chat_id: int, train: str, account_id: str | None, password: str | None = None):
+        """계정 저장 (account_id가 None이면 삭제). 처음 보는 채팅이면 사용자로 등록된다."""
+        accounts = self._accounts(chat_id)
+        if account_id is None:
+            accounts.pop(train, None)
+        else:
+            accounts[train] = [account_id, password]
+        tenant = self._tenants.get(chat_id)
+        if tenant is None:
+            tenant = self._tenants[chat_id] = _Tenant(None, None)
+        tenant.sealed = self._seal(chat_id, accounts) if accounts else None
+        self._save(chat_id, tenant)
+
+    def _accounts(self, chat_id: int) -> dict[str, list[str]]:
+        tenant = self._tenants.get(chat_id)
+        if tenant is None or tenant.sealed is None:
+            return {}
+        try:
+            return self._open(chat_id, tenant.sealed)
+        except ValueError:
+            logger.error(f"[{chat_id}] 계정 정보 복호화 실패 (키가 바뀌었거나 손상됨)")
+            return {}
+
+    def _save(self, chat_id: int, tenant: _Tenant):
+        self._store.save_tenant(chat_id, tenant.sealed, tenant.max_macros)
+
+    # ── 암호화: nonce(12) + tag(16) + 암호문 ──
+
+    def _seal(self, chat_id: int, accounts: dict) -> bytes:
+        cipher = AES.new(self._key, AES.MODE_GCM, nonce=os.urandom(_NONCE))
+        cipher.update(str(chat_id).encode())
+        body, tag = cipher.encrypt_and_digest(json.dumps(accounts).encode())
+        return cipher.nonce + tag + body
+
+    def _open(self, chat_id: int, sealed: bytes) -> dict:
+        cipher = AES.new(self._key, AES.MODE_GCM, nonce=sealed[:_NONCE])
+        cipher.update(str(chat_id).encode())
+        return json.loads(cipher.decrypt_and_verify(sealed[_NONCE + _TAG:], sealed[_NONCE:_NONCE + _TAG]))
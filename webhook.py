@@ -0,0 +1,133 @@
+import asyncio
+import hmac
+import json
+import logging
+import signal
+import ssl
+from urllib.parse import urlsplit
+
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+# 한 요청 본문 상한 — 텔레그램 업데이트는 수 KB
+_MAX_BODY = 1 << 20
+
+
+class WebhookServer:
+    """텔레그램 웹훅을 받는 내장 HTTP(S) 리스너. 외부 의존성 없이 asyncio 서버로.
+
+    POST 본문을 Update로 바꿔 Application.update_queue에 넣고 바로 200을 돌려준다 — 처리는
+    폴링 때와 같은 핸들러가 맡는다. X-Telegram-Bot-Api-Secret-Token이 secret과 다르면 403.
+    텔레그램은 커넥션을 재사용하므로 keep-alive로 받는다 (업데이트마다 TLS 핸드셰이크 없음).
+    cert/key를 주면 리스너가 직접 TLS를 끝내고, 비우면 앞단 리버스 프록시가 HTTPS를 맡는다.
+    """
+
+    def __init__(self, application, host: str, port: int, path: str, secret: str,
+                 cert: str | None = None, key: str | None = None):
+        self._app = application
+        self._host = host
+        self._port = port
+        self._path = path.encode()
+        self._secret = secret.encode()
+        self._ssl = None
+        if cert:
+            self._ssl = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            self._ssl.load_cert_chain(cert, key or None)
+        self._server: asyncio.AbstractServer | None = None
+        self.received = 0
+        self.rejected = 0
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self._host, self._port, ssl=self._ssl)
+        scheme = "https" if self._ssl else "http"
+        logger.info(f"웹훅 리스너: {scheme}://{self._host}:{self._port}{self._path.decode()}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await asyncio.wait_for(reader.readline(), 75)
+                if not request:
+                    break
+                headers = {}
+                while True:
+                    line = await asyncio.wait_for(reader.readline(), 10)
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.partition(b":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get(b"content-length", 0))
+                if length > _MAX_BODY:
+                    await self._reply(writer, "413 Payload Too Large", close=True)
+                    break
+                body = await asyncio.wait_for(reader.readexactly(length), 10) if length else b""
+                close = headers.get(b"connection", b"").lower() == b"close"
+                await self._reply(writer, self._dispatch(request, headers, body), close)
+                if close:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def _dispatch(self, request: bytes, headers: dict, body: bytes) -> str:
+        parts = request.split()
+        if len(parts) < 2 or parts[0] != b"POST" or parts[1].split(b"?")[0] != self._path:
+            return "404 Not Found"
+        if not hmac.compare_digest(headers.get(b"x-telegram-bot-api-secret-token", b""), self._secret):
+            self.rejected += 1
+            return "403 Forbidden"
+        try:
+            update = Update.de_json(json.loads(body), self._app.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"웹훅 본문 해석 실패: {e}")
+            return "400 Bad Request"
+        self._app.update_queue.put_nowait(update)
+        self.received += 1
+        return "200 OK"
+
+    @staticmethod
+    async def _reply(writer: asyncio.StreamWriter, status: str, close: bool = False):
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Length: 0\r\n"
+                     f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n".encode())
+        await writer.drain()
+
+
+async def run_webhook(application, url: str, host: str, port: int, secret: str, allowed_updates: list[str],
+                      cert: str | None = None, key: str | None = None):
+    """Application.run_polling 대신: 초기화 → post_init → 리스너·setWebhook → 종료 신호까지 대기 → 정리"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows — Ctrl+C는 KeyboardInterrupt로 태스크가 취소된다
+
+    server = WebhookServer(application, host, port, urlsplit(url).path or "/", secret, cert, key)
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await server.start()
+        certificate = None
+        if cert:
+            with open(cert, "rb") as f:
+                certificate = f.read()  # 자체 서명 인증서면 텔레그램이 이걸로 검증
+        await application.bot.set_webhook(url, certificate=certificate, secret_token=secret,
+                                          allowed_updates=allowed_updates)
+        await application.start()
+        await stop.wait()
+    finally:
+        await server.stop()
+        if application.running:
+            await application.stop()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+        await application.shutdown()
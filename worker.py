@@ -0,0 +1,234 @@
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+import sqlite3
+import sys
+import time
+
+from outbox import INFO
+from payment import payment_deadline
+
+logger = logging.getLogger(__name__)
+
+# 워커가 새 매크로를 가져가고 임대를 연장하는 주기(초)
+_CLAIM_SEC = 0.5
+# 봇이 events를 읽는 주기(초) — 예약 결과 알림에 더해지는 최대 지연
+_POLL_SEC = 0.1
+# 죽은 워커를 다시 띄우기 전 대기(초)
+_RESTART_SEC = 2.0
+
+
+def worker_id(pid: int | None = None) -> str:
+    return f"{socket.gethostname()}:{pid or os.getpid()}"
+
+
+# ════════════════════════════ 워커 프로세스 ════════════════════════════
+
+
+class RemoteOutbox:
+    """워커용 Outbox 대역 — 메시지를 events에 넣으면 봇 프로세스의 발송 큐가 보낸다"""
+
+    def __init__(self, store):
+        self._store = store
+
+    def send(self, chat_id: int, text: str, priority: int = INFO, parse_mode=None, reply_markup=None):
+        self._store.push_event(chat_id, "", "send", {
+            "text": text, "priority": priority, "parse_mode": parse_mode,
+            "reply_markup": reply_markup.to_dict() if reply_markup is not None else None})
+
+    def status(self, chat_id: int, key: str, text: str, reply_markup=None):
+        # 버튼은 키로 봇이 다시 만든다 (control_kb)
+        self._store.push_event(chat_id, key, "status", {"text": text})
+
+    def end_status(self, key: str):
+        self._store.push_event(None, key, "end", {})
+
+
+class RemotePayments:
+    """워커용 PaymentPipeline 대역 — 결제 대기를 저장하고 봇 프로세스가 이어받게 알린다"""
+
+    def __init__(self, store, deadline_sec: float):
+        self._store = store
+        self._deadline_sec = deadline_sec
+
+    def submit(self, chat_id: int, key: str, train: str, reservation, info: dict):
+        res_num = reservation.reservation_number
+        self._store.save_payment(chat_id, key, train, res_num, info,
+                                 payment_deadline(reservation, self._deadline_sec))
+        self._store.push_event(chat_id, key, "payment", {"res_num": res_num})
+
+
+async def serve(capacity: int, lease_sec: float, parent: int | None = None):
+    """MacroStore에서 매크로를 임대해 실행한다. 종료 신호(또는 부모 봇 종료) 때 임대를 풀고 끝낸다."""
+    from config import MACRO_DB, PAY_DEADLINE_SEC
+    from store import MacroStore
+
+    me = worker_id()
+    # 봇 모듈을 읽는 동안 먼저 뜬 워커가 매크로를 다 가져가지 않도록 생존 신호부터
+    early = MacroStore(MACRO_DB)
+    early.heartbeat(me)
+    early.close()
+
+    import bot  # 봇과 같은 설정·전역 객체 (엔진·세션 풀·호출 상한·조회 공유)
+
+    bot.coordinator = None
+    bot.outbox = RemoteOutbox(bot.store)
+    bot.payments = RemotePayments(bot.store, PAY_DEADLINE_SEC)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    bot.sessions.start()
+    logger.info(f"매크로 워커 시작: {me} (최대 {capacity}개)")
+    try:
+        while not stop.is_set():
+            running = bot.engine.active_keys()
+            stopping, lost = bot.store.renew(me, running, lease_sec)
+            for key in lost:
+                # 임대가 끝나 다른 워커가 가져감 (이 프로세스가 오래 멈췄던 경우) — 끝내지 않고 손만 뗀다
+                logger.warning(f"임대 잃음: {key}")
+                bot.engine.cancel(key)
+            for key in stopping:
+                bot.stop_macro(key)
+            free = capacity - len(running)
+            jobs = bot.store.claim(me, free, lease_sec) if free > 0 else []
+            if jobs:
+                bot.tenants.reload()
+            for chat_id, state in jobs:
+                state.setdefault("chat_id", chat_id)
+                bot.macros[state["key"]] = state
+                bot.engine.start(state["key"], bot.run_macro(chat_id, state))
+            if parent is not None and os.getppid() != parent:
+                logger.warning("봇 프로세스 종료 — 워커 종료")
+                break
+            try:
+                await asyncio.wait_for(stop.wait(), _CLAIM_SEC)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        await bot.engine.shutdown()
+        bot.store.release(me)
+        await bot.sessions.stop()
+        if bot.history is not None:
+            bot.history.close()
+        logger.info(f"매크로 워커 종료: {me}")
+
+
+# ════════════════════════════ 봇 쪽 조정자 ════════════════════════════
+
+
+class Coordinator:
+    """매크로를 워커 프로세스에 나눠 돌릴 때(MACRO_PROCS > 0) 봇 프로세스 쪽 조정자.
+
+    봇은 매크로를 MacroStore의 macros 테이블에 넣기만 하고, 워커 procs개를 띄워 지킨다(죽으면
+    다시 띄움). 워커는 행을 임대해 bot.run_macro를 그대로 실행하고(각자 이벤트 루프·스레드풀·세션),
+    텔레그램 메시지·결제 대기는 events 테이블로 돌려준다 — 이걸 handle(chat_id, key, kind, data)로
+    넘긴다. 워커가 죽으면 그 워커의 매크로만 잠깐 멈췄다가 다른 워커가 이어서 실행한다.
+    처리한 이벤트는 지우고, 봇이 재시작하면 지우지 못한 이벤트부터 다시 처리한다.
+    """
+
+    def __init__(self, store, procs: int, capacity: int, lease_sec: float, handle):
+        self._store = store
+        self._procs = procs
+        self._capacity = capacity
+        self._lease_sec = lease_sec
+        self._handle = handle
+        self._children: dict[int, asyncio.subprocess.Process] = {}
+        self._tasks: list[asyncio.Task] = []
+        self._closing = False
+        self.restarts = 0
+
+    def alive(self) -> int:
+        return sum(1 for p in self._children.values() if p.returncode is None)
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._supervise(i), name=f"worker-{i}") for i in range(self._procs)]
+        self._tasks.append(loop.create_task(self._pump(), name="worker-events"))
+
+    async def stop(self):
+        self._closing = True
+        for proc in self._children.values():
+            if proc.returncode is None:
+                proc.terminate()  # 워커가 실행 중인 매크로 태스크를 정리하고 임대를 푼다
+        for proc in list(self._children.values()):
+            try:
+                await asyncio.wait_for(proc.wait(), 15)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self._drain()  # 워커가 마지막으로 남긴 메시지까지
+
+    async def _supervise(self, slot: int):
+        script = os.path.abspath(__file__)
+        while not self._closing:
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable, script, "--capacity", str(self._capacity), "--lease", str(self._lease_sec),
+                "--parent", str(os.getpid()), cwd=os.getcwd())
+            self._children[slot] = proc
+            started = time.monotonic()
+            code = await proc.wait()
+            if self._closing:
+                break
+            # 죽은 워커의 매크로는 임대가 끝나길 기다리지 않고 바로 다른 워커에 넘긴다
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self._store.release, worker_id(proc.pid))
+            except sqlite3.OperationalError as e:
+                logger.warning(f"워커 {slot} 임대 해제 실패 — 임대가 끝나면 넘어간다: {e}")
+            self.restarts += 1
+            logger.warning(f"매크로 워커 {slot} 종료 (코드 {code}) — 다시 시작")
+            if time.monotonic() - started < _RESTART_SEC:
+                await asyncio.sleep(_RESTART_SEC)
+
+    async def _pump(self):
+        while True:
+            try:
+                await self._drain()
+            except Exception:
+                logger.exception("워커 이벤트 처리 실패")
+            await asyncio.sleep(_POLL_SEC)
+
+    async def _drain(self):
+        """워커 이벤트 처리. DB 읽기·지우기는 스레드풀에서 — 워커가 DB를 잠그고 있어도 봇이 멈추지 않게"""
+        loop = asyncio.get_running_loop()
+        last = 0
+        while True:
+            rows = await loop.run_in_executor(None, self._store.events, last)
+            if not rows:
+                break
+            for event_id, chat_id, key, kind, data in rows:
+                last = event_id
+                try:
+                    self._handle(chat_id, key, kind, data)
+                except Exception:
+                    logger.exception(f"워커 이벤트 처리 실패: {kind} {key}")
+            await loop.run_in_executor(None, self._store.drop_events, last)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="매크로 워커 프로세스")
+    parser.add_argument("--capacity", type=int, default=None, help="동시에 실행할 매크로 수")
+    parser.add_argument("--lease", type=float, default=None, help="매크로 임대 시간(초)")
+    parser.add_argument("--parent", type=int, default=None, help="이 프로세스가 사라지면 종료 (봇이 띄울 때)")
+    args = parser.parse_args()
+
+    from config import WORKER_LEASE_SEC, WORKER_MACROS
+    try:
+        asyncio.run(serve(args.capacity or WORKER_MACROS, args.lease or WORKER_LEASE_SEC, args.parent))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()